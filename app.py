@@ -1,8 +1,12 @@
 import streamlit as st
-from modules.wiki_fetcher import fetch_topic_summary, fetch_wikibooks_links, fetch_wikidata_facts, fetch_wikiversity_resources
-from modules.ai_engine import mentor_chat_response, generate_flashcards
+from modules.pipeline import learn_topic_stream
+from modules.ai_engine import mentor_chat_stream
+from modules import decks, health, metrics, session_store, topics
 
 st.set_page_config(page_title="WikiMentor", page_icon="📚", layout="wide")
+metrics.start_server() # Prometheus /metrics, /healthz and /ready on METRICS_PORT, if set (once per process)
+health.start_warm_up() # Load the core modules in the background (once per process)
+health.mark_serving()
 
 # Theme Styles
 mode = st.sidebar.radio("🌗 Theme Mode", ["Light", "Dark"], index=0)
@@ -49,62 +53,100 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Session states
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "flashcards" not in st.session_state:
-    st.session_state.flashcards = []
+# The session id sits in the URL, so a reload or server restart restores chat and flashcards
+if "session" not in st.query_params:
+    st.query_params["session"] = session_store.new_session_id()
+if "conversation" not in st.session_state:
+    st.session_state.conversation, st.session_state.flashcards = session_store.load_session(st.query_params["session"])
+
+
+def save_session():
+    session_store.save_session(st.query_params["session"], st.session_state.conversation, st.session_state.flashcards)
 
 # Sidebar Navigation
 menu = st.sidebar.selectbox("📌 Navigate", ["🏫 Learn a Topic", "💬 Mentor Chat", "🗂️ Flashcard Review"])
 
 if menu == "🏫 Learn a Topic":
     st.subheader("📘 Learn a New Topic")
-    topic = st.text_input("🔍 Enter a topic to learn:")
-
-    if topic:
-        with st.spinner("📚 Fetching summary from Wikipedia..."):
-            summary = fetch_topic_summary(topic)
-
-        if summary:
-            st.success("Summary fetched successfully!")
-            st.markdown("### 📖 Topic Summary")
-            st.info(summary)
+    topic = st.text_input("🔍 Enter a topic to learn:", key="topic_input")
 
-            st.markdown("### 🔗 Additional Learning Resources")
-
-            with st.spinner("📚 Fetching Wikibooks links..."):
-                books = fetch_wikibooks_links(topic)
-                if books:
-                    for title, url in books:
-                        st.markdown(f"- 📘 [{title}]({url})")
-                else:
-                    st.write("No related books found.")
-
-            with st.spinner("🔬 Fetching Wikidata facts..."):
-                facts = fetch_wikidata_facts(topic)
-                if facts:
-                    for fact in facts:
-                        st.markdown(f"- 🧠 {fact}")
-                else:
-                    st.write("No structured facts found.")
+    def pick_topic(title):
+        st.session_state.topic_input = title
 
-            with st.spinner("🎓 Fetching Wikiversity resources..."):
-                resources = fetch_wikiversity_resources(topic)
-                if resources:
-                    for title, link in resources:
-                        st.markdown(f"- 🎓 [{title}]({link})")
-                else:
-                    st.write("No learning resources found.")
-
-            with st.spinner("🗂️ Creating flashcards..."):
-                flashcards = generate_flashcards(summary)
+    resolution = topics.resolve(topic) if topic else None
+    if resolution and resolution["status"] != "ok":
+        # Ambiguous or unknown topics cost one lookup; the learner picks what they meant
+        if resolution["status"] == "disambiguation":
+            st.warning(f"🔀 **{resolution['title']}** can mean several things. Pick the one you mean:")
+        else:
+            st.error("Couldn't find that topic. Try again with a simpler keyword."
+                     + (" Did you mean one of these?" if resolution["options"] else ""))
+        for option in resolution["options"]:
+            st.button(option, key=f"topic_option_{option}", on_click=pick_topic, args=(option,))
+
+    elif resolution:
+        title = resolution["title"]
+        # Cards the learner already has for this topic are reused, never regenerated
+        known_cards = decks.topic_cards(st.query_params["session"], title)
+
+        # One placeholder per section, filled in as soon as its source answers
+        summary_slot = st.empty()
+        summary_slot.info("⏳ Fetching the summary...")
+        st.markdown("### 🔗 Additional Learning Resources")
+        slots = {"books": st.empty(), "facts": st.empty(), "resources": st.empty()}
+        slots["books"].caption("⏳ Looking for Wikibooks links...")
+        slots["facts"].caption("⏳ Looking up Wikidata facts...")
+        slots["resources"].caption("⏳ Looking for Wikiversity resources...")
+        flashcard_slot = st.empty()
+        if known_cards:
+            st.session_state.flashcards = [{"question": c["question"], "answer": c["answer"]} for c in known_cards]
+            flashcard_slot.success(f"✅ You already have {len(known_cards)} flashcards for this topic in your review deck.")
+        else:
+            flashcard_slot.caption("⏳ Writing flashcards...")
+
+        for section, result in learn_topic_stream(topic, flashcards=not known_cards, resolution=resolution):
+            if section == "summary":
+                summary = result["summary"]
+                if not summary:
+                    for slot in [flashcard_slot] + list(slots.values()):
+                        slot.empty()
+                    if section in result["timed_out"]:
+                        summary_slot.error("⌛ Wikipedia is slow to answer right now. Please try again in a moment.")
+                    else:
+                        summary_slot.error("Couldn't find that topic. Try again with a simpler keyword.")
+                    break
+                with summary_slot.container():
+                    st.markdown(f"### 📖 {title}")
+                    st.info(summary)
+                st.session_state.conversation.set_topic(title, summary)  # Mentor Chat follow-ups use this topic
+                save_session()
+
+            elif section in result["timed_out"]:
+                # The fetch keeps going in the background, so the next visit has it
+                slots.get(section, flashcard_slot).caption("⌛ This source is slow right now; it will be ready next time you open this topic.")
+
+            elif section == "books":
+                books = result["books"]
+                slots["books"].markdown("\n".join(f"- 📘 [{name}]({url})" for name, url in books) if books
+                                        else "No related books found.")
+            elif section == "facts":
+                facts = result["facts"]
+                slots["facts"].markdown("\n".join(f"- 🧠 {fact}" for fact in facts) if facts
+                                        else "No structured facts found.")
+            elif section == "resources":
+                resources = result["resources"]
+                slots["resources"].markdown("\n".join(f"- 🎓 [{name}]({link})" for name, link in resources) if resources
+                                            else "No learning resources found.")
+
+            elif section == "flashcards":
+                flashcards = result["flashcards"]
                 if flashcards:
                     st.session_state.flashcards = flashcards
-                    st.success("✅ Flashcards generated! Check the Flashcard Review tab.")
+                    decks.add_cards(st.query_params["session"], title, flashcards)  # Scheduled for review right away
+                    flashcard_slot.success("✅ Flashcards generated! Check the Flashcard Review tab.")
                 else:
-                    st.warning("⚠️ No flashcards were generated. Try a different topic.")
-        else:
-            st.error("Couldn't find that topic. Try again with a simpler keyword.")
+                    flashcard_slot.warning("⚠️ No flashcards were generated. Try a different topic.")
+                save_session()
 
 elif menu == "💬 Mentor Chat":
     st.subheader("💬 Ask Your AI Mentor")
@@ -113,14 +155,14 @@ elif menu == "💬 Mentor Chat":
     user_query = st.text_input("Type your question:")
 
     if st.button("🧠 Get Answer") and user_query:
-        with st.spinner("Thinking like a mentor..."):
-            reply = mentor_chat_response(user_query)
-        st.session_state.chat_history.append((user_query, reply))
+        # Render tokens as they arrive; the conversation stores the finished turn
+        st.write_stream(mentor_chat_stream(user_query, st.session_state.conversation))
+        save_session()
 
-    if st.session_state.chat_history:
+    if st.session_state.conversation.turns:
         st.markdown("---")
         st.markdown("### 📝 Previous Mentor Answers")
-        for q, a in reversed(st.session_state.chat_history):
+        for q, a in reversed(st.session_state.conversation.turns):
             with st.expander(f"❓ {q}"):
                 st.markdown(f"✅ {a}")
 
@@ -128,13 +170,25 @@ elif menu == "🗂️ Flashcard Review":
     st.subheader("🗂️ Flashcard Review Mode")
     st.markdown("Use these flashcards to revise and reinforce your memory.")
 
-    if st.session_state.flashcards:
-        for idx, fc in enumerate(st.session_state.flashcards):
-            st.markdown(f"""
-            <div class='flashcard'>
-                <strong>Q{idx+1}: {fc['question']}</strong><br><br>
-                <details><summary>Show Answer</summary><p>{fc['answer']}</p></details>
-            </div>
-            """, unsafe_allow_html=True)
-    else:
+    # Only the next due card is loaded; grading reschedules it (SM-2) and shows the next one
+    counts = decks.stats(st.query_params["session"])
+    card = decks.next_due(st.query_params["session"])
+    if not counts["total"]:
         st.info("Flashcards will appear here after learning a topic.")
+    elif card is None:
+        st.success("🎉 All caught up! Come back when your next card is due.")
+    else:
+        st.markdown(f"**{counts['due']}** due now · **{counts['total']}** cards in your deck")
+        st.markdown(f"""
+        <div class='flashcard'>
+            <strong>{card['question']}</strong>
+        </div>
+        """, unsafe_allow_html=True)
+        with st.expander("👀 Show Answer"):
+            st.markdown(card["answer"])
+        columns = st.columns(4)
+        for column, (grade, label) in zip(columns, [("again", "🔁 Again"), ("hard", "😓 Hard"),
+                                                     ("good", "🙂 Good"), ("easy", "😎 Easy")]):
+            if column.button(label, key=f"grade-{grade}"):
+                decks.review(st.query_params["session"], card["card_id"], grade)
+                st.rerun()
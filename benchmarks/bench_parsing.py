@@ -0,0 +1,82 @@
+"""
+Microbenchmarks for the CPU-bound pieces of a request: flashcard parsing,
+cache key normalization, the local search index and article chunk retrieval. No network is used;
+the LLM call inside generate_flashcards is replaced by a recorded reply.
+
+    python -m benchmarks.bench_parsing [--number 2000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import timeit
+
+from benchmarks.stub_upstreams import FIXTURES_PATH
+
+
+def _report(name, fn, number, repeat=5):
+    best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+    print(f"{name:<40} {best * 1e6:>10.1f} µs/op {1 / best:>12.0f} ops/s")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for parsing and indexing hot paths.")
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing run")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="wikimentor-bench-")
+    os.environ["WIKIMENTOR_CACHE"] = "off"
+    os.environ["WIKIMENTOR_SEARCH_DB"] = os.path.join(tmp, "search.sqlite3")
+
+    from modules import ai_engine, cache, retrieval, search_index
+    from benchmarks.stub_upstreams import article_text
+
+    with open(FIXTURES_PATH, encoding="utf-8") as f:
+        fixtures = json.load(f)
+    json_reply = json.dumps(fixtures["groq_flashcards"])
+    fenced_reply = f"```json\n{json_reply}\n```"
+    qa_reply = "\n".join(f"Q: {c['question']}\nA: {c['answer']}" for c in fixtures["groq_flashcards"]["flashcards"])
+    summary = fixtures["wikipedia_summary"]["photosynthesis"]["extract"]
+
+    print(f"{'benchmark':<40} {'time':>16} {'throughput':>16}")
+    _report("parse_flashcards (json)", lambda: ai_engine.parse_flashcards(json_reply), args.number)
+    _report("parse_flashcards (fenced json)", lambda: ai_engine.parse_flashcards(fenced_reply), args.number)
+    _report("parse_flashcards (invalid -> problem)", lambda: ai_engine.parse_flashcards(qa_reply), args.number)
+    _report("_parse_qa_text (legacy Q:/A:)", lambda: ai_engine._parse_qa_text(qa_reply), args.number)
+
+    # generate_flashcards end to end, with the recorded reply standing in for Groq
+    original_call_groq = ai_engine.call_groq
+    ai_engine.call_groq = lambda prompt, **kwargs: json_reply
+    try:
+        elapsed = min(timeit.repeat(lambda: ai_engine.generate_flashcards(summary), number=args.number // 4 or 1, repeat=5))
+        per_op = elapsed / (args.number // 4 or 1)
+        print(f"{'generate_flashcards (recorded reply)':<40} {per_op * 1e6:>10.1f} µs/op {1 / per_op:>12.0f} ops/s")
+    finally:
+        ai_engine.call_groq = original_call_groq
+
+    _report("cache.normalize_key (title)", lambda: cache.normalize_key("Python_(programming_language) "), args.number * 5)
+    _report("cache.normalize_key (summary)", lambda: cache.normalize_key(summary), args.number)
+
+    docs = []
+    for source in ("wikibooks", "wikiversity"):
+        for topic, hits in fixtures[f"{source}_search"].items():
+            docs += [(source, hit["title"], search_index.clean_snippet(hit["snippet"])) for hit in hits]
+        docs += [(source, f"Course {n} on subject {n % 97}", f"notes about subject {n % 97} and topic {n % 13}")
+                 for n in range(5000)]
+    search_index.add_documents(docs)
+    _report("search_index.tokenize", lambda: search_index.tokenize(summary), args.number)
+    _report("search_index.search (5k docs/source)", lambda: search_index.search("photosynthesis light"), args.number // 10 or 1)
+    _report("search_index.search (common term)", lambda: search_index.search("subject 42", 10), args.number // 20 or 1)
+
+    page = fixtures["wikipedia_summary"]["photosynthesis"]
+    article = article_text(page) * 10  # about the length of a long Wikipedia article
+    _report("retrieval.split_chunks (long article)", lambda: retrieval.split_chunks(article), args.number // 100 or 1)
+    _report("retrieval.ChunkIndex (long article)",
+            lambda: retrieval.ChunkIndex(retrieval.split_chunks(article)), args.number // 100 or 1)
+    index = retrieval.index_for(page["title"], article)
+    _report("ChunkIndex.search (top 3)", lambda: index.search("research on the mechanism", 3), args.number)
+
+
+if __name__ == "__main__":
+    main()
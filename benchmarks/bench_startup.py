@@ -0,0 +1,125 @@
+"""
+Cold-start benchmark: how long a fresh replica takes to import the core
+modules, to answer /healthz and to report /ready.
+
+Every measurement runs in a new interpreter, so nothing is shared between runs.
+The core modules are also checked for framework imports (gradio, streamlit)
+and for eager loading of NumPy, requests or python-dotenv.
+
+    python -m benchmarks.bench_startup [--runs 5] [--skip-server] [--max-ready 10]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE_MODULES = ("modules.pipeline", "modules.ai_engine", "modules.wiki_fetcher", "modules.cache")
+# Loaded on first use, never by importing a core module
+LAZY_DEPENDENCIES = ("gradio", "streamlit", "numpy", "requests", "dotenv")
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_import(module, env):
+    out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(module=module, lazy=LAZY_DEPENDENCIES)],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def time_server(env, timeout):
+    """(seconds to /healthz, seconds to /ready) for one cold gradio_app.py start."""
+    admin_port, ui_port = _free_port(), _free_port()
+    env = dict(env, METRICS_PORT=str(admin_port), GRADIO_SERVER_PORT=str(ui_port), GRADIO_ANALYTICS_ENABLED="False")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "gradio_app.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + timeout
+        live = _wait_for(f"http://127.0.0.1:{admin_port}/healthz", deadline)
+        live_at = time.perf_counter() - start
+        ready = live and _wait_for(f"http://127.0.0.1:{admin_port}/ready", deadline)
+        ready_at = time.perf_counter() - start
+        return (live_at if live else None), (ready_at if ready else None)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def _summary(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return "timed out"
+    return f"median {statistics.median(values) * 1000:8.1f} ms   min {min(values) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import, liveness and readiness times.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-server", action="store_true", help="only time the module imports")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for /ready per run")
+    parser.add_argument("--max-ready", type=float, help="fail if the median time to /ready exceeds this many seconds")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="wikimentor-startup-")
+    env = dict(os.environ,
+               WIKIMENTOR_CACHE_PATH=os.path.join(tmp, "cache.sqlite3"),
+               WIKIMENTOR_SESSION_STORE_PATH=os.path.join(tmp, "sessions.sqlite3"),
+               WIKIMENTOR_DECK_DB=os.path.join(tmp, "decks.sqlite3"),
+               WIKIMENTOR_TITLES_DB=os.path.join(tmp, "titles.sqlite3"),
+               SEMANTIC_CACHE_PATH=os.path.join(tmp, "semantic.npz"))
+
+    failed = False
+    print(f"{'import':<28}")
+    for module in CORE_MODULES:
+        results = [time_import(module, env) for _ in range(args.runs)]
+        eager = sorted({name for r in results for name in r["loaded"]})
+        print(f"  {module:<26} {_summary([r['seconds'] for r in results])}"
+              + (f"   ⚠️ eagerly imports {', '.join(eager)}" if eager else ""))
+        failed |= bool(eager)
+
+    if not args.skip_server:
+        runs = [time_server(env, args.timeout) for _ in range(args.runs)]
+        print("gradio_app.py")
+        print(f"  {'time to /healthz':<26} {_summary([live for live, _ in runs])}")
+        print(f"  {'time to /ready':<26} {_summary([ready for _, ready in runs])}")
+        ready_times = [ready for _, ready in runs if ready is not None]
+        if args.max_ready and (not ready_times or statistics.median(ready_times) > args.max_ready):
+            print(f"❌ median time to /ready is over {args.max_ready}s")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Concurrent load driver for the Gradio handlers against the stub upstreams.
+
+Runs learn_topic_action, mentor_chat_action and flashcard_review_display
+from a thread pool, then reports p50/p95/p99 latency (plus the time until
+the learn tab shows its summary), requests per second and how many calls
+reached each upstream. Everything runs offline.
+
+    python -m benchmarks.load_test --concurrency 16 --requests 400 --latency groq=0.6
+    python -m benchmarks.load_test --max-p95 learn_summary=0.5,learn=2.0 --json bench_output.json   # regression gate
+    python -m benchmarks.load_test --latency groq=5 --errors groq=0.3   # one degraded LLM provider
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import stub_upstreams
+from modules.conversation import Conversation
+
+ACTIONS = ("learn", "chat", "review")
+REPORTED = ("learn_summary",) + ACTIONS  # learn_summary: perceived latency of a learn request
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    # nearest-rank percentile
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def _parse_pairs(spec, cast=float):
+    pairs = {}
+    for part in filter(None, (spec or "").split(",")):
+        name, _, value = part.partition("=")
+        pairs[name.strip()] = cast(value)
+    return pairs
+
+
+def _configure_environment(base_url, cache_mode, tmp):
+    os.environ.update(stub_upstreams.upstream_env(base_url))
+    os.environ["WIKI_BACKEND"] = "live"
+    os.environ["WIKIMENTOR_OFFLINE_DB"] = os.path.join(tmp, "offline.sqlite3")
+    os.environ["WIKIMENTOR_SEARCH_DB"] = os.path.join(tmp, "search.sqlite3")
+    os.environ["WIKIMENTOR_CACHE_PATH"] = os.path.join(tmp, "cache.sqlite3")
+    os.environ["WIKIMENTOR_DECK_DB"] = os.path.join(tmp, "decks.sqlite3")
+    os.environ["WIKIMENTOR_TITLES_DB"] = os.path.join(tmp, "titles.sqlite3")
+    os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(tmp, "semantic_cache.npz")
+    os.environ["WIKIMENTOR_CACHE"] = "off" if cache_mode == "off" else "on"
+    os.environ["SEMANTIC_CACHE"] = "off" if cache_mode == "off" else "on"
+    # The stub has no rate limit; only throttle if the caller asks for it
+    os.environ.setdefault("LLM_RATE_PER_MINUTE", "0")
+
+
+def _run_action(app, action, topic, question):
+    """Runs one action; returns [(name, seconds)] samples."""
+    start = time.perf_counter()
+    samples = []
+    if action == "learn":
+        for outputs in app.learn_topic_action(topic):
+            if not samples and "⏳" not in outputs[0]:
+                samples.append(("learn_summary", time.perf_counter() - start))
+    elif action == "chat":
+        for _ in app.mentor_chat_action(question, Conversation()):
+            pass
+    else:
+        user = f"load-test-{topic}"
+        app.decks.add_cards(user, topic, [{"question": f"Q{i} about {topic}", "answer": "A"} for i in range(5)])
+        _, _, _, card_id = app.flashcard_review_display(user)
+        app.grade_card(user, card_id, "good")
+    return samples + [(action, time.perf_counter() - start)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Gradio handlers against local stub upstreams.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--mix", default="learn=0.5,chat=0.4,review=0.1", help="relative weight per action")
+    parser.add_argument("--topics", help="file with one topic per line (default: recorded + synthetic topics)")
+    parser.add_argument("--unique-topics", type=int, default=50, help="synthetic topics to add to the pool")
+    parser.add_argument("--latency", default="", help="stub latency per upstream, e.g. wikidata=0.3,groq=0.8")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--errors", default="", help="fraction of LLM calls that fail per provider, e.g. groq=0.3")
+    parser.add_argument("--cache", choices=("off", "cold"), default="off",
+                        help="off: every request reaches the stubs; cold: start from empty response and semantic caches")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--max-p95", default="", help="fail if an action's p95 exceeds this, e.g. learn_summary=0.5,learn=1.5,chat=1.0")
+    args = parser.parse_args()
+
+    server, base_url = stub_upstreams.start(latency=stub_upstreams.parse_latency(args.latency), jitter=args.jitter,
+                                            errors=stub_upstreams.parse_latency(args.errors))
+    tmp = tempfile.mkdtemp(prefix="wikimentor-load-")
+    _configure_environment(base_url, args.cache, tmp)
+
+    import gradio_app as app  # imported late so module-level config picks up the stub URLs
+
+    if args.topics:
+        with open(args.topics, encoding="utf-8") as f:
+            topics = [line.strip() for line in f if line.strip()]
+    else:
+        topics = [page["title"] for page in server.state.fixtures["wikipedia_summary"].values()]
+        topics += [f"Synthetic topic {n}" for n in range(args.unique_topics)]
+
+    mix = _parse_pairs(args.mix)
+    rng = random.Random(args.seed)
+    plan = [(rng.choices(list(mix), weights=list(mix.values()))[0], rng.choice(topics)) for _ in range(args.requests)]
+
+    urllib.request.urlopen(urllib.request.Request(f"{base_url}/__reset", data=b"{}", method="POST")).read()
+    latencies = defaultdict(list)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(_run_action, app, action, topic, f"What is {topic}?") for action, topic in plan]
+        for future in futures:
+            for name, elapsed in future.result():
+                latencies[name].append(elapsed)
+    wall = time.perf_counter() - start
+    upstream_calls = json.loads(urllib.request.urlopen(f"{base_url}/__stats").read())
+
+    results = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(args.requests / wall, 2),
+        "upstream_calls": upstream_calls,
+        "actions": {},
+    }
+    print(f"\n📊 {args.requests} requests, concurrency {args.concurrency}, {wall:.2f}s, "
+          f"{results['requests_per_second']} req/s")
+    print(f"{'action':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action in REPORTED:
+        values = latencies.get(action)
+        if not values:
+            continue
+        stats = {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+                 "p99": percentile(values, 99), "max": max(values)}
+        results["actions"][action] = {k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()}
+        print(f"{action:<14} {stats['count']:>6} {stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} "
+              f"{stats['p99'] * 1000:>9.1f} {stats['max'] * 1000:>9.1f}")
+    print("🌐 upstream calls: " + ", ".join(f"{k}={v}" for k, v in sorted(upstream_calls.items())))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    for action, limit in _parse_pairs(args.max_p95).items():
+        p95 = results["actions"].get(action, {}).get("p95")
+        if p95 is not None and p95 > limit:
+            failures.append(f"{action} p95 {p95:.3f}s > {limit:.3f}s")
+    server.shutdown()
+    if failures:
+        print("❌ " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
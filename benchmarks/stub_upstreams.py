@@ -0,0 +1,343 @@
+"""
+Local stand-ins for Wikipedia, Wikidata, Wikibooks, Wikiversity, Groq and a
+local OpenAI-compatible LLM server.
+
+Replays the recorded responses in benchmarks/fixtures/upstreams.json with a
+configurable per-upstream latency and error rate, and counts every call so
+benchmarks can report upstream traffic. Topics that were not recorded get a synthetic but
+well-formed response, so load tests can use any topic list.
+
+    python -m benchmarks.stub_upstreams --port 8765 --latency wikipedia=0.12,wikidata=0.2,groq=0.8
+    python -m benchmarks.stub_upstreams --latency groq=5 --errors groq=0.3   # a degraded LLM provider
+
+Then point the app at it with the variables printed on startup.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "upstreams.json")
+UPSTREAMS = ("wikipedia", "wikidata", "wikibooks", "wikiversity", "groq", "local")
+LLM_UPSTREAMS = ("groq", "local")
+ARTICLE_SECTIONS = ("History", "Mechanism", "Applications", "Research", "See also", "References")
+DEFAULT_LATENCY = {"wikipedia": 0.08, "wikidata": 0.12, "wikibooks": 0.1, "wikiversity": 0.1, "groq": 0.5,
+                   "local": 0.8}
+TOKEN_DELAY = 0.004  # seconds between streamed tokens
+
+
+def _key(title):
+    return " ".join(unquote(title).replace("_", " ").split()).casefold()
+
+
+def _fake_id(prefix, text):
+    return prefix + str(int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16) % 10_000_000)
+
+
+class StubState:
+    def __init__(self, fixtures, latency, jitter, errors=None):
+        self.fixtures = fixtures
+        self.latency = dict(DEFAULT_LATENCY, **latency)
+        self.jitter = jitter
+        self.errors = dict(errors or {})  # upstream -> fraction of LLM calls answered with a 503
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, upstream):
+        with self.lock:
+            self.calls[upstream] += 1
+
+    def sleep(self, upstream):
+        delay = self.latency.get(upstream, 0)
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def fails(self, upstream):
+        return random.random() < self.errors.get(upstream, 0)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing pooled keep-alive sockets is normal here, not an error
+        pass
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real upstreams
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        upstream = url.path.strip("/").split("/")[0]
+
+        if url.path == "/__stats":
+            return self._send_json(self.state.stats())
+        if upstream not in UPSTREAMS:
+            return self._send_json({"error": "unknown upstream"}, 404)
+
+        self.state.record(upstream)
+        self.state.sleep(upstream)
+        if upstream == "wikipedia":
+            if url.path.endswith("api.php"):
+                return self._wikipedia_api(query)
+            return self._summary(url.path.rsplit("/", 1)[-1])
+        if upstream == "wikidata":
+            return self._wikidata(query)
+        return self._search(upstream, query)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if url.path == "/__reset":
+            self.state.reset()
+            return self._send_json({"ok": True})
+        upstream = url.path.strip("/").split("/")[0]
+        if upstream not in LLM_UPSTREAMS:
+            return self._send_json({"error": "unknown upstream"}, 404)
+        self.state.record(upstream)
+        self.state.sleep(upstream)
+        if self.state.fails(upstream):
+            return self._send_json({"error": {"message": "Service unavailable", "type": "overloaded"}}, 503)
+        return self._chat(payload)
+
+    # 📘 Wikipedia REST summary
+    def _summary(self, title):
+        return self._send_json(self._page(title))
+
+    def _page(self, title):
+        fixtures = self.state.fixtures
+        key = _key(title)
+        key = fixtures["redirects"].get(key, key)
+        page = fixtures["wikipedia_summary"].get(key)
+        if page is None:
+            display = unquote(title).replace("_", " ").strip()
+            page = {
+                "type": "standard",
+                "title": display,
+                "titles": {"canonical": display.replace(" ", "_"), "normalized": display, "display": display},
+                "wikibase_item": _fake_id("Q", key),
+                "extract": f"{display} is a topic studied in many courses. " * 6
+            }
+        return page
+
+    # 📄 Wikipedia action API: full plain-text articles and title search
+    def _wikipedia_api(self, query):
+        if query.get("list") == "search":
+            # Like the real search, a recorded article whose title appears in the query wins
+            search = _key(query.get("srsearch", ""))
+            title = next((key for key in self.state.fixtures["wikipedia_summary"] if key in search), search)
+            page = self._page(title)
+            return self._send_json({"query": {"search": [{"ns": 0, "title": page["title"]}]}})
+        if query.get("prop") == "pageprops":
+            return self._send_json({"query": self._resolve(query.get("titles", "").split("|"))})
+        if query.get("prop") == "links":
+            options = self.state.fixtures["disambiguation"].get(_key(query.get("titles", "")), [])
+            return self._send_json({"query": {"pages": [{"title": query.get("titles"),
+                                                         "links": [{"ns": 0, "title": t} for t in options]}]}})
+        page = self._page(query.get("titles", "").replace(" ", "_"))
+        return self._send_json({"query": {"pages": [{"title": page["title"], "extract": article_text(page)}]}})
+
+    def _resolve(self, titles):
+        """Title resolution: one redirect hop, Wikidata id and disambiguation flag per title."""
+        fixtures = self.state.fixtures
+        redirects, pages = [], []
+        for title in titles:
+            key = _key(title)
+            if key in fixtures["missing"]:
+                pages.append({"ns": 0, "title": title, "missing": True})
+                continue
+            page = self._page(title.replace(" ", "_"))
+            if page["title"] != title:
+                redirects.append({"from": title, "to": page["title"]})
+            props = {"wikibase_item": page["wikibase_item"]}
+            if key in fixtures["disambiguation"]:
+                props["disambiguation"] = ""
+            pages.append({"pageid": int(_fake_id("", key)), "ns": 0, "title": page["title"], "pageprops": props})
+        return {"redirects": redirects, "pages": pages}
+
+    # 🧠 Wikidata action API
+    def _wikidata(self, query):
+        fixtures = self.state.fixtures
+        action = query.get("action")
+        if action == "wbsearchentities":
+            key = _key(query.get("search", ""))
+            qid = fixtures["wikidata_search"].get(key) or _fake_id("Q", key)
+            return self._send_json({"search": [{"id": qid, "label": query.get("search", "")}]})
+        if action == "wbgetentities":
+            ids = [i for i in query.get("ids", "").split("|") if i]
+            entities = {}
+            for eid in ids:
+                if query.get("props") == "labels":
+                    label = fixtures["wikidata_labels"].get(eid, f"label of {eid}")
+                    entities[eid] = {"id": eid, "labels": {"en": {"language": "en", "value": label}}}
+                else:
+                    claims = fixtures["wikidata_claims"].get(eid, {"P31": "Q151885", "P279": _fake_id("Q", eid)})
+                    entities[eid] = {"id": eid, "claims": {
+                        prop: [{"mainsnak": {"datavalue": {"value": {"id": value}, "type": "wikibase-entityid"}}}]
+                        for prop, value in claims.items()
+                    }}
+            return self._send_json({"entities": entities})
+        return self._send_json({"error": {"code": "badvalue"}}, 400)
+
+    # 📚🎓 Wikibooks / Wikiversity action API
+    def _search(self, upstream, query):
+        if query.get("list") == "search":
+            key = _key(query.get("srsearch", ""))
+            results = self.state.fixtures[f"{upstream}_search"].get(key)
+            if results is None:
+                results = [{"title": f"{query.get('srsearch', '').strip().title()} ({upstream} {n})",
+                            "snippet": f"Course material about <span class=\"searchmatch\">{key}</span>"}
+                           for n in range(1, 4)]
+            limit = int(query.get("srlimit", 10))
+            return self._send_json({"query": {"search": results[:limit]}})
+        # recentchanges refreshes see a quiet wiki
+        return self._send_json({"batchcomplete": True, "query": {"pages": []}})
+
+    # 🤖 Groq and the local LLM server (OpenAI-compatible chat completions)
+    def _chat(self, payload):
+        fixtures = self.state.fixtures
+        if payload.get("response_format", {}).get("type") == "json_object":
+            sources = re.findall(r"^### Source (\d+)$", payload["messages"][-1]["content"], re.MULTILINE)
+            if sources:
+                # A packed bulk prompt: one deck per source
+                deck = fixtures["groq_flashcards"]["flashcards"]
+                text = json.dumps({"decks": [{"source": int(n), "flashcards": deck} for n in sources]})
+            else:
+                text = json.dumps(fixtures["groq_flashcards"])
+        else:
+            text = fixtures["groq_chat_reply"]
+        prompt_tokens = sum(len(m.get("content", "")) for m in payload.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                 "total_tokens": prompt_tokens + len(text) // 4}
+
+        if not payload.get("stream"):
+            return self._send_json({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = text.split(" ")
+        for n, word in enumerate(words):
+            chunk = {"choices": [{"index": 0, "delta": {"content": word if n == 0 else " " + word}}]}
+            if n == len(words) - 1:
+                chunk["x_groq"] = {"usage": usage}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(TOKEN_DELAY)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def article_text(page):
+    """A long stand-in article: the summary as lead, then generated sections."""
+    title = page["title"]
+    lines = [page["extract"]]
+    for heading in ARTICLE_SECTIONS:
+        lines.append(f"\n== {heading} ==")
+        for n in range(1, 4):
+            lines.append(" ".join(f"{title} {heading.lower()} note {n}.{i}: a detail about the {heading.lower()} "
+                                  f"of {title.lower()}." for i in range(8)))
+    return "\n".join(lines)
+
+
+def start(port=0, latency=None, jitter=0.0, fixtures_path=FIXTURES_PATH, errors=None):
+    """Starts the stub in a daemon thread and returns (server, base_url)."""
+    with open(fixtures_path, encoding="utf-8") as f:
+        fixtures = json.load(f)
+    server = StubServer(("127.0.0.1", port), StubHandler)
+    server.state = StubState(fixtures, latency or {}, jitter, errors)
+    threading.Thread(target=server.serve_forever, name="stub-upstreams", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def upstream_env(base_url):
+    """Environment variables that point the app's fetchers and LLM client at the stub."""
+    return {
+        "WIKIPEDIA_REST_URL": f"{base_url}/wikipedia/api/rest_v1",
+        "WIKIPEDIA_API_URL": f"{base_url}/wikipedia/w/api.php",
+        "WIKIDATA_API_URL": f"{base_url}/wikidata/w/api.php",
+        "WIKIBOOKS_API_URL": f"{base_url}/wikibooks/w/api.php",
+        "WIKIVERSITY_API_URL": f"{base_url}/wikiversity/w/api.php",
+        "GROQ_URL": f"{base_url}/groq/openai/v1/chat/completions",
+        "GROQ_API_KEY": "stub",
+        "LOCAL_LLM_URL": f"{base_url}/local/v1/chat/completions",
+    }
+
+
+def parse_latency(spec):
+    """'wikipedia=0.1,groq=0.8' -> {'wikipedia': 0.1, 'groq': 0.8} (also used for --errors rates)"""
+    latency = {}
+    for part in filter(None, (spec or "").split(",")):
+        name, _, value = part.partition("=")
+        if name.strip() not in UPSTREAMS:
+            raise ValueError(f"unknown upstream {name!r}; expected one of {', '.join(UPSTREAMS)}")
+        latency[name.strip()] = float(value)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded Wikimedia/Groq responses locally.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="", help="per-upstream seconds, e.g. wikipedia=0.1,groq=0.8")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative latency jitter, e.g. 0.2 for ±20%%")
+    parser.add_argument("--errors", default="", help="fraction of LLM calls that fail with a 503, e.g. groq=0.3")
+    args = parser.parse_args()
+
+    server, base_url = start(args.port, parse_latency(args.latency), args.jitter, errors=parse_latency(args.errors))
+    print(f"🧪 Stub upstreams on {base_url}")
+    for name, value in upstream_env(base_url).items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Generates study material (summary, resources, facts and flashcards) for many
+topics at once, e.g. a whole syllabus, and streams it out as JSON Lines: one
+object per topic, written as soon as that topic is done.
+
+Examples:
+    python bulk_generate.py --topics syllabus.txt --output syllabus.jsonl
+    cat syllabus.txt | python bulk_generate.py --topics - > syllabus.jsonl
+    python bulk_generate.py --topics syllabus.txt --no-flashcards --concurrency 16
+
+Topics files have one topic per line; blank lines and lines starting with "#"
+are ignored. Compared with one interactive run per topic, Wikidata lookups are
+batched, repeated topics run once and several topics share each flashcard prompt.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from modules import bulk, cache, http_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate WikiMentor study material for many topics as JSONL.")
+    parser.add_argument("--topics", action="append", default=[], help='file with one topic per line, "-" for stdin (repeatable)')
+    parser.add_argument("--output", help="JSONL file to write (default: stdout)")
+    parser.add_argument("--no-flashcards", action="store_true", help="only fetch summaries, resources and facts")
+    parser.add_argument("--concurrency", type=int, default=bulk.BULK_CONCURRENCY, help="upstream requests at once")
+    parser.add_argument("--window", type=int, default=bulk.BULK_WINDOW, help="topics fetched together")
+    parser.add_argument("--pack-size", type=int, default=bulk.PACK_SIZE, help="topics per flashcard prompt")
+    parser.add_argument("--pack-tokens", type=int, default=bulk.PACK_TOKENS, help="source tokens per flashcard prompt")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="requests per second per upstream host (0 for no limit)")
+    parser.add_argument("--host-rate", default="",
+                        help="per-host overrides, e.g. www.wikidata.org=2,en.wikipedia.org=10")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own log output")
+    args = parser.parse_args()
+
+    topics = []
+    for path in args.topics:
+        topics += bulk.parse_topics(sys.stdin) if path == "-" else bulk.read_topics(path)
+    if not topics:
+        parser.error("no topics given; use --topics")
+    unique = bulk.dedupe(topics)
+
+    if args.rate_limit:
+        http_client.set_rate_limit("*", args.rate_limit)
+    for host, rate in http_client.parse_rate_limits(args.host_rate).items():
+        http_client.set_rate_limit(host, rate)
+
+    print(f"📦 Generating {len(unique)} topics ({len(topics) - len(unique)} duplicates dropped)", file=sys.stderr)
+    # Keep a handle on the real stdout: results may go there while the pipeline's prints are hidden
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    start = time.perf_counter()
+    counts = Counter()
+    try:
+        with contextlib.ExitStack() as quiet:
+            if not args.verbose:
+                quiet.enter_context(contextlib.redirect_stdout(quiet.enter_context(open(os.devnull, "w"))))
+            results = bulk.generate(unique, flashcards=not args.no_flashcards, concurrency=args.concurrency,
+                                    window=args.window, pack_size=args.pack_size, pack_tokens=args.pack_tokens)
+            for n, result in enumerate(results, 1):
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+                counts[result["status"]] += 1
+                icon = "✅" if result["status"] == "ok" else "⚠️"
+                print(f"[{n}/{len(unique)}] {icon} {result['topic']}: {len(result['flashcards'])} cards",
+                      file=sys.stderr)
+    except KeyboardInterrupt:
+        print("⏸️ Interrupted; finished topics are already written.", file=sys.stderr)
+        raise SystemExit(130)
+    finally:
+        if args.output:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    rate = (counts["ok"] + counts["failed"]) / elapsed * 60 if elapsed else 0
+    print(f"🏁 {counts['ok']} done, {counts['failed']} failed in {elapsed:.1f}s ({rate:.0f} topics/min)",
+          file=sys.stderr)
+    cache.evict()
+
+
+if __name__ == "__main__":
+    main()
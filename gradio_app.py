@@ -1,9 +1,27 @@
+from modules import health, metrics
+
+if __name__ == "__main__":
+    # Bring up /healthz and /ready (on METRICS_PORT) before the slow Gradio import,
+    # and warm the core modules on a background thread in the meantime
+    if metrics.start_server() is None:
+        print("METRICS_PORT is not set: /healthz and /ready are not served, so readiness probes will fail.")
+    health.start_warm_up()
+
 import gradio as gr
-import os # Keep os import in case it's used elsewhere, though not for Streamlit env vars now
+import time
 
 # Import your existing modules
-from modules.wiki_fetcher import fetch_topic_summary, fetch_wikibooks_links, fetch_wikidata_facts, fetch_wikiversity_resources
-from modules.ai_engine import mentor_chat_response, generate_flashcards
+from modules.pipeline import learn_topic_stream
+from modules.ai_engine import mentor_chat_stream
+from modules.conversation import Conversation
+from modules import config, decks, session_store, topics
+
+# --- Serving configuration ---
+# serve.py starts several copies of this app on consecutive ports behind a load balancer.
+# Each worker handles GRADIO_CONCURRENCY events at once and queues up to GRADIO_QUEUE_SIZE more.
+SERVER_PORT = int(config.get("GRADIO_SERVER_PORT", "7860"))
+GRADIO_CONCURRENCY = int(config.get("GRADIO_CONCURRENCY", "8"))
+GRADIO_QUEUE_SIZE = int(config.get("GRADIO_QUEUE_SIZE", "64"))
 
 # --- Gradio Theme and Global Styling ---
 # Gradio handles light/dark mode automatically with its themes.
@@ -63,100 +81,212 @@ custom_css = """
 
 # --- Functions to handle logic for Gradio UI interactions ---
 
-def learn_topic_action(topic):
+# Placeholders while a source is loading, and when it took too long to wait for
+LOADING = {
+    "books": "⏳ Looking for Wikibooks links...",
+    "facts": "⏳ Looking up Wikidata facts...",
+    "resources": "⏳ Looking for Wikiversity resources...",
+    "flashcards": "⏳ Writing flashcards...",
+}
+TIMED_OUT = {
+    "books": "⌛ Wikibooks is slow right now; links will be ready next time you open this topic.",
+    "facts": "⌛ Wikidata is slow right now; facts will be ready next time you open this topic.",
+    "resources": "⌛ Wikiversity is slow right now; resources will be ready next time you open this topic.",
+    "flashcards": "⌛ Flashcards are taking a while; they will be ready next time you open this topic.",
+}
+
+
+def _section_markdown(section, result):
+    """Markdown for one finished (or timed out) source section of the Learn tab."""
+    if section in result["timed_out"]:
+        return TIMED_OUT[section]
+    items = result[section]
+    if section == "books":
+        if not items:
+            return "No related books found on Wikibooks."
+        return "### 🔗 Wikibooks Links\n\n" + "\n".join([f"- 📘 [{title}]({url})" for title, url in items])
+    if section == "facts":
+        if not items:
+            return "No structured facts found on Wikidata."
+        return "### 🔬 Wikidata Facts\n\n" + "\n".join([f"- 🔹 {fact}" for fact in items])
+    if not items:
+        return "No learning resources found on Wikiversity."
+    return "### 🎓 Wikiversity Resources\n\n" + "\n".join([f"- 🎓 [{title}]({link})" for title, link in items])
+
+
+@metrics.instrument_action("learn_topic")
+def learn_topic_action(topic, conversation=None, session_id=None):
     """
     Handles the logic for the 'Learn a Topic' tab.
-    Fetches summary, links, facts, resources, and generates flashcards.
-    Returns multiple outputs for Gradio components.
+    A generator: each section (summary, links, facts, resources, then flashcards)
+    is shown as soon as its source answers, with a placeholder until then, so the
+    learner starts reading the summary while the slower sources are still loading.
+    Yields the outputs for Gradio components, including the chat conversation,
+    which knows the topic the learner is studying, and the suggestions offered
+    when the topic is ambiguous or wasn't found.
     """
-    summary_output = ""
-    books_output = ""
-    facts_output = ""
-    resources_output = ""
-    flashcard_status = ""
-    flashcards_data = [] # Data to be stored in session state
-
+    no_suggestions = gr.Radio(choices=[], value=None, visible=False)
     if not topic:
         # Return empty strings for outputs and a message for status
-        return "", "", "", "", "Please enter a topic to learn.", []
+        yield "", "", "", "", "Please enter a topic to learn.", [], conversation, no_suggestions
+        return
 
-    # Fetch summary
-    # Gradio handles loading indicators automatically when functions are running
-    summary = fetch_topic_summary(topic)
-    if summary:
-        summary_output = f"### 📖 Topic Summary\n\n{summary}"
-    else:
-        summary_output = "Couldn't find that topic. Try again with a simpler keyword."
-        # If summary fails, no other data can be fetched, so return early
-        return summary_output, "", "", "", "", []
-
-    # Fetch Wikibooks links
-    books = fetch_wikibooks_links(topic)
-    if books:
-        books_output = "### 🔗 Wikibooks Links\n\n" + "\n".join([f"- 📘 [{title}]({url})" for title, url in books])
-    else:
-        books_output = "No related books found on Wikibooks."
+    # Resolve the input to one Wikipedia article before fetching anything
+    resolution = topics.resolve(topic)
+    if resolution["status"] != "ok":
+        options = resolution["options"]
+        if resolution["status"] == "disambiguation":
+            summary_output = f"🔀 **{resolution['title']}** can mean several things. Pick the one you mean below."
+        else:
+            summary_output = "Couldn't find that topic. Try again with a simpler keyword."
+            if options:
+                summary_output += " Did you mean one of these?"
+        suggestions = gr.Radio(choices=options, value=None, visible=bool(options))
+        yield summary_output, "", "", "", "", [], conversation, suggestions
+        return
+    title = resolution["title"]
 
-    # Fetch Wikidata facts
-    facts = fetch_wikidata_facts(topic)
-    if facts:
-        facts_output = "### 🔬 Wikidata Facts\n\n" + "\n".join([f"- � {fact}" for fact in facts])
+    # Cards the learner already has for this topic are reused, never regenerated
+    known_cards = decks.topic_cards(session_id, title) if session_id else []
+    flashcards_data = [{"question": card["question"], "answer": card["answer"]} for card in known_cards]
+    if known_cards:
+        flashcard_status = f"✅ You already have {len(known_cards)} flashcards for this topic in your review deck."
     else:
-        facts_output = "No structured facts found on Wikidata."
+        flashcard_status = LOADING["flashcards"]
 
-    # Fetch Wikiversity resources
-    resources = fetch_wikiversity_resources(topic)
-    if resources:
-        resources_output = "### 🎓 Wikiversity Resources\n\n" + "\n".join([f"- 🎓 [{title}]({link})" for title, link in resources])
-    else:
-        resources_output = "No learning resources found on Wikiversity."
+    outputs = {"summary": f"### 📖 {title}\n\n⏳ Fetching the summary...", "books": LOADING["books"],
+               "facts": LOADING["facts"], "resources": LOADING["resources"]}
 
-    # Generate flashcards
-    flashcards = generate_flashcards(summary)
-    if flashcards:
-        flashcards_data = flashcards # Store for session state
-        flashcard_status = "✅ Flashcards generated! Check the Flashcard Review tab."
-    else:
-        flashcard_status = "⚠️ No flashcards were generated. Try a different topic."
+    def current():
+        return (outputs["summary"], outputs["books"], outputs["facts"], outputs["resources"],
+                flashcard_status, flashcards_data, conversation, no_suggestions)
 
-    return summary_output, books_output, facts_output, resources_output, flashcard_status, flashcards_data
+    yield current()
+    # Sources are fetched concurrently; each section is filled in as it arrives
+    for section, result in learn_topic_stream(topic, flashcards=not known_cards, resolution=resolution):
+        if section == "resolution":
+            continue # Already resolved above
+        if section == "summary":
+            summary = result["summary"]
+            if not summary:
+                if section in result["timed_out"]:
+                    message = "⌛ Wikipedia is slow to answer right now. Please try again in a moment."
+                else:
+                    message = "Couldn't find that topic. Try again with a simpler keyword."
+                # If summary fails, nothing else is worth showing
+                yield message, "", "", "", "", [], conversation, no_suggestions
+                return
+            outputs["summary"] = f"### 📖 {title}\n\n{summary}"
+            if conversation is not None:
+                conversation.set_topic(title, summary) # Mentor Chat answers follow-ups about this topic
+        elif section == "flashcards":
+            flashcards = result["flashcards"]
+            if flashcards:
+                flashcards_data = flashcards # Store for session state
+                if session_id:
+                    decks.add_cards(session_id, title, flashcards) # Scheduled for review right away
+                flashcard_status = "✅ Flashcards generated! Check the Flashcard Review tab."
+            elif section in result["timed_out"]:
+                flashcard_status = TIMED_OUT["flashcards"]
+            else:
+                flashcard_status = "⚠️ No flashcards were generated. Try a different topic."
+        elif section in outputs:
+            outputs[section] = _section_markdown(section, result)
+        yield current()
 
+    # Keep the deck and chat topic in the shared store so any worker can pick the session up
+    session_store.save_session(session_id, conversation or Conversation(), flashcards_data)
 
-def mentor_chat_action(user_query, chat_history):
+
+def suggest_topics(prefix):
+    """As-you-type suggestions from the local title index (no network calls)."""
+    options = topics.suggest(prefix) if len(prefix.strip()) >= 2 else []
+    return gr.Radio(choices=options, value=None, visible=bool(options))
+
+
+@metrics.instrument_action("mentor_chat")
+def mentor_chat_action(user_query, conversation, session_id=None, flashcards_data=None):
     """
     Handles the AI Mentor chat functionality.
-    Takes user query and current chat history, generates a response, and updates history.
+    Streams the reply into the chat so Gradio renders tokens as they arrive;
+    the conversation sends the topic and earlier turns along with the question.
     """
     if not user_query:
         # If query is empty, return current history without modification
-        return chat_history, chat_history
+        yield conversation.turns, conversation
+        return
+
+    pending = [user_query, ""] # Gradio Chatbot expects list of [user_msg, bot_msg]
+    for chunk in mentor_chat_stream(user_query, conversation):
+        pending[1] += chunk
+        yield conversation.turns + [pending], conversation # Updated chat for display, plus state
+    session_store.save_session(session_id, conversation, flashcards_data or [])
+    # The finished turn is now stored (and capped) in the conversation; a failed one isn't,
+    # but stays on screen until the next question
+    stored = conversation.turns[-1:] == [pending]
+    yield conversation.turns if stored else conversation.turns + [pending], conversation
 
-    reply = mentor_chat_response(user_query)
-    chat_history.append([user_query, reply]) # Gradio Chatbot expects list of [user_msg, bot_msg]
-    return chat_history, chat_history # Return updated history for display and state
 
+def _format_wait(seconds):
+    if seconds < 3600:
+        return f"{max(1, round(seconds / 60))} min"
+    if seconds < 2 * 86400:
+        return f"{round(seconds / 3600)} h"
+    return f"{round(seconds / 86400)} days"
 
-def flashcard_review_display(flashcards_data):
+
+@metrics.instrument_action("flashcard_review")
+def flashcard_review_display(session_id):
+    """
+    Shows the learner's next due flashcard from their persistent deck (only due
+    cards are ever rendered). Returns the deck status, the question, an empty
+    answer (revealed on request) and the card id for the grade buttons.
+    """
+    empty = "<p style='text-align: center; color: var(--text-color-subdued);'>Flashcards will appear here after learning a topic.</p>"
+    if not session_id:
+        return "", empty, "", None
+    counts = decks.stats(session_id)
+    if not counts["total"]:
+        return "", empty, "", None
+
+    status = f"**{counts['due']}** due now · **{counts['total']}** cards in your deck"
+    card = decks.next_due(session_id)
+    if card is None:
+        wait = _format_wait(counts["next_due"] - time.time()) if counts["next_due"] else "a while"
+        return status, f"<p style='text-align: center;'>🎉 All caught up! Next card due in {wait}.</p>", "", None
+
+    # Apply inline styles for the flashcard to match the Streamlit look
+    # These styles are derived from the custom_css block
+    card_html = f"""
+    <div class='flashcard'>
+        <p>{card['title'] or card['topic'].title()}</p>
+        <h4>{card['question']}</h4>
+    </div>
+    """
+    return status, card_html, "", card["card_id"]
+
+
+def reveal_answer(session_id, card_id):
+    card = decks.get_card(session_id, card_id) if session_id and card_id else None
+    return f"**Answer:** {card['answer']}" if card else ""
+
+
+@metrics.instrument_action("flashcard_grade")
+def grade_card(session_id, card_id, grade):
+    """Records how well the learner remembered the card (SM-2) and moves on to the next due one."""
+    if session_id and card_id:
+        decks.review(session_id, card_id, grade)
+    return flashcard_review_display(session_id)
+
+def restore_session(session_id):
     """
-    Generates HTML for displaying flashcards based on the session state data.
+    Runs on page load: gives a new browser a session id, or reloads a returning
+    learner's conversation and deck from the shared store (whichever worker saved them).
     """
-    if not flashcards_data:
-        return "<p style='text-align: center; color: var(--text-color-subdued);'>Flashcards will appear here after learning a topic.</p>"
-
-    flashcard_html = ""
-    for idx, fc in enumerate(flashcards_data):
-        # Apply inline styles for the flashcard to match the Streamlit look
-        # These styles are derived from the custom_css block
-        flashcard_html += f"""
-        <div class='flashcard'>
-            <h4>Q{idx+1}: {fc['question']}</h4>
-            <details>
-                <summary>Show Answer</summary>
-                <p>{fc['answer']}</p>
-            </details>
-        </div>
-        """
-    return flashcard_html
+    if not session_id:
+        session_id = session_store.new_session_id()
+    conversation, flashcards_data = session_store.load_session(session_id)
+    return (session_id, conversation, flashcards_data, conversation.turns) + flashcard_review_display(session_id)
 
 # --- Gradio UI Layout ---
 # Use gr.Blocks for a multi-tab application
@@ -169,10 +299,12 @@ with gr.Blocks(theme=theme, title="WikiMentor", css=custom_css) as demo:
     </div>
     """)
 
-    # Persistent state variables for chat history and flashcards
+    # Persistent state variables for the chat conversation and flashcards
     # These will maintain their values across different tab interactions within a session
-    chat_history_state = gr.State([])
+    conversation_state = gr.State(Conversation())
     flashcards_state = gr.State([])
+    # The session id lives in the browser, so it survives page reloads and worker restarts
+    session_id_state = gr.BrowserState("", storage_key="wikimentor_session")
 
     # Main navigation using Gradio Tabs
     with gr.Tabs() as tabs:
@@ -180,6 +312,7 @@ with gr.Blocks(theme=theme, title="WikiMentor", css=custom_css) as demo:
         with gr.TabItem("🏫 Learn a Topic", id=0):
             gr.Markdown("## 📘 Learn a New Topic")
             topic_input = gr.Textbox(label="🔍 Enter a topic to learn:", placeholder="e.g., Quantum Physics", scale=4)
+            topic_suggestions = gr.Radio(label="Suggestions", choices=[], visible=False)
             learn_button = gr.Button("📚 Fetch Topic Info", scale=1)
 
             # Output components for the fetched information
@@ -192,17 +325,30 @@ with gr.Blocks(theme=theme, title="WikiMentor", css=custom_css) as demo:
             # Connect the button click to the learning function
             learn_button.click(
                 fn=learn_topic_action,
-                inputs=[topic_input],
+                inputs=[topic_input, conversation_state, session_id_state],
                 outputs=[
                     summary_output,
                     books_output,
                     facts_output,
                     resources_output,
                     flashcard_status_output,
-                    flashcards_state # Update the flashcards_state with new data
-                ]
+                    flashcards_state, # Update the flashcards_state with new data
+                    conversation_state, # Remember the topic for Mentor Chat
+                    topic_suggestions # Options for ambiguous or unknown topics
+                ],
+                show_progress="minimal" # Sections fill in one by one; a full overlay would hide them
             )
 
+            # Suggest titles while typing; picking one fills in the topic
+            topic_input.input(
+                fn=suggest_topics,
+                inputs=[topic_input],
+                outputs=[topic_suggestions],
+                queue=False,
+                show_progress="hidden"
+            )
+            topic_suggestions.input(fn=lambda choice: choice, inputs=[topic_suggestions], outputs=[topic_input])
+
         # --- Mentor Chat Tab ---
         with gr.TabItem("💬 Mentor Chat", id=1):
             gr.Markdown("## 💬 Ask Your AI Mentor")
@@ -215,8 +361,8 @@ with gr.Blocks(theme=theme, title="WikiMentor", css=custom_css) as demo:
             # The .then() method is used to clear the input box after sending
             send_button.click(
                 fn=mentor_chat_action,
-                inputs=[user_query_input, chat_history_state], # Pass user query and current history
-                outputs=[chatbot, chat_history_state] # Update chatbot display and history state
+                inputs=[user_query_input, conversation_state, session_id_state, flashcards_state], # Pass user query and current conversation
+                outputs=[chatbot, conversation_state] # Update chatbot display and conversation state
             ).then(
                 lambda: "", # Function to clear the input
                 outputs=[user_query_input]
@@ -226,27 +372,51 @@ with gr.Blocks(theme=theme, title="WikiMentor", css=custom_css) as demo:
         with gr.TabItem("🗂️ Flashcard Review", id=2):
             gr.Markdown("## 🗂️ Flashcard Review Mode")
             gr.Markdown("Use these flashcards to revise and reinforce your memory.")
+            review_status = gr.Markdown()
             flashcard_display_area = gr.HTML(label="Your Flashcards")
+            answer_output = gr.Markdown()
+            current_card_state = gr.State(None)
+            show_answer_button = gr.Button("👀 Show Answer")
+            with gr.Row():
+                grade_buttons = {
+                    "again": gr.Button("🔁 Again"),
+                    "hard": gr.Button("😓 Hard"),
+                    "good": gr.Button("🙂 Good"),
+                    "easy": gr.Button("😎 Easy"),
+                }
+            review_outputs = [review_status, flashcard_display_area, answer_output, current_card_state]
 
-            # This function will be called when the tab is selected to display flashcards
-            # The `load` event of the `Blocks` interface can trigger this when the tab changes
+            # Show the next due card whenever a tab is selected
             tabs.select(
                 fn=flashcard_review_display,
-                inputs=[flashcards_state], # Pass the current flashcards data
-                outputs=[flashcard_display_area],
-                # This ensures the flashcards are updated when the tab is switched to
-                # only if the selected tab is the flashcard review tab
-                # condition=lambda selected_tab: selected_tab == 2 # This condition can be tricky with tabs.select
+                inputs=[session_id_state],
+                outputs=review_outputs,
             )
-            # A simpler way to ensure flashcards are loaded when the tab is first viewed
-            # or when the app loads:
-            demo.load(
-                fn=flashcard_review_display,
-                inputs=[flashcards_state],
-                outputs=[flashcard_display_area]
+            show_answer_button.click(
+                fn=reveal_answer,
+                inputs=[session_id_state, current_card_state],
+                outputs=[answer_output]
             )
+            for grade, button in grade_buttons.items():
+                button.click(
+                    fn=lambda session_id, card_id, grade=grade: grade_card(session_id, card_id, grade),
+                    inputs=[session_id_state, current_card_state],
+                    outputs=review_outputs
+                )
+
+    # Restore the learner's session (chat and flashcards) when the page loads
+    demo.load(
+        fn=restore_session,
+        inputs=[session_id_state],
+        outputs=[session_id_state, conversation_state, flashcards_state, chatbot] + review_outputs
+    )
 
 
 # Launch the Gradio application
 # server_name="0.0.0.0" and server_port=7860 are crucial for Hugging Face Spaces deployment
-demo.launch(server_name="0.0.0.0", server_port=7860)
+# (guarded so benchmarks can import the handlers without starting a server)
+if __name__ == "__main__":
+    demo.queue(default_concurrency_limit=GRADIO_CONCURRENCY, max_size=GRADIO_QUEUE_SIZE)
+    demo.launch(server_name="0.0.0.0", server_port=SERVER_PORT, prevent_thread_lock=True)
+    health.mark_serving() # /ready turns 200 once the warm-up has finished too
+    demo.block_thread()
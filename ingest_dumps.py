@@ -0,0 +1,64 @@
+"""
+Builds the offline snapshot used when WIKI_BACKEND is "local" or "auto".
+
+Examples:
+    python ingest_dumps.py --abstracts enwiki-latest-abstract.xml.gz
+    python ingest_dumps.py --summaries summaries.jsonl.gz --redirects redirects.tsv
+    python ingest_dumps.py --wikidata wikidata-subset.json.gz --linked-only
+    python ingest_dumps.py --wikibooks-titles enwikibooks-latest-all-titles-in-ns0.gz \\
+                           --wikiversity-titles enwikiversity-latest-all-titles-in-ns0.gz
+
+    python ingest_dumps.py --build-search-index
+    python ingest_dumps.py --refresh-search-index
+
+Dumps are streamed, so memory use stays flat regardless of dump size.
+"""
+import argparse
+import time
+
+from modules import offline_store, search_index
+
+
+def _run(label, fn, *args, **kwargs):
+    start = time.perf_counter()
+    count = fn(*args, **kwargs)
+    print(f"✅ {label}: {count} records in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest Wikimedia dumps into the WikiMentor offline store.")
+    parser.add_argument("--abstracts", help="enwiki abstract XML dump (.xml, .gz or .bz2)")
+    parser.add_argument("--summaries", help="JSON-lines summaries (title/extract or name/abstract per line)")
+    parser.add_argument("--redirects", help="tab-separated 'source<TAB>target' redirect list")
+    parser.add_argument("--wikidata", help="Wikidata JSON dump or subset (one entity per line)")
+    parser.add_argument("--linked-only", action="store_true", help="only keep Wikidata items with an enwiki article")
+    parser.add_argument("--wikibooks-titles", help="enwikibooks all-titles-in-ns0 list")
+    parser.add_argument("--wikiversity-titles", help="enwikiversity all-titles-in-ns0 list")
+    parser.add_argument("--build-search-index", action="store_true",
+                        help="seed the BM25 resource index from the ingested Wikibooks/Wikiversity titles")
+    parser.add_argument("--refresh-search-index", action="store_true",
+                        help="re-index Wikibooks/Wikiversity pages changed since the last refresh")
+    args = parser.parse_args()
+
+    print(f"📦 Writing to {offline_store.db_path()}")
+    if args.abstracts:
+        _run("Wikipedia abstracts", offline_store.ingest_abstracts, args.abstracts)
+    if args.summaries:
+        _run("Wikipedia summaries", offline_store.ingest_summaries, args.summaries)
+    if args.redirects:
+        _run("Wikipedia redirects", offline_store.ingest_redirects, args.redirects)
+    if args.wikidata:
+        _run("Wikidata entities", offline_store.ingest_wikidata, args.wikidata, linked_only=args.linked_only)
+    if args.wikibooks_titles:
+        _run("Wikibooks titles", offline_store.ingest_titles, "wikibooks", args.wikibooks_titles)
+    if args.wikiversity_titles:
+        _run("Wikiversity titles", offline_store.ingest_titles, "wikiversity", args.wikiversity_titles)
+    if args.build_search_index:
+        _run("Search index", search_index.build_from_offline_store)
+    if args.refresh_search_index:
+        for source in search_index.SOURCES:
+            _run(f"Search index refresh ({source})", search_index.refresh, source)
+
+
+if __name__ == "__main__":
+    main()
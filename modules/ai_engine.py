@@ -1,60 +1,442 @@
-import os
+import contextvars
+import itertools
+import json
+import queue
 import re
-import requests
-import streamlit as st
-from dotenv import load_dotenv
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+from modules import cache, config, llm_providers, metrics
 
-GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
-MODEL = "llama3-8b-8192"
+PRIORITY_INTERACTIVE = 0   # mentor chat: a learner is waiting
+PRIORITY_BACKGROUND = 10   # flashcards and warm-up jobs
 
-HEADERS = {
-    "Authorization": f"Bearer {GROQ_API_KEY}",
-    "Content-Type": "application/json"
-}
+def _error_reply(error):
+    print("LLM request failed:", error)
+    if error.api_error:
+        return "⚠️ LLM API error. Check key or model name."
+    return "⚠️ Connection error."
 
-def call_groq(prompt, system="You are a helpful and concise AI tutor."):
+def _messages(prompt, system, history=()):
+    """system, then earlier (role, content) turns, then the new user prompt"""
+    return ([{"role": "system", "content": system}] +
+            [{"role": role, "content": content} for role, content in history] +
+            [{"role": "user", "content": prompt}])
+
+def _complete(prompt, system, json_mode=False, history=()):
+    # The model is filled in by whichever provider the router picks
     payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": system},
-            {"role": "user", "content": prompt}
-        ],
+        "messages": _messages(prompt, system, history),
         "temperature": 0.7
     }
+    if json_mode:
+        # OpenAI-compatible JSON mode: the reply is guaranteed to be a JSON object
+        payload["response_format"] = {"type": "json_object"}
+        payload["temperature"] = 0.3
     try:
-        res = requests.post(GROQ_URL, headers=HEADERS, json=payload)
-        if res.status_code == 200:
-            return res.json()["choices"][0]["message"]["content"]
-        else:
-            print("Groq API error:", res.text)
-            return "⚠️ Groq API error. Check key or model name."
+        return llm_providers.get_router().complete(payload)
+    except llm_providers.LLMUnavailable as e:
+        return _error_reply(e)
     except Exception as e:
         print("Request failed:", e)
         return "⚠️ Connection error."
 
-@st.cache_data(show_spinner=False)
+
+class _TokenBucket:
+    """Blocking token bucket: at most rate_per_minute acquisitions per minute, bursting to burst."""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class LLMScheduler:
+    """
+    Process-wide front door for completions.
+    Requests wait in a priority queue (interactive before background), at most
+    max_concurrency run at once under a token-bucket rate limit, and identical
+    in-flight (system, history, prompt, json_mode) requests share a single upstream call.
+    """
+
+    def __init__(self, max_concurrency, rate_per_minute):
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = _TokenBucket(rate_per_minute, burst=max_concurrency)
+        self._queue = queue.PriorityQueue()
+        self._inflight = {}   # (system, history, prompt, json_mode) -> [future, queued priority, caller context]
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._workers = []
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        with self._lock:
+            while len(self._workers) < self.max_concurrency:
+                worker = threading.Thread(target=self._run, name=f"llm-worker-{len(self._workers)}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, prompt, system, priority=PRIORITY_INTERACTIVE, json_mode=False, history=()):
+        """Returns a concurrent.futures.Future resolving to the completion text."""
+        self._ensure_workers()
+        key = (system, tuple(history), prompt, json_mode)
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None:
+                future, queued_priority, context = entry
+                # Promote a queued background request when a learner asks for the same thing
+                if priority < queued_priority and not future.running():
+                    entry[1] = priority
+                    self._queue.put((priority, next(self._seq), key, future, context))
+                return future
+            future = Future()
+            # The caller's context travels with the request so metrics land in its trace
+            context = contextvars.copy_context()
+            self._inflight[key] = [future, priority, context]
+            self._queue.put((priority, next(self._seq), key, future, context))
+        return future
+
+    @contextmanager
+    def slot(self):
+        """Holds one concurrency slot (and one rate-limit token) until the block exits."""
+        with self._slots:
+            self._bucket.acquire()
+            yield
+
+    @contextmanager
+    def queued_slot(self, priority=PRIORITY_INTERACTIVE):
+        """
+        A slot for a call made outside the queue (a stream) that still takes its turn
+        by priority: a worker acquires the slot when the request comes up and lends it
+        to the caller until the block exits.
+        """
+        self._ensure_workers()
+        granted, released = Future(), threading.Event()
+        self._queue.put((priority, next(self._seq), None, granted, released))
+        try:
+            granted.result()
+            yield
+        finally:
+            released.set()
+
+    def _run(self):
+        while True:
+            _, _, key, future, context = self._queue.get()
+            if key is None:
+                # A slot lent to a stream; context is the event its caller sets when done
+                with self.slot():
+                    future.set_result(None)
+                    context.wait()
+                continue
+            with self._lock:
+                # Skip duplicate entries left behind by a priority promotion
+                if future.running() or future.done():
+                    continue
+                if not future.set_running_or_notify_cancel():
+                    self._inflight.pop(key, None)
+                    continue
+            try:
+                with self.slot():
+                    system, history, prompt, json_mode = key
+                    future.set_result(context.run(_complete, prompt, system, json_mode, history))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    The process-wide scheduler: shared limits for every completion this process sends
+    (a hedged request's second provider call rides on the same slot), read from the
+    environment/.env on first use.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(int(config.get("LLM_MAX_CONCURRENCY", "4")),
+                                          float(config.get("LLM_RATE_PER_MINUTE", "30")))
+    return _scheduler
+
+
+def call_groq(prompt, system="You are a helpful and concise AI tutor.", priority=PRIORITY_INTERACTIVE, json_mode=False, history=()):
+    """history holds earlier (role, content) turns to send before the prompt."""
+    return get_scheduler().submit(prompt, system, priority, json_mode, history).result()
+
+
+def call_groq_stream(prompt, system="You are a helpful and concise AI tutor.", history=(), priority=PRIORITY_INTERACTIVE,
+                     status=None):
+    """
+    Streams a chat completion from the best available provider's
+    OpenAI-compatible SSE endpoint, yielding text deltas as they arrive.
+    The stream waits for its slot in the scheduler's priority queue.
+    A failure is yielded as a "⚠️" message, possibly after part of the reply;
+    pass a dict as status and status["complete"] is set only once the whole reply arrived.
+    """
+    payload = {
+        "messages": _messages(prompt, system, history),
+        "temperature": 0.7
+    }
+    try:
+        with get_scheduler().queued_slot(priority):
+            yield from llm_providers.get_router().stream(payload)
+        if status is not None:
+            status["complete"] = True
+    except llm_providers.LLMUnavailable as e:
+        yield _error_reply(e)
+    except Exception as e:
+        print("Request failed:", e)
+        yield "⚠️ Connection error."
+
+MENTOR_SYSTEM = ("You are a helpful and concise AI tutor. Explain concepts clearly in simple terms, "
+                 "and answer follow-up questions in the context of the conversation so far. "
+                 "When Wikipedia passages are given, base the answer on them.")
+
+def _mentor_prompt(query, passages=()):
+    if not passages:
+        return f"Explain this concept clearly in simple terms:\n\n{query}"
+    from modules import retrieval
+    return (f"Passages from Wikipedia:\n\n{retrieval.format_passages(passages)}\n\n"
+            f"Using these passages, explain this concept clearly in simple terms and keep it short:\n\n{query}")
+
+def _question_passages(query):
+    from modules import retrieval  # NumPy and the article index load on first use
+    return retrieval.question_passages(query)
+
+def _topic_passages(topic, query):
+    from modules import retrieval
+    return retrieval.topic_passages(topic, query)
+
+def _semantic_lookup(query):
+    from modules import semantic_cache  # NumPy is only loaded once the mentor is first asked something
+    reply = semantic_cache.lookup(query)
+    metrics.inc("wikimentor_cache_requests_total", source="semantic", result="miss" if reply is None else "hit")
+    return reply
+
+def _semantic_add(query, reply):
+    from modules import semantic_cache
+    semantic_cache.add(query, reply)
+
+@cache.cached("mentor")
 def mentor_chat_response(query):
-    prompt = f"Explain this concept clearly in simple terms:\n\n{query}"
-    return call_groq(prompt)
+    # Exact repeats are served by the decorator; paraphrases by the semantic cache
+    reply = _semantic_lookup(query)
+    if reply is not None:
+        return reply
+    reply = call_groq(_mentor_prompt(query, _question_passages(query)))
+    _semantic_add(query, reply)
+    return reply
+
+def mentor_chat_stream(query, conversation=None):
+    """
+    Streaming variant of mentor_chat_response: yields text chunks.
+    With a Conversation, the topic's best-matching article passages and earlier turns go with the question
+    and the finished turn is added to it. Context-free questions use the caches:
+    cached answers are yielded in one piece; fresh ones are cached once complete.
+    A reply that failed part-way is shown but neither cached nor added to the conversation.
+    """
+    status = {}
+    if conversation is None or conversation.is_empty():
+        stream = _mentor_stream_cached(query, status)
+    else:
+        passages = _topic_passages(conversation.topic, query) if conversation.topic else ()
+        system, history = conversation.context(query, MENTOR_SYSTEM, passages)
+        stream = call_groq_stream(query, system=system, history=history, status=status)
+    parts = []
+    for chunk in stream:
+        parts.append(chunk)
+        yield chunk
+    if conversation is not None and status.get("complete"):
+        conversation.add_turn(query, "".join(parts))
+
+def _mentor_stream_cached(query, status):
+    cached_reply = cache.get("mentor", query)
+    if cached_reply is None:
+        cached_reply = _semantic_lookup(query)
+    if cached_reply is not None:
+        status["complete"] = True
+        yield cached_reply
+        return
+    parts = []
+    for chunk in call_groq_stream(_mentor_prompt(query, _question_passages(query)), status=status):
+        parts.append(chunk)
+        yield chunk
+    reply = "".join(parts)
+    # A stream that failed part-way reads like an answer, so only a complete one is stored
+    if reply and status.get("complete"):
+        cache.set("mentor", query, reply)
+        _semantic_add(query, reply)
+
+# 🗂️ Flashcards
+FLASHCARD_MAX_CHARS = 3000  # safety cap; pipeline sends a few retrieved chunks
+FLASHCARD_SYSTEM = "You write concise study flashcards and always reply with a single JSON object."
+
+def _flashcard_prompt(text, count):
+    return f"""Create exactly {count} flashcards based on this content:
+
+{text}
+
+Reply with JSON in exactly this shape:
+{{"flashcards": [{{"question": "...", "answer": "..."}}]}}
+Each answer should be one or two short sentences."""
+
+def _strip_code_fence(raw):
+    raw = raw.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", raw, re.DOTALL)
+    return fenced.group(1) if fenced else raw
+
+def flashcard_count():
+    """Cards per deck (FLASHCARD_COUNT)."""
+    return int(config.get("FLASHCARD_COUNT", "5"))
+
+def parse_flashcards(raw, count=None):
+    """
+    Strictly validates a JSON flashcard reply.
+    Returns (cards, problem) where problem is an empty string when the deck is complete.
+    """
+    count = count or flashcard_count()
+    try:
+        data = json.loads(_strip_code_fence(raw))
+    except ValueError as e:
+        return [], f"The reply was not valid JSON ({e})."
+
+    items = data.get("flashcards") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return [], 'The JSON object has no "flashcards" list.'
+    return _valid_cards(items, count)
 
-@st.cache_data(show_spinner=False)
-def generate_flashcards(text):
-    if len(text) > 2000:
-        text = text[:2000]
-    prompt = f"""Create 5 flashcards based on this content:\n\n{text}\n\nFormat:\nQ: ...\nA: ..."""
-    raw = call_groq(prompt)
+def _valid_cards(items, count):
+    cards = []
+    seen = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        question = str(item.get("question") or "").strip()
+        answer = str(item.get("answer") or "").strip()
+        if not question or not answer or question.casefold() in seen:
+            continue
+        seen.add(question.casefold())
+        cards.append({"question": question, "answer": answer})
 
-    print("🧠 RAW FLASHCARD RESPONSE:\n", raw)  # For debugging
+    if len(cards) < count:
+        return cards, f"Expected {count} complete, distinct flashcards but found {len(cards)}."
+    return cards[:count], ""
 
+def _parse_qa_text(raw):
+    """Salvages a plain 'Q: ... A: ...' reply without another LLM call."""
     cards = []
-    blocks = re.split(r"Q:\s*", raw)[1:]  # split by Q:
-    for block in blocks:
-        parts = block.strip().split("A:")
-        if len(parts) == 2:
-            q = parts[0].strip()
-            a = parts[1].strip().split("\n")[0]
-            cards.append({"question": q, "answer": a})
+    for block in re.split(r"Q:\s*", raw)[1:]:
+        parts = block.strip().split("A:", 1)
+        if len(parts) == 2 and parts[0].strip() and parts[1].strip():
+            cards.append({"question": parts[0].strip(), "answer": parts[1].strip()})
     return cards
+
+@cache.cached("flashcards", should_cache=bool)
+def generate_flashcards(text, count=None):
+    count = count or flashcard_count()
+    text = text[:FLASHCARD_MAX_CHARS]
+    raw = call_groq(_flashcard_prompt(text, count), system=FLASHCARD_SYSTEM, priority=PRIORITY_BACKGROUND, json_mode=True)
+    if raw.startswith("⚠️"):
+        return []
+    cards, problem = parse_flashcards(raw, count)
+    if not problem:
+        return cards
+    metrics.annotate(flashcards_repair=problem)  # the trace shows why a second call was needed
+
+    # One targeted repair pass: show the model its own reply and what was wrong with it
+    repair_prompt = f"""Your previous reply had a problem: {problem}
+
+Previous reply:
+{raw}
+
+Return the corrected JSON with exactly {count} flashcards in the shape {{"flashcards": [{{"question": "...", "answer": "..."}}]}}."""
+    if len(cards) < count:
+        repair_prompt += f"\n\nSource content for any missing cards:\n\n{text}"
+    repaired_raw = call_groq(repair_prompt, system=FLASHCARD_SYSTEM, priority=PRIORITY_BACKGROUND, json_mode=True)
+    repaired, _ = parse_flashcards(repaired_raw, count)
+
+    best = max([cards, repaired, _parse_qa_text(raw)], key=len)
+    return best[:count]
+
+# 📦 Packed flashcards: several sources share one prompt (bulk jobs)
+def _packed_flashcard_prompt(texts, count):
+    sources = "\n\n".join(f"### Source {n}\n{text}" for n, text in enumerate(texts, 1))
+    return f"""Create exactly {count} flashcards for each of the {len(texts)} sources below.
+
+{sources}
+
+Reply with JSON in exactly this shape, one deck per source:
+{{"decks": [{{"source": 1, "flashcards": [{{"question": "...", "answer": "..."}}]}}]}}
+Each answer should be one or two short sentences."""
+
+def parse_packed_flashcards(raw, size, count=None):
+    """One deck per source from a packed reply; a source whose deck is missing or incomplete gets []."""
+    count = count or flashcard_count()
+    decks = [[] for _ in range(size)]
+    try:
+        data = json.loads(_strip_code_fence(raw))
+    except ValueError:
+        return decks
+    items = data.get("decks") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return decks
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("flashcards"), list):
+            continue
+        try:
+            index = int(item.get("source", position + 1)) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < size and not decks[index]:
+            cards, problem = _valid_cards(item["flashcards"], count)
+            if not problem:
+                decks[index] = cards
+    return decks
+
+def generate_flashcard_pack(texts):
+    """
+    generate_flashcards for several texts with one LLM call: cached decks are
+    reused, the rest share a packed prompt, and any deck that comes back
+    incomplete falls back to its own generate_flashcards call.
+    Returns one deck per text, in order.
+    """
+    decks = [cache.get("flashcards", text) or [] for text in texts]
+    missing = [i for i, deck in enumerate(decks) if not deck]
+    if len(missing) > 1:
+        prompt = _packed_flashcard_prompt([texts[i][:FLASHCARD_MAX_CHARS] for i in missing], flashcard_count())
+        raw = call_groq(prompt, system=FLASHCARD_SYSTEM, priority=PRIORITY_BACKGROUND, json_mode=True)
+        if not raw.startswith("⚠️"):
+            for i, cards in zip(missing, parse_packed_flashcards(raw, len(missing))):
+                if cards:
+                    decks[i] = cards
+                    cache.set("flashcards", texts[i], cards)
+    for i in missing:
+        if not decks[i]:
+            decks[i] = generate_flashcards(texts[i])
+    return decks
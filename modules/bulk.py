@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules import config
+from modules.ai_engine import generate_flashcard_pack
+from modules.cache import normalize_key
+from modules.conversation import estimate_tokens
+from modules.pipeline import flashcard_source
+from modules.topics import as_typed, resolve_many
+from modules.wiki_fetcher import (fetch_article_text, fetch_learning_resources, fetch_topic_summary,
+                                  fetch_wikidata_facts_many, resource_links)
+
+# 📦 Study material for many topics at once (e.g. a whole syllabus).
+# Topics run in windows: the next window's sources are fetched while the current
+# one's flashcards are written. Within a window topics are resolved in one request,
+# inputs that resolve to the same article are fetched once, Wikidata claims and labels
+# are fetched in shared batches and several topics go into each flashcard prompt.
+# Results stream out as they finish.
+BULK_CONCURRENCY = int(config.get("BULK_CONCURRENCY", "8"))
+BULK_WINDOW = 25  # topics per window; Wikidata takes up to 50 entities per request
+PACK_SIZE = int(config.get("FLASHCARD_PACK_SIZE", "4"))  # topics per flashcard prompt
+PACK_TOKENS = int(config.get("FLASHCARD_PACK_TOKENS", "2400"))  # source text per flashcard prompt
+
+
+def read_topics(path):
+    """One topic per line; blank lines and lines starting with "#" are ignored."""
+    with open(path, encoding="utf-8") as f:
+        return parse_topics(f)
+
+
+def parse_topics(lines):
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def dedupe(topics):
+    seen = set()
+    unique = []
+    for topic in topics:
+        key = normalize_key(topic)
+        if key not in seen:
+            seen.add(key)
+            unique.append(topic)
+    return unique
+
+
+def pack(texts, max_size=PACK_SIZE, max_tokens=PACK_TOKENS):
+    """Splits texts into consecutive groups of at most max_size texts and about max_tokens tokens."""
+    packs, current, used = [], [], 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if current and (len(current) >= max_size or used + cost > max_tokens):
+            packs.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _safe(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        print(f"⚠️ {fn.__name__} failed:", e)
+        return None
+
+
+def _fetch_window(pool, coordinator, topics):
+    """Resolves a window of topics and starts every fetch for the resolved titles; returns their futures."""
+    resolutions = _safe(resolve_many, topics) or {}
+    resolutions = {topic: resolutions.get(topic) or as_typed(topic) for topic in topics}
+    titles = {r["title"]: r["qid"] for r in resolutions.values() if r["status"] == "ok"}
+    sources = (("summary", fetch_topic_summary), ("article", fetch_article_text),
+               ("learning_resources", fetch_learning_resources))
+    return {
+        "resolutions": resolutions,
+        "titles": {title: {name: pool.submit(_safe, fn, title) for name, fn in sources} for title in titles},
+        # Runs outside the pool so its per-topic searches can use the pool without starving it
+        "facts": coordinator.submit(_safe, fetch_wikidata_facts_many, list(titles), pool, titles),
+    }
+
+
+def _result(resolution, futures=None, facts=None, flashcards=()):
+    summary = futures["summary"].result() if futures else None
+    hits = futures["learning_resources"].result() if futures else None
+    return {
+        "topic": resolution["input"],
+        "title": resolution["title"],
+        "qid": resolution["qid"],
+        "status": resolution["status"] if resolution["status"] != "ok" else "ok" if summary else "failed",
+        "resolution": resolution,
+        "summary": summary,
+        "books": resource_links(hits, "wikibooks"),
+        "facts": (facts or {}).get(resolution["title"], []),
+        "resources": resource_links(hits, "wikiversity"),
+        "flashcards": list(flashcards),
+    }
+
+
+def _write_flashcards(pool, window, flashcards, pack_size, pack_tokens):
+    """Waits for the window's summaries and articles and submits its packed flashcard prompts."""
+    window["sources"] = sources = {}  # flashcard source text -> titles; identical texts share a deck
+    window["without_cards"] = []
+    for title, futures in window["titles"].items():
+        summary = futures["summary"].result()
+        if summary and flashcards:
+            text = _safe(flashcard_source, title, summary, futures["article"].result()) or summary
+            sources.setdefault(text, []).append(title)
+        else:
+            window["without_cards"].append(title)
+    window["packs"] = {pool.submit(_safe, generate_flashcard_pack, texts): texts
+                       for texts in pack(list(sources), pack_size, pack_tokens)}
+
+
+def _collect(window):
+    by_title = {}
+    for resolution in window["resolutions"].values():
+        by_title.setdefault(resolution["title"] if resolution["status"] == "ok" else None, []).append(resolution)
+    for resolution in by_title.pop(None, []):
+        yield _result(resolution)  # ambiguous or unknown: nothing was fetched
+
+    titles, sources = window["titles"], window["sources"]
+    facts = window["facts"].result() or {}
+    for title in window["without_cards"]:
+        for resolution in by_title[title]:
+            yield _result(resolution, titles[title], facts)
+    for future in as_completed(window["packs"]):
+        texts = window["packs"][future]
+        decks = future.result() or [[] for _ in texts]
+        for text, deck in zip(texts, decks):
+            for title in sources[text]:
+                for resolution in by_title[title]:
+                    yield _result(resolution, titles[title], facts, deck)
+
+
+def generate(topics, flashcards=True, concurrency=BULK_CONCURRENCY, window=BULK_WINDOW,
+             pack_size=PACK_SIZE, pack_tokens=PACK_TOKENS):
+    """
+    Runs the Learn-a-Topic flow for many topics and yields one result per unique
+    topic (learn_topic's fields plus "status") as soon as it is complete.
+    Topics that only differ in case or spacing are run once; ambiguous or unknown
+    topics come back with status "disambiguation" or "missing" and the options
+    from their resolution, without any fetches.
+    """
+    unique = dedupe(topics)
+    windows = [unique[i:i + window] for i in range(0, len(unique), window)]
+    if not windows:
+        return
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk") as pool, \
+            ThreadPoolExecutor(max_workers=2, thread_name_prefix="bulk-wikidata") as coordinator:
+        upcoming = _fetch_window(pool, coordinator, windows[0])
+        for n in range(len(windows)):
+            current = upcoming
+            _write_flashcards(pool, current, flashcards, pack_size, pack_tokens)
+            # The next window's sources are fetched while this one's flashcards are written
+            if n + 1 < len(windows):
+                upcoming = _fetch_window(pool, coordinator, windows[n + 1])
+            yield from _collect(current)
@@ -0,0 +1,308 @@
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import unquote
+
+from modules import config, metrics, sqlite_db
+
+# Two-tier response cache that works the same under Gradio, Streamlit or a script:
+# a small in-process LRU in front of a size-bounded shared store that survives restarts.
+# The default store is a SQLite file, which every worker process on the host shares;
+# other stores (e.g. a network key-value service) can be plugged in with set_backend().
+# Settings (WIKIMENTOR_CACHE, WIKIMENTOR_CACHE_PATH, ..._MEMORY_ITEMS, ..._MEMORY_TTL and
+# ..._MAX_BYTES) are read when used, never at import.
+DEFAULT_CACHE_PATH = os.path.join(".cache", "wikimentor.sqlite3")
+EVICT_EVERY = 100  # check the disk size bound every N writes
+
+DAY = 24 * 60 * 60
+DEFAULT_TTL = 7 * DAY
+SOURCE_TTLS = {
+    "summary": 7 * DAY,
+    "article": 7 * DAY,
+    "article_title": 30 * DAY,
+    "wikibooks": 14 * DAY,
+    "wikiversity": 14 * DAY,
+    "learning_resources": 14 * DAY,
+    "wikidata": 30 * DAY,
+    "wikidata_entity": 30 * DAY,
+    "resolve": 7 * DAY,
+    "flashcards": 30 * DAY,
+    "mentor": 7 * DAY,
+}
+
+MAX_KEY_LENGTH = 200
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_writes = 0
+_writes_lock = threading.Lock()
+_max_age = contextvars.ContextVar("wikimentor_cache_max_age", default=None)
+_backend = None
+_backend_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (source, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS aliases (
+    source TEXT NOT NULL,
+    alias TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (source, alias)
+);
+"""
+
+
+def enabled():
+    return config.get("WIKIMENTOR_CACHE", "on").lower() not in ("0", "off", "false")
+
+
+def normalize_key(text):
+    """
+    Maps equivalent spellings of a topic to one key:
+    "Python", "python " and "Python%20" all become "python", and
+    "Python_(programming_language)" becomes "python (programming language)".
+    Long inputs (e.g. summaries passed to the LLM) are hashed.
+    """
+    key = unquote(str(text)).replace("_", " ")
+    key = re.sub(r"\s+", " ", key).strip().casefold()
+    if len(key) > MAX_KEY_LENGTH:
+        key = "sha1:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return key
+
+
+class SQLiteBackend:
+    """
+    Shared store for the cache's second tier. A backend needs read(), touch(),
+    write() and evict() with these signatures; errors are logged by the caller.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.get("WIKIMENTOR_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self._connection = sqlite_db.LocalConnection(self.path, _SCHEMA, synchronous="NORMAL")
+
+    def read(self, source, key):
+        """Returns (canonical key, payload, created) for key or one of its aliases, or None."""
+        return self._connection().execute(
+            "SELECT e.key, e.value, e.created FROM entries e "
+            "WHERE e.source = ? AND e.key = COALESCE("
+            "(SELECT a.key FROM aliases a WHERE a.source = ? AND a.alias = ?), ?)",
+            (source, source, key, key)
+        ).fetchone()
+
+    def touch(self, source, key, now):
+        self._connection().execute("UPDATE entries SET accessed = ? WHERE source = ? AND key = ?", (now, source, key))
+
+    def write(self, source, key, payload, now, aliases):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (source, key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (source, key, payload, now, now, len(payload))
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO aliases (source, alias, key) VALUES (?, ?, ?)",
+                [(source, alias, key) for alias in aliases]
+            )
+
+    def evict(self, ttls, max_bytes, now):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN")
+            for source, ttl in ttls.items():
+                conn.execute("DELETE FROM entries WHERE source = ? AND created < ?", (source, now - ttl))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > max_bytes:
+                freed = 0
+                victims = []
+                for source, key, size in conn.execute("SELECT source, key, size FROM entries ORDER BY accessed"):
+                    victims.append((source, key))
+                    freed += size
+                    if total - freed <= max_bytes:
+                        break
+                conn.executemany("DELETE FROM entries WHERE source = ? AND key = ?", victims)
+            conn.execute("DELETE FROM aliases WHERE NOT EXISTS "
+                         "(SELECT 1 FROM entries e WHERE e.source = aliases.source AND e.key = aliases.key)")
+
+
+def _get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = SQLiteBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """Swaps the shared second tier, e.g. for a store reachable from several hosts."""
+    global _backend
+    _backend = backend
+    clear_memory()
+
+
+def _record(source, result):
+    metrics.inc("wikimentor_cache_requests_total", source=source, result=result)
+    metrics.annotate(cache=source, result=result)
+
+
+@contextmanager
+def max_age(seconds):
+    """
+    Treats entries older than `seconds` as misses inside the block, so callers
+    (e.g. the warm-up job's refresh mode) recompute and overwrite them.
+    """
+    token = _max_age.set(seconds)
+    try:
+        yield
+    finally:
+        _max_age.reset(token)
+
+
+def _remember(source, key, payload, created, expires):
+    # With several workers, cap how long one keeps serving its own copy of an entry
+    # another worker may have refreshed; 0 keeps it for the entry's full TTL
+    memory_ttl = float(config.get("WIKIMENTOR_CACHE_MEMORY_TTL", "0"))
+    if memory_ttl:
+        expires = min(expires, time.time() + memory_ttl)
+    memory_items = int(config.get("WIKIMENTOR_CACHE_MEMORY_ITEMS", "2048"))
+    with _memory_lock:
+        _memory[(source, key)] = (payload, created, expires)
+        _memory.move_to_end((source, key))
+        while len(_memory) > memory_items:
+            _memory.popitem(last=False)
+
+
+def get(source, key, default=None):
+    """Returns the cached value for (source, key), or default on a miss or expiry."""
+    if not enabled():
+        return default
+    key = normalize_key(key)
+    now = time.time()
+    limit = _max_age.get()
+    oldest = now - limit if limit is not None else 0
+
+    payload = None
+    with _memory_lock:
+        hit = _memory.get((source, key))
+        if hit is not None:
+            if hit[2] <= now:
+                del _memory[(source, key)]
+            elif hit[1] >= oldest:
+                _memory.move_to_end((source, key))
+                payload = hit[0]
+    if payload is not None:
+        _record(source, "hit_memory")
+        return json.loads(payload)
+
+    try:
+        row = _get_backend().read(source, key)
+        if row is None:
+            _record(source, "miss")
+            return default
+        canonical, payload, created = row
+        expires = created + SOURCE_TTLS.get(source, DEFAULT_TTL)
+        if expires <= now:
+            _record(source, "expired")
+            return default
+        if created < oldest:
+            _record(source, "stale")
+            return default
+        _get_backend().touch(source, canonical, now)
+    except Exception as e:
+        print("Cache read failed:", e)
+        return default
+
+    _remember(source, key, payload, created, expires)
+    _record(source, "hit_disk")
+    return json.loads(payload)
+
+
+def set(source, key, value, aliases=()):
+    """Stores value under (source, key); each alias resolves to the same entry."""
+    global _writes
+    if not enabled():
+        return
+    key = normalize_key(key)
+    payload = json.dumps(value, ensure_ascii=False)
+    now = time.time()
+    expires = now + SOURCE_TTLS.get(source, DEFAULT_TTL)
+    alias_keys = [a for a in {normalize_key(a) for a in aliases} if a != key]
+
+    _remember(source, key, payload, now, expires)
+    for alias in alias_keys:
+        _remember(source, alias, payload, now, expires)
+
+    try:
+        _get_backend().write(source, key, payload, now, alias_keys)
+    except Exception as e:
+        print("Cache write failed:", e)
+        return
+
+    with _writes_lock:
+        _writes += 1
+        should_evict = _writes % EVICT_EVERY == 0
+    if should_evict:
+        evict()
+
+
+def evict(max_bytes=None):
+    """Drops expired entries, then least-recently-used ones until the store is under max_bytes."""
+    if max_bytes is None:
+        max_bytes = int(config.get("WIKIMENTOR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    try:
+        _get_backend().evict(SOURCE_TTLS, max_bytes, time.time())
+    except Exception as e:
+        print("Cache eviction failed:", e)
+
+
+def clear_memory():
+    with _memory_lock:
+        _memory.clear()
+
+
+def _is_useful(value):
+    if value is None:
+        return False
+    if isinstance(value, str) and value.startswith("⚠️"):
+        return False  # never persist upstream error messages
+    return True
+
+
+def cached(source, should_cache=_is_useful):
+    """
+    Framework-free replacement for @st.cache_data.
+    The first argument is normalized into the cache key; any further
+    arguments are appended so e.g. different deck sizes get their own entry.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(arg, *args, **kwargs):
+            key = arg
+            if args or kwargs:
+                extras = [repr(a) for a in args] + [f"{k}={v!r}" for k, v in sorted(kwargs.items())]
+                key = f"{arg}|" + "|".join(extras)
+            value = get(source, key)
+            if value is not None:
+                return value
+            value = fn(arg, *args, **kwargs)
+            if should_cache(value):
+                set(source, key, value)
+            return value
+        return wrapper
+    return decorator
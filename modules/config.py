@@ -0,0 +1,33 @@
+import os
+import threading
+
+# ⚙️ Settings come from the environment and a local .env file.
+# Modules read every setting through get(), which loads .env on its first call,
+# so .env applies however the modules are imported (UI, script, test or notebook)
+# and nothing has to load it up front. The modules the UI imports at startup
+# (pipeline, LLM engine, Wikipedia fetchers, cache and what they import) read
+# their settings when first needed, so importing them doesn't load python-dotenv;
+# the rest are read through get() when their module is imported.
+# Variables already set in the environment always win over the .env file.
+_loaded = False
+_lock = threading.Lock()
+
+
+def load():
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            try:
+                from dotenv import load_dotenv
+            except ImportError:
+                pass  # python-dotenv is optional; the process environment still works
+            else:
+                load_dotenv()
+            _loaded = True
+
+
+def get(name, default=None):
+    load()
+    return os.getenv(name, default)
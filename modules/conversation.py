@@ -0,0 +1,110 @@
+import re
+
+from modules import config
+
+# 💬 Multi-turn mentor chat context.
+# Every prompt carries background on the current topic (the article passages that
+# match the question, or else its summary), a digest of older turns and as
+# many recent turns as fit in a fixed token budget, so follow-up questions work while
+# the prompt size (and cost) stays flat however long the session runs.
+CHAT_CONTEXT_TOKENS = int(config.get("CHAT_CONTEXT_TOKENS", "1500"))
+CHAT_SUMMARY_TOKENS = int(config.get("CHAT_SUMMARY_TOKENS", "400"))
+CHAT_DIGEST_TOKENS = 150
+CHAT_MAX_TURNS = int(config.get("CHAT_MAX_TURNS", "50"))  # turns kept per session for display
+CHARS_PER_TOKEN = 4  # close enough for English text, and needs no tokenizer
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_tokens(text, tokens):
+    """Cuts text to about `tokens` tokens, on a word boundary."""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " …"
+
+
+class Conversation:
+    """
+    One learner's chat session. Stores at most max_turns [question, answer]
+    pairs (the shape Gradio's Chatbot expects) and builds a budgeted context
+    for the next question.
+    """
+
+    def __init__(self, topic=None, summary=None, max_turns=CHAT_MAX_TURNS, budget=CHAT_CONTEXT_TOKENS):
+        self.topic = topic
+        self.summary = summary
+        self.max_turns = max_turns
+        self.budget = budget
+        self.turns = []
+        self.earlier_questions = []  # questions of turns dropped from storage
+
+    def to_dict(self):
+        return {"topic": self.topic, "summary": self.summary, "turns": self.turns,
+                "earlier_questions": self.earlier_questions}
+
+    @classmethod
+    def from_dict(cls, data):
+        conversation = cls(data.get("topic"), data.get("summary"))
+        conversation.turns = [list(turn) for turn in data.get("turns", [])][-conversation.max_turns:]
+        conversation.earlier_questions = list(data.get("earlier_questions", []))
+        return conversation
+
+    def set_topic(self, topic, summary):
+        self.topic = topic
+        self.summary = summary
+
+    def is_empty(self):
+        return not self.topic and not self.turns
+
+    def add_turn(self, question, answer):
+        self.turns.append([question, answer])
+        while len(self.turns) > self.max_turns:
+            self.earlier_questions.append(self.turns.pop(0)[0])
+        # The digest only uses the most recent few, so don't let this grow either
+        del self.earlier_questions[:-self.max_turns]
+
+    def context(self, question, system, passages=()):
+        """
+        Returns (system, history) for the next call: system extended with the topic
+        background (passages retrieved for this question, else the summary) and a
+        digest of older questions, and history as a list of (role, content) pairs
+        holding the newest turns that fit in the budget.
+        """
+        parts = [system]
+        if self.topic:
+            background = f"The learner is studying: {self.topic}."
+            if passages:
+                background += "\nRelevant passages from the Wikipedia article:\n" + "\n\n".join(passages)
+            elif self.summary:
+                background += f"\nBackground from Wikipedia:\n{truncate_tokens(self.summary, CHAT_SUMMARY_TOKENS)}"
+            parts.append(background)
+
+        usable = [t for t in self.turns if t[1] and not t[1].startswith("⚠️")]
+        remaining = self.budget - estimate_tokens(question) - sum(estimate_tokens(p) for p in parts) - CHAT_DIGEST_TOKENS
+        kept = []
+        for turn_question, answer in reversed(usable):
+            cost = estimate_tokens(turn_question) + estimate_tokens(answer)
+            if cost > remaining:
+                # A long latest answer is shortened rather than dropped, so "why?" still has a referent
+                answer_budget = remaining - estimate_tokens(turn_question)
+                if not kept and answer_budget > 50:
+                    kept.append((turn_question, truncate_tokens(answer, answer_budget)))
+                break
+            kept.append((turn_question, answer))
+            remaining -= cost
+        kept.reverse()
+
+        # Turns that no longer fit are summarized by the questions they asked
+        trimmed = self.earlier_questions + [q for q, _ in usable[:len(usable) - len(kept)]]
+        if trimmed:
+            digest = "; ".join(re.sub(r"\s+", " ", q).strip() for q in reversed(trimmed))
+            parts.append(f"Earlier in this conversation the learner asked (newest first): "
+                         f"{truncate_tokens(digest, CHAT_DIGEST_TOKENS)}")
+
+        history = []
+        for turn_question, answer in kept:
+            history += [("user", turn_question), ("assistant", answer)]
+        return "\n\n".join(parts), history
@@ -0,0 +1,279 @@
+import hashlib
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from modules import config, sqlite_db
+from modules.cache import normalize_key
+
+# 🗂️ Persistent flashcard decks with SM-2 spaced repetition.
+# Every card a learner has been given is kept in SQLite with its schedule. An
+# in-memory heap per learner, keyed on next-review time, serves "next due card" in
+# O(log n), so reviews never touch the LLM and never load the whole deck.
+DECK_DB_PATH = config.get("WIKIMENTOR_DECK_DB", os.path.join(".cache", "decks.sqlite3"))
+QUEUE_CACHE_USERS = 512  # learners whose due-queues are kept in memory
+
+MINUTE = 60
+DAY = 24 * 60 * MINUTE
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+RELEARN_DELAY = 10 * MINUTE  # a forgotten card comes back later in the same session
+GRADES = {"again": 1, "hard": 3, "good": 4, "easy": 5}  # SM-2 quality, 0-5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    user TEXT NOT NULL,
+    card_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    title TEXT,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    ease REAL NOT NULL,
+    interval REAL NOT NULL,
+    repetitions INTEGER NOT NULL,
+    lapses INTEGER NOT NULL,
+    due REAL NOT NULL,
+    reviewed REAL,
+    created REAL NOT NULL,
+    PRIMARY KEY (user, card_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cards_due ON cards (user, due);
+CREATE INDEX IF NOT EXISTS cards_topic ON cards (user, topic);
+CREATE TABLE IF NOT EXISTS decks (
+    user TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+_CARD_COLUMNS = "card_id, topic, title, question, answer, ease, interval, repetitions, lapses, due, reviewed"
+
+
+def _migrate(conn):
+    if "title" not in {row[1] for row in conn.execute("PRAGMA table_info(cards)")}:
+        conn.execute("ALTER TABLE cards ADD COLUMN title TEXT")  # decks created before display titles
+
+
+def card_id(topic, question):
+    text = normalize_key(topic) + "\n" + " ".join(question.casefold().split())
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def schedule(card, grade, now):
+    """
+    SM-2: returns the card's new (ease, interval in days, repetitions, lapses, due)
+    after a review graded 0-5. Grades below 3 restart the card.
+    """
+    ease, interval, repetitions, lapses = card["ease"], card["interval"], card["repetitions"], card["lapses"]
+    ease = max(MIN_EASE, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    if grade < 3:
+        return ease, 0.0, 0, lapses + 1, now + RELEARN_DELAY
+    repetitions += 1
+    if repetitions == 1:
+        interval = 1.0
+    elif repetitions == 2:
+        interval = 6.0
+    else:
+        interval = round(interval * ease, 2)
+    return ease, interval, repetitions, lapses, now + interval * DAY
+
+
+class DueQueue:
+    """
+    Min-heap of (due, card_id) with lazy deletion: rescheduling pushes a new entry
+    and stale ones are skipped when they reach the top.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.due = dict(rows)
+        self.heap = [(due, cid) for cid, due in self.due.items()]
+        heapq.heapify(self.heap)
+
+    def push(self, cid, due):
+        self.due[cid] = due
+        heapq.heappush(self.heap, (due, cid))
+        if len(self.heap) > 2 * len(self.due) + 64:
+            self.heap = [(d, c) for c, d in self.due.items()]
+            heapq.heapify(self.heap)
+
+    def peek(self):
+        """(due, card_id) of the card due soonest, or None for an empty deck."""
+        while self.heap:
+            due, cid = self.heap[0]
+            if self.due.get(cid) == due:
+                return due, cid
+            heapq.heappop(self.heap)
+        return None
+
+
+class DeckStore:
+    def __init__(self, path=DECK_DB_PATH):
+        self.path = path
+        self._connection = sqlite_db.LocalConnection(path, _SCHEMA, row_factory=sqlite3.Row, setup=_migrate,
+                                                     synchronous="NORMAL")
+        self._lock = threading.RLock()
+        self._queues = OrderedDict()  # user -> DueQueue
+
+    def _version(self, conn, user):
+        row = conn.execute("SELECT version FROM decks WHERE user = ?", (user,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump(self, conn, user):
+        """Marks the deck changed inside the current transaction; returns (old, new) version."""
+        old = self._version(conn, user)
+        conn.execute("INSERT OR REPLACE INTO decks (user, version) VALUES (?, ?)", (user, old + 1))
+        return old, old + 1
+
+    def _queue(self, conn, user):
+        """
+        The learner's due-queue, rebuilt from the store only when another process
+        (e.g. another worker) changed the deck since it was loaded.
+        """
+        version = self._version(conn, user)
+        queue = self._queues.get(user)
+        if queue is None or queue.version != version:
+            rows = conn.execute("SELECT card_id, due FROM cards WHERE user = ?", (user,)).fetchall()
+            queue = DueQueue(version, [(r[0], r[1]) for r in rows])
+            self._queues[user] = queue
+        self._queues.move_to_end(user)
+        while len(self._queues) > QUEUE_CACHE_USERS:
+            self._queues.popitem(last=False)
+        return queue
+
+    def _apply(self, user, old, new, updates):
+        """Mirrors a committed change into the cached queue, or drops it if it is out of date."""
+        queue = self._queues.get(user)
+        if queue is None:
+            return
+        if queue.version != old:
+            del self._queues[user]
+            return
+        for cid, due in updates:
+            queue.push(cid, due)
+        queue.version = new
+
+    def add_cards(self, user, topic, cards, now=None):
+        """
+        Adds cards that are new to the learner (due immediately); returns how many were new.
+        Cards are keyed on the normalized topic; the topic as given is kept for display.
+        """
+        now = time.time() if now is None else now
+        rows = {}
+        for c in cards:
+            # Questions that differ only in case or spacing are the same card; the first one is kept
+            cid = card_id(topic, c["question"])
+            rows.setdefault(cid, (user, cid, normalize_key(topic), topic, c["question"], c["answer"],
+                                  DEFAULT_EASE, 0.0, 0, 0, now, None, now))
+        rows = list(rows.values())
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                existing = {r[0] for r in conn.execute(
+                    f"SELECT card_id FROM cards WHERE user = ? AND card_id IN ({','.join('?' * len(rows))})",
+                    [user] + [r[1] for r in rows])} if rows else set()
+                fresh = [r for r in rows if r[1] not in existing]
+                if not fresh:
+                    return 0
+                conn.executemany(
+                    "INSERT INTO cards (user, card_id, topic, title, question, answer, ease, interval, repetitions, "
+                    "lapses, due, reviewed, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", fresh)
+                old, new = self._bump(conn, user)
+            self._apply(user, old, new, [(r[1], now) for r in fresh])
+        return len(fresh)
+
+    def topic_cards(self, user, topic):
+        rows = self._connection().execute(
+            f"SELECT {_CARD_COLUMNS} FROM cards WHERE user = ? AND topic = ? ORDER BY created, card_id",
+            (user, normalize_key(topic))
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def get_card(self, user, cid):
+        row = self._connection().execute(f"SELECT {_CARD_COLUMNS} FROM cards WHERE user = ? AND card_id = ?",
+                                         (user, cid)).fetchone()
+        return dict(row) if row else None
+
+    def next_due(self, user, now=None):
+        """The card due soonest if it is due by now, else None. O(log n) amortized."""
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connection()
+            top = self._queue(conn, user).peek()
+            if top is None or top[0] > now:
+                return None
+            row = conn.execute(f"SELECT {_CARD_COLUMNS} FROM cards WHERE user = ? AND card_id = ?",
+                               (user, top[1])).fetchone()
+        return dict(row) if row else None
+
+    def review(self, user, cid, grade, now=None):
+        """Records a review (grade 0-5, or a GRADES name) and reschedules the card; returns the updated card."""
+        now = time.time() if now is None else now
+        grade = GRADES.get(grade, grade)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(f"SELECT {_CARD_COLUMNS} FROM cards WHERE user = ? AND card_id = ?",
+                                   (user, cid)).fetchone()
+                if row is None:
+                    return None
+                card = dict(row)
+                ease, interval, repetitions, lapses, due = schedule(card, grade, now)
+                conn.execute(
+                    "UPDATE cards SET ease = ?, interval = ?, repetitions = ?, lapses = ?, due = ?, reviewed = ? "
+                    "WHERE user = ? AND card_id = ?",
+                    (ease, interval, repetitions, lapses, due, now, user, cid))
+                old, new = self._bump(conn, user)
+            self._apply(user, old, new, [(cid, due)])
+        card.update(ease=ease, interval=interval, repetitions=repetitions, lapses=lapses, due=due, reviewed=now)
+        return card
+
+    def stats(self, user, now=None):
+        """Due and total card counts plus when the next card is due (index range scans, no full load)."""
+        now = time.time() if now is None else now
+        conn = self._connection()
+        due = conn.execute("SELECT COUNT(*) FROM cards WHERE user = ? AND due <= ?", (user, now)).fetchone()[0]
+        total = conn.execute("SELECT COUNT(*) FROM cards WHERE user = ?", (user,)).fetchone()[0]
+        upcoming = conn.execute("SELECT MIN(due) FROM cards WHERE user = ? AND due > ?", (user, now)).fetchone()[0]
+        return {"due": due, "total": total, "next_due": upcoming}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DeckStore()
+    return _store
+
+
+def add_cards(user, topic, cards):
+    return get_store().add_cards(user, topic, cards)
+
+
+def topic_cards(user, topic):
+    return get_store().topic_cards(user, topic)
+
+
+def get_card(user, cid):
+    return get_store().get_card(user, cid)
+
+
+def next_due(user):
+    return get_store().next_due(user)
+
+
+def review(user, cid, grade):
+    return get_store().review(user, cid, grade)
+
+
+def stats(user):
+    return get_store().stats(user)
@@ -0,0 +1,95 @@
+import threading
+import time
+
+# 🚦 Liveness and readiness for load balancers.
+# The health endpoint comes up before the expensive parts of the app are loaded;
+# warm_up() loads them on a background thread, and /ready only returns 200 once that
+# is done and the UI server accepts connections, so no learner pays for a cold start.
+_ready = threading.Event()
+_serving = threading.Event()
+_started = time.time()
+_steps = {}  # warm-up step -> seconds, or the error it raised
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def _load_pipeline():
+    from modules import pipeline  # noqa: F401 -- wiki fetchers, LLM client and their dependencies
+
+
+def _open_http_pool():
+    from modules import http_client
+    http_client.get_session()
+
+
+def _load_semantic_cache():
+    from modules import semantic_cache
+    if semantic_cache.SEMANTIC_CACHE_ENABLED:
+        semantic_cache.get_cache()
+
+
+def _open_session_store():
+    from modules import session_store
+    session_store.get_store()
+
+
+def _open_decks():
+    from modules import decks
+    decks.get_store()._connection()
+
+
+def _load_llm_providers():
+    from modules import llm_providers
+    llm_providers.get_router()
+
+
+def _load_title_index():
+    from modules import topics
+    topics.get_index()
+
+
+WARM_UP_STEPS = (
+    ("pipeline", _load_pipeline),
+    ("http_pool", _open_http_pool),
+    ("semantic_cache", _load_semantic_cache),
+    ("session_store", _open_session_store),
+    ("decks", _open_decks),
+    ("title_index", _load_title_index),
+    ("llm_providers", _load_llm_providers),
+)
+
+
+def warm_up():
+    """Runs every warm-up step once, then marks this process ready. Failed steps are recorded, not fatal."""
+    for name, step in WARM_UP_STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+            _steps[name] = round(time.perf_counter() - start, 4)
+        except Exception as e:
+            print(f"⚠️ Warm-up step {name} failed:", e)
+            _steps[name] = f"error: {e}"
+    _ready.set()
+    print(f"✅ Ready {time.time() - _started:.2f}s after start")
+
+
+def start_warm_up():
+    """Starts warm_up() on a daemon thread; later calls are no-ops."""
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+            _warm_up_thread.start()
+
+
+def mark_serving():
+    """Called by the entry point once its web server accepts connections."""
+    _serving.set()
+
+
+def is_ready():
+    return _ready.is_set() and _serving.is_set()
+
+
+def status():
+    return {"ready": is_ready(), "serving": _serving.is_set(), "uptime": round(time.time() - _started, 3), "warm_up": dict(_steps)}
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from modules import config, metrics
+
+# One pooled, keep-alive session shared by every fetcher and the LLM client.
+# Timeouts (HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT), retries and the pool size
+# can be tuned per deployment; they are read when first needed.
+POOL_HOSTS = 10  # wikipedia, wikidata, wikibooks, wikiversity, groq + headroom
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Wikimedia asks API clients to identify themselves
+USER_AGENT = "WikiMentor/1.0 (https://github.com/PRB18/wikimentor)"
+
+
+def parse_rate_limits(spec):
+    """'en.wikipedia.org=10,*=5' -> {'en.wikipedia.org': 10.0, '*': 5.0} (requests per second)"""
+    limits = {}
+    for part in filter(None, (spec or "").split(",")):
+        host, _, rate = part.partition("=")
+        limits[host.strip()] = float(rate)
+    return limits
+
+
+def timeouts():
+    """Default (connect, read) timeouts in seconds."""
+    return float(config.get("HTTP_CONNECT_TIMEOUT", "3.05")), float(config.get("HTTP_READ_TIMEOUT", "15"))
+
+
+def max_retries():
+    return int(config.get("HTTP_MAX_RETRIES", "3"))
+
+
+# Optional per-host request rates; "*" applies to every host without its own entry.
+# Filled from HTTP_HOST_RATE_LIMITS on first use.
+_host_rate_limits = None
+_session = None
+_session_lock = threading.Lock()
+_next_slot = {}  # host -> earliest time the next request may start
+_rate_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # requests is imported here so importing the fetchers doesn't pay for it
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # Retries are handled below so we can add jitter and honour Retry-After
+                pool_maxsize = int(config.get("HTTP_POOL_MAXSIZE", "32"))
+                adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_maxsize, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "User-Agent": USER_AGENT,
+                    "Accept-Encoding": "gzip, deflate",
+                    "Connection": "keep-alive"
+                })
+                _session = session
+    return _session
+
+
+def _rate_limits():
+    # Callers hold _rate_lock
+    global _host_rate_limits
+    if _host_rate_limits is None:
+        _host_rate_limits = parse_rate_limits(config.get("HTTP_HOST_RATE_LIMITS", ""))
+    return _host_rate_limits
+
+
+def set_rate_limit(host, per_second):
+    """Caps requests to host (or "*" for all hosts) at per_second; None or 0 removes the cap."""
+    with _rate_lock:
+        if per_second:
+            _rate_limits()[host] = float(per_second)
+        else:
+            _rate_limits().pop(host, None)
+
+
+def _throttle(host):
+    """Spaces requests to one host evenly; waiting callers are served in arrival order."""
+    with _rate_lock:
+        limits = _rate_limits()
+        rate = limits.get(host, limits.get("*"))
+        if not rate:
+            return
+        now = time.monotonic()
+        start = max(now, _next_slot.get(host, now))
+        _next_slot[host] = start + 1.0 / rate
+    if start > now:
+        time.sleep(start - now)
+
+
+def _backoff(attempt, response=None):
+    """Full-jitter exponential backoff, capped, preferring the server's Retry-After."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _response_bytes(response, streamed):
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return int(length)
+    # Reading .content would consume a streamed body, so those are only counted via the header
+    return 0 if streamed else len(response.content)
+
+
+def request(method, url, timeout=None, retries=None, **kwargs):
+    """
+    Sends a request through the shared session.
+    Connection errors, timeouts and 429/5xx responses are retried (by default
+    HTTP_MAX_RETRIES times) with jittered backoff; the last response (or
+    exception) is returned (or raised) as-is.
+    """
+    import requests
+    if timeout is None:
+        timeout = timeouts()
+    if retries is None:
+        retries = max_retries()
+    session = get_session()
+    host = urlparse(url).hostname or "unknown"
+    start = time.perf_counter()
+    for attempt in range(retries + 1):
+        _throttle(host)
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            reason = "timeout" if isinstance(e, requests.Timeout) else "connection"
+            if attempt == retries:
+                metrics.inc("wikimentor_upstream_requests_total", host=host, status=reason)
+                metrics.observe("wikimentor_upstream_seconds", time.perf_counter() - start, host=host)
+                raise
+            metrics.inc("wikimentor_upstream_retries_total", host=host, reason=reason)
+            time.sleep(_backoff(attempt))
+            continue
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            metrics.inc("wikimentor_upstream_retries_total", host=host, reason=str(response.status_code))
+            delay = _backoff(attempt, response)
+            response.close()
+            time.sleep(delay)
+            continue
+        metrics.inc("wikimentor_upstream_requests_total", host=host, status=response.status_code)
+        metrics.inc("wikimentor_upstream_bytes_total", _response_bytes(response, kwargs.get("stream", False)), host=host)
+        metrics.observe("wikimentor_upstream_seconds", time.perf_counter() - start, host=host)
+        return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
@@ -0,0 +1,400 @@
+import contextvars
+import json
+import math
+import queue
+import threading
+import time
+from collections import deque
+
+from modules import config, http_client, metrics
+
+# 🔀 Pluggable LLM providers.
+# Every provider speaks the OpenAI chat-completions API (Groq, Hugging Face's router,
+# a local llama.cpp / Ollama / vLLM server, ...). Each request goes to the provider
+# with the lowest rolling p95 latency, scaled up by its recent error rate. A request
+# still waiting at the hedge deadline is also sent to the next provider and the first
+# answer wins; a provider that fails is replaced by the next one right away; and a
+# provider that keeps failing is skipped until its circuit breaker lets a trial call
+# through. One slow or rate-limited provider then costs at most the hedge deadline.
+GROQ_DEFAULT_URL = "https://api.groq.com/openai/v1/chat/completions"
+HF_DEFAULT_URL = "https://router.huggingface.co/v1/chat/completions"
+DEFAULT_MODEL = "llama3-8b-8192"
+
+# name -> (settings prefix, default URL, default model). {PREFIX}_URL, {PREFIX}_API_KEY
+# and {PREFIX}_MODEL override them; other names in LLM_PROVIDERS use NAME_URL etc.
+KNOWN_PROVIDERS = {
+    "groq": ("GROQ", GROQ_DEFAULT_URL, DEFAULT_MODEL),
+    "huggingface": ("HF", HF_DEFAULT_URL, "meta-llama/Meta-Llama-3-8B-Instruct"),
+    "local": ("LOCAL_LLM", None, "local"),  # no key needed; enabled by LOCAL_LLM_URL
+}
+DEFAULT_PROVIDERS = "groq,huggingface,local"  # also the preference order before any calls are measured
+
+HEDGE_MIN = 0.5
+HEDGE_MAX = 10.0
+STATS_WINDOW = 100  # recent calls per provider and kind (complete / stream)
+STATS_MAX_AGE = 300  # seconds; older calls stop counting, so a recovered provider gets traffic back
+PRIOR_LATENCY = 2.0  # assumed p95 of a provider without recent calls
+ERROR_PENALTY = 4.0  # score = p95 * (1 + ERROR_PENALTY * error rate)
+
+
+class LLMUnavailable(Exception):
+    """No provider answered. api_error is True when at least one replied with an HTTP error."""
+
+    def __init__(self, message, api_error=False):
+        super().__init__(message)
+        self.api_error = api_error
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+class Provider:
+    """One OpenAI-compatible endpoint and its rolling health: recent latencies, errors and a circuit breaker."""
+
+    def __init__(self, name, url, model, api_key=None):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        # Completions take longer than wiki lookups, so they get their own read timeout
+        self.read_timeout = float(config.get("LLM_READ_TIMEOUT", "60"))
+        self.breaker_failures = int(config.get("LLM_BREAKER_FAILURES", "5"))  # consecutive failures that open the circuit
+        self.breaker_cooldown = float(config.get("LLM_BREAKER_COOLDOWN", "30"))
+        self.calls = {"complete": deque(maxlen=STATS_WINDOW), "stream": deque(maxlen=STATS_WINDOW)}  # (at, seconds, failed)
+        self.failures = 0  # consecutive
+        self.open_until = 0.0  # 0 while the circuit is closed
+        self.probing = False  # a half-open trial call is in flight
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Provider({self.name!r}, {self.model!r})"
+
+    def available(self, now):
+        """Closed, or open past its cooldown with no trial call in flight yet."""
+        return self.open_until == 0 or (now >= self.open_until and not self.probing)
+
+    def begin(self):
+        """Claims a call: always while closed, the single trial call when half-open, never while open."""
+        now = time.monotonic()
+        with self._lock:
+            if self.open_until == 0:
+                return True
+            if now < self.open_until or self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, kind, seconds, failed=False, cancelled=False):
+        """
+        Adds a finished call to the rolling stats. Failures count toward the breaker;
+        a call we cancelled (a hedge another provider won, or a stream the learner
+        closed) only adds its latency.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.calls[kind].append((now, seconds, failed))
+            if cancelled:
+                self.probing = False
+            elif failed:
+                self.failures += 1
+                if self.probing or self.failures >= self.breaker_failures:
+                    if self.open_until == 0 or self.probing:
+                        print(f"⚠️ LLM provider {self.name} failed {self.failures} times; pausing it for {self.breaker_cooldown:.0f}s")
+                        metrics.inc("wikimentor_llm_circuit_opens_total", provider=self.name)
+                    self.open_until = now + self.breaker_cooldown
+                self.probing = False
+            else:
+                self.failures = 0
+                self.open_until = 0.0
+                self.probing = False
+        outcome = "cancelled" if cancelled else "error" if failed else "ok"
+        metrics.inc("wikimentor_llm_requests_total", provider=self.name, kind=kind, outcome=outcome)
+        metrics.observe("wikimentor_llm_seconds", seconds, provider=self.name, kind=kind)
+
+    def p95(self, kind, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            latencies = [s for at, s, _ in self.calls[kind] if now - at <= STATS_MAX_AGE]
+        return percentile(latencies, 95) if latencies else PRIOR_LATENCY
+
+    def error_rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            outcomes = [failed for calls in self.calls.values() for at, _, failed in calls if now - at <= STATS_MAX_AGE]
+        return sum(outcomes) / len(outcomes) if outcomes else 0.0
+
+    def score(self, kind, now=None):
+        """Expected tail latency: lower is better."""
+        return self.p95(kind, now) * (1 + ERROR_PENALTY * self.error_rate(now))
+
+    def post(self, payload, stream=False, retries=None):
+        connect_timeout, _ = http_client.timeouts()
+        return http_client.post(self.url, headers=self.headers, json=dict(payload, model=self.model), stream=stream,
+                                timeout=(connect_timeout, self.read_timeout), retries=retries)
+
+    def deadline(self):
+        """When a call started now should have answered."""
+        connect_timeout, _ = http_client.timeouts()
+        return time.monotonic() + connect_timeout + self.read_timeout
+
+    def complete(self, payload, retries=None):
+        """One non-streaming call: (text, None) or (None, (error, api_error)). Recorded in the stats."""
+        start = time.perf_counter()
+        failed = True
+        try:
+            res = self.post(payload, retries=retries)
+            if res.status_code != 200:
+                return None, (f"{self.name} HTTP {res.status_code}: {res.text[:200]}", True)
+            data = res.json()
+            text = data["choices"][0]["message"]["content"]
+            record_usage(self, data.get("usage"))
+            failed = False
+            return text, None
+        except Exception as e:
+            return None, (f"{self.name}: {e}", False)
+        finally:
+            self.record("complete", time.perf_counter() - start, failed)
+
+
+def record_usage(provider, usage):
+    """Counts tokens from an OpenAI-style usage object, when the provider sends one."""
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            metrics.inc("wikimentor_llm_tokens_total", tokens, kind=kind, model=provider.model, provider=provider.name)
+
+
+class Router:
+    """Sends each completion to the healthiest providers, hedging and failing over between them."""
+
+    def __init__(self, providers, hedge_after=0.0):
+        self.providers = list(providers)
+        self.hedge_after = hedge_after  # seconds; 0 hedges at the primary's rolling p95
+        # With a single provider the HTTP client's own retries (None: HTTP_MAX_RETRIES)
+        # are the only fallback; with several, failing over is faster than backing off
+        self.retries = None if len(self.providers) == 1 else 0
+
+    def ranked(self, kind):
+        """Available providers, best score first; ties keep the configured order."""
+        now = time.monotonic()
+        order = {provider.name: i for i, provider in enumerate(self.providers)}
+        ready = [provider for provider in self.providers if provider.available(now)]
+        return sorted(ready, key=lambda provider: (provider.score(kind, now), order[provider.name]))
+
+    def hedge_delay(self, provider, kind):
+        if self.hedge_after > 0:
+            return self.hedge_after
+        return min(HEDGE_MAX, max(HEDGE_MIN, provider.p95(kind)))
+
+    def _launch(self, candidates, target, *args):
+        """Starts target(provider, *args) on a thread for the first candidate that accepts a call."""
+        while candidates:
+            provider = candidates.pop(0)
+            if provider.begin():
+                # The caller's context goes along so metrics land in its trace
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(target, provider) + args,
+                                 name=f"llm-{provider.name}", daemon=True).start()
+                return provider
+        return None
+
+    def _unavailable(self, errors):
+        if not errors:
+            return LLMUnavailable("no LLM provider is available (every circuit is open)")
+        return LLMUnavailable("; ".join(message for message, _ in errors), any(api for _, api in errors))
+
+    def complete(self, payload):
+        """
+        The completion text from the best provider. If it hasn't answered by the hedge
+        deadline the request also goes to the next provider and the first answer wins.
+        At most two calls are in flight per request, and each call, failovers included,
+        gets its provider's full timeout from when it starts.
+        """
+        candidates = self.ranked("complete")
+        results = queue.Queue()
+        errors = []
+
+        def attempt(provider):
+            results.put(provider.complete(payload, self.retries))
+
+        current = self._launch(candidates, attempt)
+        if current is None:
+            raise self._unavailable(errors)
+        in_flight, hedged = 1, False
+        hedge_at = time.monotonic() + self.hedge_delay(current, "complete")
+        deadline = current.deadline()
+        while in_flight:
+            waiting_to_hedge = not hedged and candidates
+            wait_until = hedge_at if waiting_to_hedge else deadline
+            try:
+                text, error = results.get(timeout=max(0.0, wait_until - time.monotonic()))
+            except queue.Empty:
+                if not waiting_to_hedge:
+                    errors.append(("timed out", False))
+                    break
+                hedged = True
+                hedge = self._launch(candidates, attempt)
+                if hedge is not None:
+                    in_flight += 1
+                    deadline = max(deadline, hedge.deadline())
+                    metrics.inc("wikimentor_llm_hedges_total", provider=current.name)
+                continue
+            in_flight -= 1
+            if error is None:
+                return text
+            errors.append(error)
+            current = self._launch(candidates, attempt)  # fail over straight away
+            if current is not None:
+                in_flight += 1
+                hedge_at = time.monotonic() + self.hedge_delay(current, "complete")
+                deadline = max(deadline, current.deadline())
+        raise self._unavailable(errors)
+
+    def _stream_into(self, provider, payload, events, cancel):
+        """Streams one provider's deltas into events as (provider, kind, value) until done, failed or cancelled."""
+        start = time.perf_counter()
+        first_token = None
+        failed = True
+        stopped = False  # the consumer closed the stream or another provider won the hedge
+        try:
+            res = provider.post(dict(payload, stream=True), stream=True, retries=self.retries)
+            with res:
+                if res.status_code != 200:
+                    events.put((provider, "error", (f"{provider.name} HTTP {res.status_code}: {res.text[:200]}", True)))
+                    return
+                res.encoding = "utf-8"  # SSE responses often omit the charset
+                for line in res.iter_lines(decode_unicode=True):
+                    if cancel.is_set():
+                        stopped = True
+                        return
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    # Groq reports usage on the last chunk under x_groq; OpenAI-style servers use "usage"
+                    record_usage(provider, chunk.get("usage") or chunk.get("x_groq", {}).get("usage"))
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        events.put((provider, "delta", delta))
+            failed = False
+            events.put((provider, "done", None))
+        except Exception as e:
+            events.put((provider, "error", (f"{provider.name}: {e}", False)))
+        finally:
+            # Streams are ranked by time to first token, which is what hedging acts on
+            elapsed = first_token if first_token is not None else time.perf_counter() - start
+            # Being stopped by our side says nothing about the provider's health, so only
+            # errors it raised on its own count toward the breaker
+            cancelled = stopped or (failed and cancel.is_set())
+            provider.record("stream", elapsed, failed and not cancelled, cancelled)
+
+    def stream(self, payload):
+        """
+        Yields text deltas from the best provider. Hedging and failover happen until
+        the first delta arrives, each call getting its provider's full timeout from
+        when it starts; after that the whole answer comes from that provider.
+        """
+        candidates = self.ranked("stream")
+        events = queue.Queue()
+        cancels = {}  # provider name -> Event that stops its stream
+        errors = []
+
+        def launch():
+            cancel = threading.Event()
+            provider = self._launch(candidates, self._stream_into, payload, events, cancel)
+            if provider is not None:
+                cancels[provider.name] = cancel
+            return provider
+
+        current = launch()
+        if current is None:
+            raise self._unavailable(errors)
+        in_flight, hedged, winner = 1, False, None
+        hedge_at = time.monotonic() + self.hedge_delay(current, "stream")
+        deadline = current.deadline()
+        try:
+            while True:
+                waiting_to_hedge = winner is None and not hedged and candidates
+                wait_until = hedge_at if waiting_to_hedge else deadline
+                try:
+                    provider, kind, value = events.get(timeout=max(0.0, wait_until - time.monotonic()))
+                except queue.Empty:
+                    if not waiting_to_hedge:
+                        errors.append(("timed out", False))
+                        raise self._unavailable(errors)
+                    hedged = True
+                    hedge = launch()
+                    if hedge is not None:
+                        in_flight += 1
+                        deadline = max(deadline, hedge.deadline())
+                        metrics.inc("wikimentor_llm_hedges_total", provider=current.name)
+                    continue
+                if winner is not None and provider is not winner:
+                    continue
+                if kind == "error":
+                    errors.append(value)
+                    if winner is not None:
+                        raise self._unavailable(errors)  # failed mid-answer; nothing to fail over to
+                    in_flight -= 1
+                    current = launch()
+                    if current is not None:
+                        in_flight += 1
+                        hedge_at = time.monotonic() + self.hedge_delay(current, "stream")
+                        deadline = max(deadline, current.deadline())
+                    elif not in_flight:
+                        raise self._unavailable(errors)
+                    continue
+                if winner is None:
+                    winner = provider
+                    for name, cancel in cancels.items():
+                        if name != provider.name:
+                            cancel.set()
+                if kind == "done":
+                    return
+                deadline = time.monotonic() + winner.read_timeout  # the gap allowed between deltas
+                yield value
+        finally:
+            for cancel in cancels.values():
+                cancel.set()
+
+
+def _build_providers():
+    providers = []
+    for name in filter(None, (n.strip() for n in config.get("LLM_PROVIDERS", DEFAULT_PROVIDERS).split(","))):
+        prefix, default_url, default_model = KNOWN_PROVIDERS.get(name, (name.upper(), None, DEFAULT_MODEL))
+        url = config.get(f"{prefix}_URL", default_url)
+        api_key = config.get(f"{prefix}_API_KEY") or (config.get("HF_TOKEN") if prefix == "HF" else None)
+        # Hosted providers need a key; self-hosted ones only need their URL
+        if url and (api_key or not default_url):
+            providers.append(Provider(name, url, config.get(f"{prefix}_MODEL", default_model), api_key))
+    if not providers:
+        # Nothing configured: keep Groq so errors point at its missing key
+        providers.append(Provider("groq", config.get("GROQ_URL", GROQ_DEFAULT_URL),
+                                  config.get("GROQ_MODEL", DEFAULT_MODEL), config.get("GROQ_API_KEY")))
+    return providers
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """The process-wide router, built from the environment/.env on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = Router(_build_providers(), float(config.get("LLM_HEDGE_AFTER", "0")))
+                print("🔀 LLM providers:", ", ".join(f"{p.name} ({p.model})" for p in _router.providers))
+    return _router
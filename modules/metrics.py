@@ -0,0 +1,254 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from modules import config
+
+# 📈 Dependency-free metrics: counters and histograms exported in the Prometheus
+# text format, plus an optional JSON-lines trace with one line per UI action.
+# METRICS_PORT (0 disables the endpoint) and WIKIMENTOR_TRACE_LOG (unset disables
+# tracing) are read when used.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_HELP = {
+    "wikimentor_action_seconds": ("histogram", "Duration of UI actions."),
+    "wikimentor_action_first_output_seconds": ("histogram", "Time until a streaming UI action yields its first output."),
+    "wikimentor_stage_seconds": ("histogram", "Duration of pipeline stages."),
+    "wikimentor_upstream_seconds": ("histogram", "Duration of upstream HTTP requests, including retries."),
+    "wikimentor_upstream_requests_total": ("counter", "Upstream HTTP requests by host and final status."),
+    "wikimentor_upstream_retries_total": ("counter", "Upstream HTTP retries by host and reason."),
+    "wikimentor_upstream_bytes_total": ("counter", "Bytes received from upstreams."),
+    "wikimentor_cache_requests_total": ("counter", "Response cache lookups by source and result."),
+    "wikimentor_llm_tokens_total": ("counter", "LLM tokens reported by the provider's usage field."),
+    "wikimentor_llm_requests_total": ("counter", "LLM provider calls by provider, kind and outcome (ok, error, cancelled)."),
+    "wikimentor_llm_seconds": ("histogram", "LLM provider call duration (time to first token for streams)."),
+    "wikimentor_llm_hedges_total": ("counter", "LLM requests also sent to a second provider after the hedge deadline."),
+    "wikimentor_llm_circuit_opens_total": ("counter", "Times an LLM provider's circuit breaker opened."),
+    "wikimentor_topic_resolutions_total": ("counter", "Topic resolutions by outcome (ok, disambiguation, missing)."),
+    "wikimentor_retrieval_tokens_total": ("counter", "Estimated tokens in retrieved-from articles vs. sent to the LLM."),
+}
+
+_lock = threading.Lock()
+_counters = {}     # (name, labels) -> value
+_histograms = {}   # (name, labels) -> [bucket counts..., overflow, sum, count]
+_current_trace = contextvars.ContextVar("wikimentor_trace", default=None)
+_trace_lock = threading.Lock()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+        hist[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        hist[-2] += value
+        hist[-1] += 1
+    span(name, value, **labels)
+
+
+def span(name, duration, **attrs):
+    """Adds a span to the current request's trace, if one is being recorded."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["spans"].append({"name": name, "ms": round(duration * 1000, 2), **attrs})
+
+
+def annotate(**attrs):
+    """Adds attributes (e.g. cache=hit) to the current trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["spans"].append({"name": "event", **attrs})
+
+
+@contextmanager
+def timed(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def _new_trace(action):
+    return {"trace_id": uuid.uuid4().hex, "action": action, "start": time.time(), "spans": []}
+
+
+def _trace_log_path():
+    return config.get("WIKIMENTOR_TRACE_LOG")
+
+
+def _write_trace(record, duration):
+    record["ms"] = round(duration * 1000, 2)
+    path = _trace_log_path()
+    if not path:
+        return
+    with _trace_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@contextmanager
+def trace(action):
+    """Records every span produced inside the block as one JSON line in the trace log."""
+    if not _trace_log_path() or _current_trace.get() is not None:
+        yield
+        return
+    record = _new_trace(action)
+    token = _current_trace.set(record)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+        _write_trace(record, time.perf_counter() - start)
+
+
+def instrument_action(action):
+    """
+    Decorator for UI handlers: records duration (and time to first output for
+    generators) and wraps the call in a trace.
+    """
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                # Frameworks may resume a generator on different threads, so every
+                # step runs inside one private context that carries the trace
+                context = contextvars.copy_context()
+                record = None
+                if _trace_log_path() and _current_trace.get() is None:
+                    record = _new_trace(action)
+                    context.run(_current_trace.set, record)
+                start = time.perf_counter()
+                steps = context.run(fn, *args, **kwargs)
+                first = True
+                try:
+                    while True:
+                        try:
+                            item = context.run(next, steps)
+                        except StopIteration:
+                            return
+                        if first:
+                            context.run(observe, "wikimentor_action_first_output_seconds", time.perf_counter() - start, action=action)
+                            first = False
+                        yield item
+                finally:
+                    context.run(steps.close)
+                    duration = time.perf_counter() - start
+                    context.run(observe, "wikimentor_action_seconds", duration, action=action)
+                    if record is not None:
+                        _write_trace(record, duration)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with trace(action), timed("wikimentor_action_seconds", action=action):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus():
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+
+    def fmt(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    lines = []
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+    for name in names:
+        kind, help_text = _HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{fmt(labels)} {value}")
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, hist):
+                cumulative += count
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {hist[-1]}")
+            lines.append(f"{name}_sum{fmt(labels)} {hist[-2]:.6f}")
+            lines.append(f"{name}_count{fmt(labels)} {hist[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _handler_class():
+    # http.server is only imported when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                self._send(200, render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+            elif path == "/healthz":
+                self._send(200, "ok\n", "text/plain; charset=utf-8")  # the process is up
+            elif path == "/ready":
+                from modules import health
+                status = health.status()
+                self._send(200 if status["ready"] else 503, json.dumps(status), "application/json")
+            else:
+                self.send_error(404)
+
+    return _MetricsHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_server(port=None):
+    """Serves /metrics, /healthz and /ready on a background thread; a no-op if disabled or already running."""
+    global _server
+    port = int(config.get("METRICS_PORT", "0")) if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            from http.server import ThreadingHTTPServer
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _handler_class())
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+            print(f"📈 Metrics on http://0.0.0.0:{port}/metrics")
+    return _server
@@ -0,0 +1,303 @@
+import bz2
+import gzip
+import json
+import os
+import xml.etree.ElementTree as ET
+import zlib
+
+from modules import config, sqlite_db
+from modules.cache import normalize_key
+
+# 💾 Local snapshot of Wikipedia summaries, redirects, Wikidata facts and
+# Wikibooks/Wikiversity titles, built by ingest_dumps.py from Wikimedia dumps.
+BATCH_SIZE = 5000
+MAX_FACTS = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    title_key TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    summary BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS redirects (
+    from_key TEXT PRIMARY KEY,
+    to_key TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS entities (
+    qid TEXT PRIMARY KEY,
+    title_key TEXT,
+    label_key TEXT,
+    facts TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entities_title ON entities (title_key);
+CREATE INDEX IF NOT EXISTS entities_label ON entities (label_key);
+CREATE TABLE IF NOT EXISTS labels (
+    id TEXT PRIMARY KEY,
+    label TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS titles (
+    project TEXT NOT NULL,
+    title_key TEXT NOT NULL,
+    title TEXT NOT NULL,
+    PRIMARY KEY (project, title_key)
+) WITHOUT ROWID;
+"""
+
+
+def db_path():
+    return config.get("WIKIMENTOR_OFFLINE_DB", os.path.join(".cache", "wikimentor_offline.sqlite3"))
+
+
+def available():
+    return os.path.exists(db_path())
+
+
+_connection = sqlite_db.LocalConnection(db_path, _SCHEMA, timeout=30, isolation_level="")
+
+
+def _open(path):
+    """Opens plain, .gz or .bz2 dumps as text without decompressing them to disk."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _flush(conn, sql, rows):
+    if rows:
+        with conn:
+            conn.executemany(sql, rows)
+        rows.clear()
+
+
+# 📥 Ingestion (streaming, bounded memory: at most BATCH_SIZE rows are held at once)
+
+_PAGE_SQL = "INSERT OR REPLACE INTO pages (title_key, title, summary) VALUES (?, ?, ?)"
+_REDIRECT_SQL = "INSERT OR REPLACE INTO redirects (from_key, to_key) VALUES (?, ?)"
+
+
+def _page_row(title, summary):
+    return normalize_key(title), title, zlib.compress(summary.encode("utf-8"))
+
+
+def ingest_abstracts(path):
+    """Loads an enwiki-*-abstract.xml[.gz] dump (<doc><title>Wikipedia: X</title><abstract>...)."""
+    conn = _connection()
+    rows = []
+    count = 0
+    with _open(path) as f:
+        events = ET.iterparse(f, events=("start", "end"))
+        _, root = next(events)
+        for event, elem in events:
+            if event != "end" or elem.tag != "doc":
+                continue
+            title = (elem.findtext("title") or "").removeprefix("Wikipedia: ").strip()
+            abstract = (elem.findtext("abstract") or "").strip()
+            if title and abstract:
+                rows.append(_page_row(title, abstract))
+                count += 1
+            root.clear()  # drops the finished <doc>; elem.clear() alone leaves it attached to the root
+            if len(rows) >= BATCH_SIZE:
+                _flush(conn, _PAGE_SQL, rows)
+    _flush(conn, _PAGE_SQL, rows)
+    return count
+
+
+def ingest_summaries(path):
+    """
+    Loads a JSON-lines summary dump, one page per line, using either the REST
+    summary fields (title, extract) or the Enterprise ones (name, abstract).
+    An optional "redirects" list on each line is indexed too.
+    """
+    conn = _connection()
+    rows = []
+    redirects = []
+    count = 0
+    with _open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            page = json.loads(line)
+            title = page.get("title") or page.get("name")
+            summary = page.get("extract") or page.get("abstract")
+            if not title or not summary:
+                continue
+            rows.append(_page_row(title, summary))
+            for source in page.get("redirects", []):
+                redirects.append((normalize_key(source), normalize_key(title)))
+            count += 1
+            if len(rows) >= BATCH_SIZE:
+                _flush(conn, _PAGE_SQL, rows)
+                _flush(conn, _REDIRECT_SQL, redirects)
+    _flush(conn, _PAGE_SQL, rows)
+    _flush(conn, _REDIRECT_SQL, redirects)
+    return count
+
+
+def ingest_redirects(path):
+    """Loads a tab-separated 'source<TAB>target' redirect list."""
+    conn = _connection()
+    rows = []
+    count = 0
+    with _open(path) as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != 2 or not parts[0] or not parts[1]:
+                continue
+            rows.append((normalize_key(parts[0]), normalize_key(parts[1])))
+            count += 1
+            if len(rows) >= BATCH_SIZE:
+                _flush(conn, _REDIRECT_SQL, rows)
+    _flush(conn, _REDIRECT_SQL, rows)
+    return count
+
+
+_ENTITY_SQL = "INSERT OR REPLACE INTO entities (qid, title_key, label_key, facts) VALUES (?, ?, ?, ?)"
+_LABEL_SQL = "INSERT OR REPLACE INTO labels (id, label) VALUES (?, ?)"
+
+
+def _entity_facts(claims):
+    """Mirrors the live fetcher: the first MAX_FACTS properties, kept when their value is an entity."""
+    pairs = []
+    for prop in list(claims.keys())[:MAX_FACTS]:
+        try:
+            val_id = claims[prop][0]["mainsnak"]["datavalue"]["value"].get("id")
+        except (KeyError, IndexError, TypeError, AttributeError):
+            continue
+        if val_id:
+            pairs.append([prop, val_id])
+    return pairs
+
+
+def ingest_wikidata(path, linked_only=False):
+    """
+    Loads a Wikidata JSON dump (latest-all.json[.gz|.bz2] or a subset of it):
+    a JSON array with one entity per line. Every entity contributes its English
+    label; items also store their enwiki title and first few entity-valued claims.
+    With linked_only, items without an English Wikipedia article are skipped.
+    """
+    conn = _connection()
+    entities = []
+    labels = []
+    count = 0
+    with _open(path) as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if not line or line in ("[", "]"):
+                continue
+            entity = json.loads(line)
+            eid = entity.get("id")
+            if not eid:
+                continue
+            label = entity.get("labels", {}).get("en", {}).get("value")
+            if label:
+                labels.append((eid, label))
+            if entity.get("type") == "item":
+                title = entity.get("sitelinks", {}).get("enwiki", {}).get("title")
+                if title or not linked_only:
+                    entities.append((
+                        eid,
+                        normalize_key(title) if title else None,
+                        normalize_key(label) if label else None,
+                        json.dumps(_entity_facts(entity.get("claims", {})))
+                    ))
+                    count += 1
+            if len(entities) >= BATCH_SIZE or len(labels) >= BATCH_SIZE:
+                _flush(conn, _ENTITY_SQL, entities)
+                _flush(conn, _LABEL_SQL, labels)
+    _flush(conn, _ENTITY_SQL, entities)
+    _flush(conn, _LABEL_SQL, labels)
+    return count
+
+
+_TITLE_SQL = "INSERT OR REPLACE INTO titles (project, title_key, title) VALUES (?, ?, ?)"
+
+
+def ingest_titles(project, path):
+    """Loads an *-all-titles-in-ns0[.gz] list for 'wikibooks' or 'wikiversity'."""
+    conn = _connection()
+    rows = []
+    count = 0
+    with _open(path) as f:
+        for line in f:
+            title = line.strip()
+            if not title or title == "page_title":
+                continue
+            title = title.replace("_", " ")
+            rows.append((project, normalize_key(title), title))
+            count += 1
+            if len(rows) >= BATCH_SIZE:
+                _flush(conn, _TITLE_SQL, rows)
+    _flush(conn, _TITLE_SQL, rows)
+    return count
+
+
+# 🔎 Lookups used by modules.wiki_fetcher
+
+def resolve_title(topic):
+    """Returns the title key for topic, following one redirect hop."""
+    key = normalize_key(topic)
+    row = _connection().execute("SELECT to_key FROM redirects WHERE from_key = ?", (key,)).fetchone()
+    return row[0] if row else key
+
+
+def lookup_title(topic):
+    """The page's display title (after one redirect hop), or None if it isn't in the snapshot."""
+    row = _connection().execute("SELECT title FROM pages WHERE title_key = ?", (resolve_title(topic),)).fetchone()
+    return row[0] if row else None
+
+
+def titles_with_prefix(prefix, limit):
+    """Page titles whose key starts with prefix, in key order (a range scan of the primary key)."""
+    key = normalize_key(prefix)
+    rows = _connection().execute(
+        "SELECT title FROM pages WHERE title_key >= ? AND title_key < ? ORDER BY title_key LIMIT ?",
+        (key, key + "\uffff", limit)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def lookup_summary(topic):
+    row = _connection().execute("SELECT summary FROM pages WHERE title_key = ?", (resolve_title(topic),)).fetchone()
+    return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+
+def lookup_qid(topic):
+    key = resolve_title(topic)
+    conn = _connection()
+    row = conn.execute("SELECT qid FROM entities WHERE title_key = ? LIMIT 1", (key,)).fetchone()
+    if row is None:
+        row = conn.execute("SELECT qid FROM entities WHERE label_key = ? LIMIT 1", (normalize_key(topic),)).fetchone()
+    return row[0] if row else None
+
+
+def lookup_facts(topic):
+    """Returns the same 'property: value' strings as the live fetcher, or None if the topic is unknown."""
+    qid = lookup_qid(topic)
+    if qid is None:
+        return None
+    return lookup_entity_facts(qid)
+
+
+def lookup_entity_facts(qid):
+    """Facts for a Wikidata id, or None if the entity isn't in the snapshot."""
+    conn = _connection()
+    row = conn.execute("SELECT facts FROM entities WHERE qid = ?", (qid,)).fetchone()
+    if row is None:
+        return None
+    pairs = json.loads(row[0])
+    ids = list({i for pair in pairs for i in pair})
+    labels = {}
+    if ids:
+        placeholders = ",".join("?" * len(ids))
+        labels = dict(conn.execute(f"SELECT id, label FROM labels WHERE id IN ({placeholders})", ids).fetchall())
+    return [f"{labels[p]}: {labels[v]}" for p, v in pairs if p in labels and v in labels]
+
+
+def iter_titles(project):
+    """Yields every ingested title for 'wikibooks' or 'wikiversity' (used to seed the search index)."""
+    cursor = _connection().execute("SELECT title FROM titles WHERE project = ?", (project,))
+    for (title,) in cursor:
+        yield title
@@ -0,0 +1,182 @@
+import contextvars
+import time
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from modules.wiki_fetcher import (fetch_article_text, fetch_entity_facts, fetch_learning_resources, fetch_topic_summary,
+                                  fetch_wikidata_facts, resource_links)
+from modules.ai_engine import generate_flashcards
+from modules import config, metrics, topics
+
+# Bounded pool shared by every UI session for the Wikimedia fetches; each topic uses at most 4 slots
+MAX_WORKERS = 16
+# Flashcard tasks mostly wait in the LLM scheduler's queue, so they get their own
+# pool and never hold the fetch slots that summaries need
+FLASHCARD_WORKERS = 32
+TIMING_HISTORY = 500
+# Timeouts left at FROM_SETTINGS are read per topic from LEARN_SOURCE_TIMEOUT and
+# LEARN_FLASHCARD_TIMEOUT: how long the UIs wait for each source before showing a placeholder instead
+FROM_SETTINGS = object()
+# One ranked Wikibooks + Wikiversity query fills both link sections
+RESOURCE_SECTIONS = {"books": "wikibooks", "resources": "wikiversity"}
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="wikimentor")
+_flashcard_executor = ThreadPoolExecutor(max_workers=FLASHCARD_WORKERS, thread_name_prefix="wikimentor-flashcards")
+_timing_history = deque(maxlen=TIMING_HISTORY)
+_timing_lock = threading.Lock()
+
+
+def _timed(timings, stage, fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    except Exception as e:
+        print(f"⚠️ {stage} failed:", e)
+        return None
+    finally:
+        timings[stage] = time.perf_counter() - start
+        metrics.observe("wikimentor_stage_seconds", timings[stage], stage=stage)
+
+
+def _submit(*args, executor=None):
+    # Each task gets its own copy of the caller's context so spans reach the request's trace
+    return (executor or _executor).submit(contextvars.copy_context().run, _timed, *args)
+
+
+def flashcard_source(topic, summary, article):
+    """The article chunks most related to the topic and its summary, in article order; the summary if there are none."""
+    from modules import retrieval  # NumPy loads on first use, not at import
+    passages = retrieval.retrieve(topic, article, f"{topic} {summary}")
+    return "\n\n".join(passages) or summary
+
+
+def _empty_result(topic, resolution, timings):
+    return {"topic": topic, "title": resolution["title"], "qid": resolution["qid"], "resolution": resolution,
+            "summary": None, "books": [], "facts": [], "resources": [], "flashcards": [], "timed_out": [],
+            "timings": timings}
+
+
+def learn_topic_stream(topic, flashcards=True, resolution=None, timeout=FROM_SETTINGS,
+                       flashcard_timeout=FROM_SETTINGS):
+    """
+    learn_topic for progressive UIs: yields (section, result) each time a section of
+    the result is filled in, so the summary can be shown before the slower sources.
+    Sections come as "resolution" first, then "summary", "books", "facts" and
+    "resources" in the order they arrive, and "flashcards" last.
+    A source still missing `timeout` seconds after the start (flashcards:
+    `flashcard_timeout` seconds after they are started) is given up on and listed in
+    result["timed_out"]; its fetch finishes in the background and warms the cache.
+    None waits for every source. Nothing else is waited for once the summary fails.
+    Once the summary is in, flashcards wait LEARN_ARTICLE_GRACE seconds for the full
+    article before being written from the summary alone.
+    """
+    if timeout is FROM_SETTINGS:
+        timeout = float(config.get("LEARN_SOURCE_TIMEOUT", "8"))
+    if flashcard_timeout is FROM_SETTINGS:
+        flashcard_timeout = float(config.get("LEARN_FLASHCARD_TIMEOUT", "45"))
+    article_grace_seconds = float(config.get("LEARN_ARTICLE_GRACE", "1"))
+    timings = {}
+    start = time.perf_counter()
+    metrics.annotate(topic=topic)  # lets warm_cache.py pick popular topics from the trace log
+
+    if resolution is None:
+        resolution = _timed(timings, "resolve", topics.resolve, topic)
+    if resolution is None:
+        # Resolution itself failed; let the fetchers try the topic as typed
+        resolution = topics.as_typed(topic)
+    title, qid = resolution["title"], resolution["qid"]
+    result = _empty_result(topic, resolution, timings)
+    yield "resolution", result
+    if resolution["status"] != "ok":
+        timings["total"] = time.perf_counter() - start
+        return
+
+    source_deadline = start + timeout if timeout else None
+    pending = {  # future -> (section, deadline)
+        _submit(timings, "summary", fetch_topic_summary, title): ("summary", source_deadline),
+        _submit(timings, "learning_resources", fetch_learning_resources, title): ("learning_resources", source_deadline),
+        # Also fetched without flashcards: it warms the cache for grounded Mentor Chat follow-ups
+        _submit(timings, "article", fetch_article_text, title): ("article", source_deadline),
+    }
+    if qid:
+        pending[_submit(timings, "wikidata", fetch_entity_facts, qid)] = ("facts", source_deadline)
+    else:
+        pending[_submit(timings, "wikidata", fetch_wikidata_facts, title)] = ("facts", source_deadline)
+
+    article = None
+    waiting_for_article = True
+    article_grace = None  # set when the summary arrives before the article
+    flashcards_started = False
+    while pending:
+        deadlines = [deadline for _, deadline in pending.values() if deadline is not None]
+        if article_grace is not None and not flashcards_started:
+            deadlines.append(article_grace)
+        wait_for = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        now = time.perf_counter()
+        finished = [(future, False) for future in done]
+        finished += [(future, True) for future, (_, deadline) in pending.items()
+                     if future not in done and deadline is not None and now >= deadline]
+        for future, timed_out in finished:
+            section, _ = pending.pop(future)
+            value = None if timed_out else future.result()
+            if timed_out:
+                result["timed_out"] += list(RESOURCE_SECTIONS) if section == "learning_resources" else [section]
+            if section == "article":
+                article, waiting_for_article = value, False
+            elif section == "learning_resources":
+                for name, source in RESOURCE_SECTIONS.items():
+                    result[name] = resource_links(value, source)
+                    yield name, result
+            else:
+                result[section] = value if section == "summary" else value or []
+                yield section, result
+                if section == "summary" and not value:
+                    pending.clear()  # without a summary nothing else is worth waiting for
+                    break
+                if section == "summary" and waiting_for_article:
+                    article_grace = now + article_grace_seconds
+        # Flashcards start once the summary and article are in; a slow article only
+        # gets the grace period before the cards are written from the summary
+        article_ready = not waiting_for_article or (article_grace is not None and now >= article_grace)
+        if flashcards and result["summary"] and article_ready and not flashcards_started:
+            flashcards_started = True
+            source = flashcard_source(title, result["summary"], "" if waiting_for_article else article or "")
+            deadline = now + flashcard_timeout if flashcard_timeout else None
+            pending[_submit(timings, "flashcards", generate_flashcards, source, executor=_flashcard_executor)] = ("flashcards", deadline)
+    timings["total"] = time.perf_counter() - start
+
+    with _timing_lock:
+        _timing_history.append(dict(timings))
+
+
+def learn_topic(topic, flashcards=True, resolution=None, timeout=None):
+    """
+    Runs the whole 'Learn a Topic' flow and returns the finished result.
+    The topic is first resolved to a canonical Wikipedia title and Wikidata id
+    (pass resolution if the caller already has it); ambiguous or unknown topics
+    stop there, with the options to offer the learner in result["resolution"].
+    The Wikimedia sources are fetched concurrently and flashcard generation
+    starts as soon as the summary and full article arrive; cards are written
+    from the article chunks that best match the topic, or from the summary if
+    the article is still missing LEARN_ARTICLE_GRACE seconds after the summary.
+    The total latency tracks the slowest source rather than the sum of all of them.
+    Pass flashcards=False when the learner already has this topic's cards.
+    Returns a dict with title, qid, resolution, summary, books, facts, resources,
+    flashcards, timed_out (sources given up on after timeout seconds) and timings.
+    """
+    result = None
+    for _, result in learn_topic_stream(topic, flashcards, resolution, timeout, timeout):
+        pass
+    return result
+
+
+def timing_percentile(stage, pct=50):
+    """Returns the pct-th percentile (seconds) of a stage over recent requests, or None."""
+    with _timing_lock:
+        values = sorted(t[stage] for t in _timing_history if stage in t)
+    if not values:
+        return None
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[idx]
@@ -0,0 +1,192 @@
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from modules import config, metrics
+from modules.cache import normalize_key
+from modules.conversation import estimate_tokens
+from modules.search_index import BM25_B, BM25_K1, tokenize
+from modules.semantic_cache import normalize_query
+from modules.wiki_fetcher import fetch_article_text, search_article_title
+
+# 🎯 Retrieval-grounded prompts.
+# The full Wikipedia article is split into passage-sized chunks and scored against
+# the question with BM25, vectorized with NumPy over the article's postings. Only
+# the best few chunks go into the prompt, so answers stay on-topic and the LLM reads
+# a few hundred tokens instead of the whole article.
+RAG_TOP_K = int(config.get("RAG_TOP_K", "3"))  # 0 turns grounding off
+RAG_CONTEXT_TOKENS = int(config.get("RAG_CONTEXT_TOKENS", "600"))
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 20  # words shared by consecutive windows of one long paragraph
+INDEX_CACHE_SIZE = 128  # articles whose chunk indexes are kept in memory
+LEAD_BOOST = 1.5  # the lead defines the topic, so it wins when a question matches everything equally
+
+# Sections with no prose worth grounding an answer on
+SKIPPED_SECTIONS = {
+    "bibliography", "citations", "external links", "further reading", "notes", "references",
+    "see also", "sources",
+}
+
+_HEADING = re.compile(r"^\s*(=+)\s*(.*?)\s*=+\s*$")
+
+_indexes = OrderedDict()  # (title key, text hash) -> ChunkIndex
+_indexes_lock = threading.Lock()
+
+
+def split_chunks(text, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """
+    Splits plain article text (MediaWiki "== Heading ==" lines) into chunks of at
+    most `size` words. Paragraphs are packed together and never split unless longer
+    than a chunk; each chunk starts with its section heading.
+    """
+    chunks, words = [], []
+    section, skipped_level = "", None  # the lead has no heading
+
+    def flush():
+        if words:
+            chunks.append((f"{section}: " if section else "") + " ".join(words))
+            words.clear()
+
+    for line in text.splitlines():
+        heading = _HEADING.match(line)
+        if heading:
+            flush()
+            level, section = len(heading.group(1)), heading.group(2)
+            if skipped_level is not None and level <= skipped_level:
+                skipped_level = None
+            if skipped_level is None and section.casefold() in SKIPPED_SECTIONS:
+                skipped_level = level
+            continue
+        paragraph = line.split()
+        if skipped_level is not None or not paragraph:
+            continue
+        if len(words) + len(paragraph) > size:
+            flush()
+        while len(paragraph) > size:
+            chunks.append((f"{section}: " if section else "") + " ".join(paragraph[:size]))
+            paragraph = paragraph[size - overlap:]
+        words += paragraph
+    flush()
+    return chunks
+
+
+class ChunkIndex:
+    """
+    BM25 over one article's chunks. Term weights are precomputed per posting and
+    stored grouped by term, so scoring a query is one np.bincount over the
+    postings of its terms.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.vocabulary = {}
+        rows, columns, counts = [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for row, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk))
+            lengths[row] = sum(terms.values())
+            for term, tf in terms.items():
+                rows.append(row)
+                columns.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                counts.append(tf)
+
+        columns = np.asarray(columns, dtype=np.int64)
+        order = np.argsort(columns, kind="stable")
+        columns = columns[order]
+        self.rows = np.asarray(rows, dtype=np.int64)[order]
+        tf = np.asarray(counts, dtype=np.float32)[order]
+        # Postings of term t are rows[starts[t]:starts[t + 1]]
+        self.starts = np.searchsorted(columns, np.arange(len(self.vocabulary) + 1))
+
+        n = len(chunks)
+        df = np.diff(self.starts)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        average = float(lengths.mean()) if n else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(average, 1.0))
+        self.weights = idf[columns] * tf * (BM25_K1 + 1) / (tf + norm[self.rows])
+        self.tokens = sum(estimate_tokens(chunk) for chunk in chunks)
+        self.boost = np.ones(n, dtype=np.float32)
+        self.boost[:1] = LEAD_BOOST  # the article's opening chunk
+
+    def search(self, query, k):
+        """(chunk index, score) of the k best-matching chunks, best first."""
+        terms = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not terms or k <= 0:
+            return []
+        spans = [slice(self.starts[t], self.starts[t + 1]) for t in terms]
+        scores = np.bincount(np.concatenate([self.rows[s] for s in spans]),
+                             weights=np.concatenate([self.weights[s] for s in spans]),
+                             minlength=len(self.chunks)) * self.boost
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+
+def index_for(title, text):
+    key = (normalize_key(title), hash(text))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = ChunkIndex(split_chunks(text))
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def retrieve(title, text, query, k=RAG_TOP_K, max_tokens=RAG_CONTEXT_TOKENS):
+    """
+    The (at most k) chunks of the article text most relevant to query, in article
+    order and within max_tokens. Falls back to the lead when nothing matches.
+    """
+    if not text or k <= 0:
+        return []
+    index = index_for(title, text)
+    if not index.chunks:
+        return []
+    hits = index.search(query, k) or [(0, 0.0)]
+    chosen, used = [], 0
+    for i, _ in hits:
+        cost = estimate_tokens(index.chunks[i])
+        if chosen and used + cost > max_tokens:
+            continue
+        chosen.append(i)
+        used += cost
+    metrics.inc("wikimentor_retrieval_tokens_total", index.tokens, kind="article")
+    metrics.inc("wikimentor_retrieval_tokens_total", used, kind="prompt")
+    return [index.chunks[i] for i in sorted(chosen)]
+
+
+def topic_passages(topic, query, k=RAG_TOP_K):
+    """Passages of the topic's Wikipedia article that best match query; [] if it can't be fetched."""
+    if k <= 0:
+        return []
+    try:
+        return retrieve(topic, fetch_article_text(topic), query, k)
+    except Exception as e:
+        print("⚠️ Retrieval failed:", e)
+        return []
+
+
+def question_passages(question, k=RAG_TOP_K):
+    """Passages for a question asked without a topic: its best-matching article is looked up first."""
+    if k <= 0:
+        return []
+    try:
+        title = search_article_title(normalize_query(question))
+    except Exception as e:
+        print("⚠️ Article search failed:", e)
+        return []
+    return topic_passages(title, question, k) if title else []
+
+
+def format_passages(passages):
+    return "\n\n".join(f"[{n}] {passage}" for n, passage in enumerate(passages, 1))
@@ -0,0 +1,260 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from html import unescape
+
+from modules import config, http_client, offline_store, sqlite_db
+
+# 🔎 Local BM25 index over Wikibooks and Wikiversity titles and snippets.
+# Postings live in SQLite so the index survives restarts and grows incrementally;
+# scoring happens in-process.
+DEFAULT_TOP_K = 10
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 2  # title terms count twice, a cheap BM25F
+MIN_COVERAGE = 0.5  # share of the query's terms a hit needs before it can stand in for a live search
+
+SOURCES = {
+    "wikibooks": "en.wikibooks.org",
+    "wikiversity": "en.wikiversity.org",
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is",
+    "it", "of", "on", "or", "that", "the", "to", "with",
+}
+
+_write_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    title TEXT NOT NULL,
+    snippet TEXT NOT NULL DEFAULT '',
+    length INTEGER NOT NULL,
+    UNIQUE (source, title)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def tokenize(text):
+    return [t for t in re.findall(r"\w+", text.casefold()) if t not in STOPWORDS]
+
+
+def page_url(source, title):
+    return f"https://{SOURCES[source]}/wiki/{title.replace(' ', '_')}"
+
+
+def clean_snippet(snippet):
+    """Strips the <span class="searchmatch"> markup MediaWiki puts in search snippets."""
+    return unescape(re.sub(r"<[^>]+>", "", snippet or "")).strip()
+
+
+def db_path():
+    return config.get("WIKIMENTOR_SEARCH_DB", os.path.join(".cache", "wikimentor_search.sqlite3"))
+
+
+def api_url(source):
+    # API endpoints can be pointed elsewhere (e.g. the benchmark stand-in servers)
+    return config.get(f"{source.upper()}_API_URL", f"https://{SOURCES[source]}/w/api.php")
+
+
+def available():
+    return os.path.exists(db_path())
+
+
+_connection = sqlite_db.LocalConnection(db_path, _SCHEMA, timeout=30, isolation_level="")
+
+
+def has_source(source):
+    if not available():
+        return False
+    return _connection().execute("SELECT 1 FROM docs WHERE source = ? LIMIT 1", (source,)).fetchone() is not None
+
+
+def add_documents(docs):
+    """
+    Inserts or replaces documents given as (source, title, snippet) tuples.
+    Re-adding a title replaces its postings, so refreshes never double count.
+    """
+    conn = _connection()
+    count = 0
+    with _write_lock, conn:
+        for source, title, snippet in docs:
+            terms = Counter(tokenize(title) * TITLE_WEIGHT + tokenize(snippet))
+            if not terms:
+                continue
+            row = conn.execute("SELECT doc_id FROM docs WHERE source = ? AND title = ?", (source, title)).fetchone()
+            if row:
+                doc_id = row[0]
+                conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                conn.execute("UPDATE docs SET snippet = ?, length = ? WHERE doc_id = ?",
+                             (snippet, sum(terms.values()), doc_id))
+            else:
+                doc_id = conn.execute("INSERT INTO docs (source, title, snippet, length) VALUES (?, ?, ?, ?)",
+                                      (source, title, snippet, sum(terms.values()))).lastrowid
+            conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                             [(term, doc_id, tf) for term, tf in terms.items()])
+            count += 1
+    return count
+
+
+def search(query, k=DEFAULT_TOP_K, sources=None, per_source=False):
+    """
+    Ranks documents from every source (or just `sources`) against query with BM25.
+    Returns up to k dicts with source, title, url, snippet, score and coverage (the
+    share of the query's terms the document contains), best first. With per_source,
+    k applies to each source, so one wiki's higher scores can't crowd out another.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or not available():
+        return []
+    conn = _connection()
+    n_docs, avg_len = conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+    if not n_docs:
+        return []
+
+    scores = Counter()
+    matched = Counter()
+    for term in terms:
+        postings = conn.execute(
+            "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ?",
+            (term,)
+        ).fetchall()
+        if not postings:
+            continue
+        idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        for doc_id, tf, length in postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+            scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            matched[doc_id] += 1
+
+    results = []
+    wanted = set(sources) if sources else None
+    if per_source:
+        # A source's best document may rank anywhere, so every match is a candidate
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        limit = k * len(wanted or SOURCES)
+    else:
+        # Over-fetch so a source filter still leaves k results in most cases
+        ranked = heapq.nlargest(k * 4 if wanted else k, scores.items(), key=lambda item: item[1])
+        limit = k
+    taken = Counter()
+    for doc_id, score in ranked:
+        source, title, snippet = conn.execute(
+            "SELECT source, title, snippet FROM docs WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        if wanted and source not in wanted or per_source and taken[source] >= k:
+            continue
+        taken[source] += 1
+        results.append({"source": source, "title": title, "url": page_url(source, title),
+                        "snippet": snippet, "score": round(score, 4),
+                        "coverage": round(matched[doc_id] / len(terms), 2)})
+        if len(results) == limit:
+            break
+    return results
+
+
+def trusted(hits, k):
+    """
+    Whether index hits can replace a live search: a full k of them, each containing
+    at least MIN_COVERAGE of the query's terms. A sparse index (say, one filled only
+    from earlier live results) would otherwise keep answering with one-word matches.
+    """
+    return len(hits) >= k and all(hit["coverage"] >= MIN_COVERAGE for hit in hits)
+
+
+def build_from_offline_store(sources=SOURCES, batch_size=offline_store.BATCH_SIZE):
+    """Seeds the index from the title lists ingested into the offline store."""
+    total = 0
+    for source in sources:
+        batch = []
+        for title in offline_store.iter_titles(source):
+            batch.append((source, title, ""))
+            if len(batch) >= batch_size:
+                total += add_documents(batch)
+                batch = []
+        total += add_documents(batch)
+    return total
+
+
+def _get_meta(key):
+    row = _connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(key, value):
+    conn = _connection()
+    with conn:
+        if value is None:
+            conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+        else:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def refresh(source, max_pages=500):
+    """
+    Incrementally re-indexes pages changed on the wiki since the last refresh,
+    using recentchanges plus TextExtracts for the snippet. Returns pages indexed.
+    A refresh that stops at max_pages saves its place and the next one resumes
+    there; the watermark only moves once the change list has been read to the end.
+    """
+    source_api_url = api_url(source)
+    since = _get_meta(f"refreshed:{source}")
+    started = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    params = {
+        "action": "query",
+        "generator": "recentchanges",
+        "grcnamespace": 0,
+        "grctype": "new|edit",
+        "grcdir": "newer",
+        "grclimit": 20,
+        "prop": "extracts",
+        "exintro": 1,
+        "explaintext": 1,
+        "exchars": 300,
+        "exlimit": 20,
+        "format": "json",
+        "formatversion": 2
+    }
+    if since:
+        params["grcstart"] = since
+    resume = _get_meta(f"continue:{source}")
+    if resume:
+        params.update(json.loads(resume))
+
+    indexed = 0
+    while True:
+        response = http_client.get(source_api_url, params=params)
+        if response.status_code != 200:
+            return indexed  # the watermark stays put, so these changes are read again next time
+        data = response.json()
+        pages = data.get("query", {}).get("pages", [])
+        indexed += add_documents([(source, p["title"], p.get("extract", "")) for p in pages if "title" in p])
+        if "continue" not in data:
+            break
+        params.update(data["continue"])
+        if indexed >= max_pages:
+            _set_meta(f"continue:{source}", json.dumps(data["continue"]))
+            return indexed
+
+    _set_meta(f"refreshed:{source}", started)
+    _set_meta(f"continue:{source}", None)
+    return indexed
@@ -0,0 +1,224 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from modules import config
+
+# 🧲 Semantic answer cache for mentor chat.
+# Queries are embedded with a hashed character n-gram vectorizer (no model download,
+# CPU only) and matched by cosine similarity against a NumPy matrix of past queries,
+# so "what is photosynthesis", "What is photosynthesis?" and "explain photosynthesis"
+# share one answer. A close score alone is not enough: on longer questions one changed
+# number ("world war 1" / "world war 2") barely moves it, so a hit must have the same
+# numbers as the query and share most of its content words.
+SEMANTIC_CACHE_ENABLED = config.get("SEMANTIC_CACHE", "on").lower() not in ("0", "off", "false")
+SEMANTIC_CACHE_PATH = config.get("SEMANTIC_CACHE_PATH", os.path.join(".cache", "semantic_cache.npz"))
+# Each serve.py worker saves a whole snapshot of its own rows, so workers get their own
+# file; sharing one, whichever saved last would wipe the others' answers
+WORKER = config.get("WIKIMENTOR_WORKER")
+if WORKER:
+    _base, _ext = os.path.splitext(SEMANTIC_CACHE_PATH)
+    SEMANTIC_CACHE_PATH = f"{_base}.worker{WORKER}{_ext}"
+SIMILARITY_THRESHOLD = float(config.get("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+# Jaccard overlap of content words a hit needs: 0.5 lets "photosynthesis in plants"
+# reuse the answer for "photosynthesis", but not "photosynthesis in animals"
+TERM_OVERLAP = float(config.get("SEMANTIC_CACHE_TERM_OVERLAP", "0.5"))
+CAPACITY = int(config.get("SEMANTIC_CACHE_SIZE", "5000"))
+DIMENSIONS = 2 ** 10  # 5000 entries x 1024 float32 = 20 MB
+NGRAM_SIZES = (3, 4)
+VECTORIZER_VERSION = 2  # bump when embed() changes; older saved vectors are rebuilt on load
+SAVE_EVERY = 20  # persist after this many new answers
+
+# Question scaffolding that doesn't change what the mentor should explain
+FILLER_WORDS = {
+    "a", "about", "an", "and", "are", "can", "could", "define", "describe", "do", "does", "explain",
+    "for", "give", "how", "i", "in", "is", "me", "mean", "meaning", "of", "on", "please", "tell",
+    "the", "to", "what", "whats", "with", "work", "works", "you",
+}
+
+
+def _hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def normalize_query(text):
+    words = re.findall(r"\w+", text.casefold())
+    content = [w for w in words if w not in FILLER_WORDS]
+    return " ".join(content or words)
+
+
+def content_terms(text):
+    """The query's non-filler words and numbers, with plural -s dropped, as a set."""
+    return frozenset(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+                     for w in normalize_query(text).split())
+
+
+def _numbers(terms):
+    return {t for t in terms if any(c.isdigit() for c in t)}
+
+
+def terms_match(cached, asked, overlap=TERM_OVERLAP):
+    """Same numbers, and a Jaccard overlap of at least `overlap` between the content-term sets."""
+    if _numbers(cached) != _numbers(asked):
+        return False
+    union = cached | asked
+    return not union or len(cached & asked) / len(union) >= overlap
+
+
+def embed(text):
+    """L2-normalized hashed n-gram vector; signed hashing keeps collisions unbiased."""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    normalized = normalize_query(text)
+    tokens = normalized.split()
+    padded = f" {normalized} "
+    for n in NGRAM_SIZES:
+        tokens += [padded[i:i + n] for i in range(len(padded) - n + 1)]
+    for token in tokens:
+        h = _hash(token)
+        vector[h % DIMENSIONS] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """
+    Fixed-capacity nearest-neighbour cache. Rows live in preallocated NumPy
+    arrays; when full, the least frequently used entry is evicted, with the
+    least recently used one losing ties.
+    """
+
+    def __init__(self, path=SEMANTIC_CACHE_PATH, capacity=CAPACITY, threshold=SIMILARITY_THRESHOLD,
+                 overlap=TERM_OVERLAP):
+        self.path = path
+        self.capacity = capacity
+        self.threshold = threshold
+        self.overlap = overlap
+        self.lock = threading.Lock()
+        self.vectors = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+        self.hits = np.zeros(capacity, dtype=np.int64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.used = np.zeros(capacity, dtype=bool)
+        self.queries = [None] * capacity
+        self.answers = [None] * capacity
+        self.terms = [None] * capacity
+        self.dirty = 0
+        self._load()
+
+    def lookup(self, query):
+        """
+        Returns (answer, similarity) for the closest cached query above threshold whose
+        content terms match the query's (see terms_match), else (None, best similarity).
+        """
+        vector = embed(query)
+        terms = content_terms(query)
+        with self.lock:
+            if not self.used.any():
+                return None, 0.0
+            scores = self.vectors @ vector
+            scores[~self.used] = -1.0
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for row in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                if terms_match(self.terms[row], terms, self.overlap):
+                    self.hits[row] += 1
+                    self.last_used[row] = time.time()
+                    return self.answers[row], float(scores[row])
+            return None, float(scores.max())
+
+    def add(self, query, answer):
+        vector = embed(query)
+        with self.lock:
+            free = np.flatnonzero(~self.used)
+            if free.size:
+                slot = int(free[0])
+            else:
+                # LFU with LRU tie-break: lexsort sorts by the last key first
+                slot = int(np.lexsort((self.last_used, self.hits))[0])
+            self.vectors[slot] = vector
+            self.hits[slot] = 0
+            self.last_used[slot] = time.time()
+            self.used[slot] = True
+            self.queries[slot] = query
+            self.answers[slot] = answer
+            self.terms[slot] = content_terms(query)
+            self.dirty += 1
+            should_save = self.dirty >= SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            rows = np.flatnonzero(self.used)
+            texts = json.dumps({"queries": [self.queries[i] for i in rows], "answers": [self.answers[i] for i in rows]})
+            snapshot = {
+                "vectors": self.vectors[rows].copy(),
+                "hits": self.hits[rows].copy(),
+                "last_used": self.last_used[rows].copy(),
+                "texts": np.array(texts),
+                "version": np.array(VECTORIZER_VERSION),
+            }
+            self.dirty = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, **snapshot)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                texts = json.loads(str(data["texts"]))
+                count = min(len(texts["queries"]), self.capacity)
+                if data["vectors"].shape[1:] != (DIMENSIONS,):
+                    return  # built with a different vectorizer; start fresh
+                # Keep the most frequently used rows if the capacity shrank
+                order = np.argsort(-data["hits"], kind="stable")[:count]
+                self.vectors[:count] = data["vectors"][order]
+                stale = "version" not in data or int(data["version"]) != VECTORIZER_VERSION
+                self.hits[:count] = data["hits"][order]
+                self.last_used[:count] = data["last_used"][order]
+                self.used[:count] = True
+                for slot, row in enumerate(order):
+                    self.queries[slot] = texts["queries"][row]
+                    self.answers[slot] = texts["answers"][row]
+                    self.terms[slot] = content_terms(self.queries[slot])
+                    if stale:
+                        self.vectors[slot] = embed(self.queries[slot])
+        except (OSError, ValueError, KeyError) as e:
+            print("Semantic cache load failed:", e)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+                atexit.register(_cache.save)
+    return _cache
+
+
+def lookup(query):
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    answer, _ = get_cache().lookup(query)
+    return answer
+
+
+def add(query, answer):
+    if SEMANTIC_CACHE_ENABLED and answer and not answer.startswith("⚠️"):
+        get_cache().add(query, answer)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+
+from modules import config, sqlite_db
+from modules.conversation import Conversation
+
+# 🗄️ Per-learner session state (chat conversation and flashcard deck) kept outside
+# the web process, so any worker can serve any request and a restart loses nothing.
+# "sqlite" suits one host; "file" is handy for tests; other stores can be added
+# with register_backend().
+SESSION_STORE = config.get("WIKIMENTOR_SESSION_STORE", "sqlite")
+SESSION_STORE_PATH = config.get("WIKIMENTOR_SESSION_STORE_PATH")
+SESSION_TTL = int(config.get("WIKIMENTOR_SESSION_TTL", str(30 * 24 * 60 * 60)))  # idle sessions expire
+PRUNE_EVERY = 200  # drop expired sessions every N saves
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+"""
+
+
+class SQLiteSessionStore:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(".cache", "sessions.sqlite3")
+        self._connection = sqlite_db.LocalConnection(self.path, _SCHEMA, synchronous="NORMAL")
+
+    def load(self, session_id):
+        row = self._connection().execute(
+            "SELECT state FROM sessions WHERE id = ? AND updated > ?", (session_id, time.time() - SESSION_TTL)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, state):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions (id, state, updated) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state, ensure_ascii=False), time.time())
+        )
+
+    def delete(self, session_id):
+        self._connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def prune(self):
+        self._connection().execute("DELETE FROM sessions WHERE updated <= ?", (time.time() - SESSION_TTL,))
+
+
+class FileSessionStore:
+    """One JSON file per session, replaced atomically on every save."""
+
+    def __init__(self, path=None):
+        self.directory = path or os.path.join(".cache", "sessions")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, session_id):
+        # Session ids come from the browser, so never use them as file names directly
+        return os.path.join(self.directory, hashlib.sha1(session_id.encode("utf-8")).hexdigest() + ".json")
+
+    def load(self, session_id):
+        path = self._path(session_id)
+        try:
+            if os.path.getmtime(path) <= time.time() - SESSION_TTL:
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, session_id, state):
+        path = self._path(session_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, session_id):
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def prune(self):
+        cutoff = time.time() - SESSION_TTL
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".json") and os.path.getmtime(path) <= cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_BACKENDS = {"sqlite": SQLiteSessionStore, "file": FileSessionStore}
+_store = None
+_store_lock = threading.Lock()
+_saves = 0
+
+
+def register_backend(name, factory):
+    """Makes WIKIMENTOR_SESSION_STORE=name build its store with factory(path)."""
+    _BACKENDS[name] = factory
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_STORE not in _BACKENDS:
+                    raise ValueError(f"Unknown session store {SESSION_STORE!r}; expected one of {', '.join(_BACKENDS)}")
+                _store = _BACKENDS[SESSION_STORE](SESSION_STORE_PATH)
+    return _store
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+def load_session(session_id):
+    """Returns (conversation, flashcards) for session_id; a fresh pair if unknown."""
+    state = None
+    if session_id:
+        try:
+            state = get_store().load(session_id)
+        except Exception as e:
+            print("Session load failed:", e)
+    if not state:
+        return Conversation(), []
+    return Conversation.from_dict(state.get("conversation", {})), state.get("flashcards", [])
+
+
+def save_session(session_id, conversation, flashcards):
+    global _saves
+    if not session_id:
+        return
+    state = {"conversation": conversation.to_dict(), "flashcards": flashcards}
+    try:
+        store = get_store()
+        store.save(session_id, state)
+        with _store_lock:
+            _saves += 1
+            should_prune = _saves % PRUNE_EVERY == 0
+        if should_prune:
+            store.prune()
+    except Exception as e:
+        print("Session save failed:", e)
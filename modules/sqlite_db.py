@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import threading
+
+# 🗄️ The SQLite stores open their files the same way: one connection per thread,
+# WAL so readers never block the writer, and the schema created on first use.
+
+
+class LocalConnection:
+    """
+    Calling it returns this thread's connection to path, opening it on first use.
+    path may be a function returning the path, so a setting is only read then.
+    isolation_level=None is autocommit; pass "" for sqlite3's implicit transactions.
+    synchronous="NORMAL" trades the last commits on power loss for faster writes;
+    None keeps SQLite's default (FULL).
+    setup(conn) runs once per new connection, after the schema (e.g. a migration).
+    """
+
+    def __init__(self, path, schema, timeout=10, isolation_level=None, row_factory=None, setup=None, synchronous=None):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self.isolation_level = isolation_level
+        self.row_factory = row_factory
+        self.setup = setup
+        self.synchronous = synchronous
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            path = self.path() if callable(self.path) else self.path
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=self.timeout, isolation_level=self.isolation_level)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute("PRAGMA journal_mode=WAL")
+            if self.synchronous is not None:
+                conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            conn.executescript(self.schema)
+            if self.setup is not None:
+                self.setup(conn)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,269 @@
+import bisect
+import heapq
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from modules import cache, config, http_client, metrics, offline_store, sqlite_db, wiki_fetcher
+
+# 🧭 Topic resolution, run before any fetcher sees the learner's input.
+# The input is normalized and looked up once (one redirect hop, Wikidata id and
+# disambiguation flag in a single request, up to 50 titles per request), so every
+# later stage works on a canonical title and QID, junk input costs one call instead
+# of five, and cache keys don't depend on how the learner typed the topic.
+RESOLVE_BATCH_SIZE = 50  # titles per action API query
+DISAMBIGUATION_OPTIONS = 10
+SUGGEST_LIMIT = 8
+SUGGEST_SCAN = 2000  # prefix matches ranked per lookup; very short prefixes see the first ones only
+
+_REFERS_TO = re.compile(r"\bmay (?:also )?refer to\b", re.IGNORECASE)
+
+
+def normalize_topic(text):
+    """
+    Tidies raw input into a Wikipedia-style title: NFC, underscores as spaces,
+    collapsed whitespace, no trailing "?" and an upper-case first letter.
+    """
+    text = unicodedata.normalize("NFC", str(text or "")).replace("_", " ")
+    text = " ".join(text.split()).rstrip("?").strip()
+    return text[:1].upper() + text[1:]
+
+
+def _resolution(topic, title=None, qid=None, status="ok", redirected_from=None, options=()):
+    return {"input": topic, "title": title, "qid": qid, "status": status,
+            "redirected_from": redirected_from, "options": list(options)}
+
+
+def as_typed(topic):
+    """A resolution that takes the normalized input at face value (used when the API can't be reached)."""
+    return _resolution(topic, normalize_topic(topic))
+
+
+class PrefixIndex:
+    """
+    As-you-type title suggestions: a sorted array of normalized titles searched
+    with bisect. Matches are ranked by how often the title was resolved.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.titles = []
+        self.weights = {}  # key -> times resolved
+        self._lock = threading.Lock()
+
+    def add(self, title, weight=1):
+        key = cache.normalize_key(title)
+        with self._lock:
+            if key in self.weights:
+                self.weights[key] += weight
+                return
+            self.weights[key] = weight
+            i = bisect.bisect_left(self.keys, key)
+            self.keys.insert(i, key)
+            self.titles.insert(i, title)
+
+    def load(self, rows):
+        """Replaces the contents with (title, weight) rows in one sort."""
+        entries = {}
+        for title, weight in rows:
+            entries[cache.normalize_key(title)] = (title, weight)
+        keys = sorted(entries)
+        with self._lock:
+            self.keys = keys
+            self.titles = [entries[key][0] for key in keys]
+            self.weights = {key: entries[key][1] for key in keys}
+
+    def search(self, prefix, k=SUGGEST_LIMIT):
+        key = cache.normalize_key(prefix)
+        if not key:
+            return []
+        with self._lock:
+            start = bisect.bisect_left(self.keys, key)
+            end = min(bisect.bisect_left(self.keys, key + "\uffff"), start + SUGGEST_SCAN)
+            best = heapq.nsmallest(k, range(start, end),
+                                   key=lambda i: (-self.weights[self.keys[i]], len(self.keys[i]), self.keys[i]))
+            return [self.titles[i] for i in best]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _titles_db_path():
+    return config.get("WIKIMENTOR_TITLES_DB", os.path.join(".cache", "titles.sqlite3"))
+
+
+_titles_db = sqlite_db.LocalConnection(_titles_db_path, "CREATE TABLE IF NOT EXISTS titles (title_key TEXT PRIMARY KEY, "
+                                                        "title TEXT NOT NULL, hits INTEGER NOT NULL) WITHOUT ROWID;")
+
+
+def get_index():
+    """The suggestion index, loaded on first use from every title resolved before."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = PrefixIndex()
+                try:
+                    index.load(_titles_db().execute("SELECT title, hits FROM titles"))
+                except sqlite3.Error as e:
+                    print("⚠️ Title index load failed:", e)
+                _index = index
+    return _index
+
+
+def _remember(title):
+    get_index().add(title)
+    try:
+        _titles_db().execute(
+            "INSERT INTO titles (title_key, title, hits) VALUES (?, ?, 1) "
+            "ON CONFLICT (title_key) DO UPDATE SET hits = hits + 1",
+            (cache.normalize_key(title), title))
+    except sqlite3.Error as e:
+        print("⚠️ Title index write failed:", e)
+
+
+def suggest(prefix, k=SUGGEST_LIMIT):
+    """Titles starting with prefix: previously resolved ones first, then the offline snapshot's."""
+    titles = get_index().search(prefix, k)
+    if len(titles) < k and offline_store.available():
+        seen = {cache.normalize_key(t) for t in titles}
+        for title in offline_store.titles_with_prefix(prefix, k * 2):
+            if cache.normalize_key(title) not in seen and len(titles) < k:
+                titles.append(title)
+    return titles
+
+
+def _resolve_local(topic, title):
+    canonical = offline_store.lookup_title(title)
+    if canonical is None:
+        return None
+    # Abstracts carry no page properties; disambiguation pages open with "X may refer to:"
+    summary = offline_store.lookup_summary(title) or ""
+    redirected = cache.normalize_key(canonical) != cache.normalize_key(title)
+    return _resolution(topic, canonical, offline_store.lookup_qid(title),
+                       "disambiguation" if _REFERS_TO.search(summary[:300]) else "ok",
+                       title if redirected else None)
+
+
+def _disambiguation_options(title):
+    params = {
+        "action": "query",
+        "prop": "links",
+        "titles": title,
+        "plnamespace": 0,
+        "pllimit": 50,
+        "format": "json",
+        "formatversion": 2
+    }
+    response = http_client.get(wiki_fetcher.api_url(), params=params)
+    if response.status_code != 200:
+        return []
+    pages = response.json().get("query", {}).get("pages", [])
+    links = [link["title"] for page in pages for link in page.get("links", [])]
+    return links[:DISAMBIGUATION_OPTIONS]
+
+
+def _resolve_live(batch):
+    """Resolves up to RESOLVE_BATCH_SIZE (topic, title) pairs with one query; {topic: resolution}."""
+    params = {
+        "action": "query",
+        "titles": "|".join(title for _, title in batch),
+        "redirects": 1,
+        "prop": "pageprops",
+        "ppprop": "wikibase_item|disambiguation",
+        "format": "json",
+        "formatversion": 2
+    }
+    response = http_client.get(wiki_fetcher.api_url(), params=params)
+    if response.status_code != 200:
+        return {}
+    query = response.json().get("query", {})
+    normalized = {n["from"]: n["to"] for n in query.get("normalized", [])}
+    redirects = {r["from"]: r["to"] for r in query.get("redirects", [])}
+    pages = {page["title"]: page for page in query.get("pages", [])}
+
+    resolutions = {}
+    for topic, title in batch:
+        name = normalized.get(title, title)
+        target = redirects.get(name, name)
+        page = pages.get(target)
+        if page is None or page.get("missing") or page.get("invalid"):
+            resolutions[topic] = _resolution(topic, status="missing")
+            continue
+        props = page.get("pageprops", {})
+        resolutions[topic] = _resolution(
+            topic, page["title"], props.get("wikibase_item"),
+            "disambiguation" if "disambiguation" in props else "ok",
+            name if target != name else None)
+    return resolutions
+
+
+def _finish(resolution, title):
+    """Adds options to unresolved topics and records resolved titles."""
+    if resolution["status"] == "disambiguation":
+        options = [] if _local_only() else _disambiguation_options(resolution["title"])
+        resolution["options"] = options or suggest(f"{resolution['title']} (", DISAMBIGUATION_OPTIONS)
+    elif resolution["status"] == "missing":
+        # Wikipedia's own search corrects most typos; the local index covers prefixes
+        options = suggest(title, 5)
+        if not _local_only():
+            corrected = wiki_fetcher.search_article_title(title)
+            if corrected and cache.normalize_key(corrected) != cache.normalize_key(title) and corrected not in options:
+                options.insert(0, corrected)
+        resolution["options"] = options
+    if resolution["status"] != "missing":
+        cache.set("resolve", title, resolution)
+        if resolution["status"] == "ok":
+            _remember(resolution["title"])
+    metrics.inc("wikimentor_topic_resolutions_total", status=resolution["status"])
+    return resolution
+
+
+def _local_only():
+    return wiki_fetcher.backend() == "local"
+
+
+def resolve_many(topics):
+    """
+    {topic: resolution} where a resolution has the canonical "title", Wikidata "qid",
+    "status" ("ok", "disambiguation" or "missing"), "redirected_from" and "options"
+    (articles a disambiguation page lists, or suggestions for a missing title).
+    """
+    resolutions = {}
+    pending = []
+    for topic in dict.fromkeys(topics):
+        title = normalize_topic(topic)
+        if not title:
+            resolutions[topic] = _resolution(topic, status="missing")
+            continue
+        cached = cache.get("resolve", title)
+        if cached is not None:
+            resolutions[topic] = dict(cached, input=topic)
+            continue
+        local = _resolve_local(topic, title) if wiki_fetcher._use_local() else None
+        if local is not None or _local_only():
+            resolutions[topic] = _finish(local or _resolution(topic, status="missing"), title)
+        else:
+            pending.append((topic, title))
+
+    for start in range(0, len(pending), RESOLVE_BATCH_SIZE):
+        batch = pending[start:start + RESOLVE_BATCH_SIZE]
+        try:
+            live = _resolve_live(batch)
+        except Exception as e:
+            print("⚠️ Topic resolution failed:", e)
+            live = {}
+        for topic, title in batch:
+            if topic in live:
+                resolutions[topic] = _finish(live[topic], title)
+            else:
+                # Resolution is an optimization: when the API is unreachable, let the fetchers try the title as typed
+                resolutions[topic] = as_typed(topic)
+    return resolutions
+
+
+def resolve(topic):
+    return resolve_many([topic])[topic]
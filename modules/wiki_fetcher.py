@@ -1,85 +1,369 @@
-import streamlit as st
-import requests
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+from modules import cache, config, http_client, offline_store, search_index
+
+def backend():
+    # "live": Wikimedia APIs only, "local": offline snapshot only,
+    # "auto": snapshot first (when one has been ingested) and live APIs on a miss
+    return config.get("WIKI_BACKEND", "auto").lower()
+
+
+def rest_url():
+    return config.get("WIKIPEDIA_REST_URL", "https://en.wikipedia.org/api/rest_v1")
+
+
+def api_url():
+    return config.get("WIKIPEDIA_API_URL", "https://en.wikipedia.org/w/api.php")
+
+
+class UpstreamError(Exception):
+    """An upstream answered with an error status; whatever was being fetched must not be cached."""
+
+
+def _use_local():
+    return backend() in ("local", "auto") and offline_store.available()
+
+RESOURCE_LIMIT = 10
 
 # 📘 Wikipedia summary
-@st.cache_data(show_spinner=False)
 def fetch_topic_summary(topic):
-    url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{topic}"
-    response = requests.get(url)
+    summary = cache.get("summary", topic)
+    if summary is not None:
+        return summary
+    if _use_local():
+        summary = offline_store.lookup_summary(topic)
+        if summary is not None:
+            return summary
+    if backend() == "local":
+        return None
+    # Titles may contain "/", "?" or "#", so the whole title is one encoded path segment
+    url = f"{rest_url()}/page/summary/{quote(topic.replace(' ', '_'), safe='')}"
+    response = http_client.get(url)
     if response.status_code == 200:
         data = response.json()
-        return data.get("extract", "No summary available.")
+        if data.get("type") == "disambiguation":
+            return None  # a list of other articles, not a summary to learn from
+        summary = data.get("extract", "No summary available.")
+        # Store under the canonical title so redirects and spelling variants share one entry
+        canonical = data.get("titles", {}).get("canonical") or data.get("title") or topic
+        cache.set("summary", canonical, summary, aliases=[topic])
+        return summary
     return None
 
-# 📚 Wikibooks search
-@st.cache_data(show_spinner=False)
-def fetch_wikibooks_links(topic):
-    api_url = "https://en.wikibooks.org/w/api.php"
+# 📄 Full Wikipedia article as plain text, for retrieval-grounded prompts
+@cache.cached("article")
+def fetch_article_text(topic):
+    if backend() == "local":
+        # The offline snapshot only has abstracts
+        return offline_store.lookup_summary(topic) if offline_store.available() else None
+    params = {
+        "action": "query",
+        "prop": "extracts",
+        "explaintext": 1,
+        "redirects": 1,
+        "titles": topic,
+        "format": "json",
+        "formatversion": 2
+    }
+    response = http_client.get(api_url(), params=params)
+    if response.status_code != 200:
+        return None
+    pages = response.json().get("query", {}).get("pages", [])
+    if not pages or pages[0].get("missing"):
+        return None
+    return pages[0].get("extract") or None
+
+@cache.cached("article_title")
+def search_article_title(query):
+    """Title of the Wikipedia article that best matches a free-form question, or None."""
+    if backend() == "local" or not query:
+        return None
+    params = {
+        "action": "query",
+        "list": "search",
+        "srsearch": query,
+        "srlimit": 1,
+        "srprop": "",
+        "format": "json"
+    }
+    response = http_client.get(api_url(), params=params)
+    if response.status_code != 200:
+        return None
+    results = response.json().get("query", {}).get("search", [])
+    return results[0]["title"] if results else None
+
+# 📚🎓 Wikibooks / Wikiversity search
+def _search_resources(source, topic, k=RESOURCE_LIMIT):
+    """Top-k (title, url) pairs from the local BM25 index, falling back to the wiki's live search."""
+    if backend() in ("local", "auto") and search_index.has_source(source):
+        hits = search_index.search(topic, k, sources=[source])
+        if backend() == "local" or search_index.trusted(hits, k):
+            return [(hit["title"], hit["url"]) for hit in hits]
+    if backend() == "local":
+        return []
+    return _live_search(source, topic, k)
+
+
+def _live_search(source, topic, k):
+    """Top-k (title, url) pairs from the wiki's own search; None if it failed."""
     params = {
         "action": "query",
         "list": "search",
         "srsearch": topic,
+        "srlimit": k,
         "format": "json"
     }
-    response = requests.get(api_url, params=params)
-    books = []
-    if response.status_code == 200:
-        for result in response.json().get("query", {}).get("search", []):
-            title = result["title"]
-            url = f"https://en.wikibooks.org/wiki/{title.replace(' ', '_')}"
-            books.append((title, url))
-    return books
+    response = http_client.get(search_index.api_url(source), params=params)
+    if response.status_code != 200:
+        return None  # not [] -- "no results" is cached for weeks, an outage must not be
+    results = response.json().get("query", {}).get("search", [])
+    links = [(result["title"], search_index.page_url(source, result["title"])) for result in results]
+    if search_index.available():
+        # Index what the live search returned so similar topics are answered locally next time
+        search_index.add_documents([
+            (source, result["title"], search_index.clean_snippet(result.get("snippet")))
+            for result in results
+        ])
+    return links
+
+@cache.cached("wikibooks")
+def fetch_wikibooks_links(topic):
+    return _search_resources("wikibooks", topic)
 
 # 🧠 Wikidata facts (entity-based)
-@st.cache_data(show_spinner=False)
-def fetch_wikidata_facts(topic):
-    search_url = "https://www.wikidata.org/w/api.php"
+def wikidata_api_url():
+    return config.get("WIKIDATA_API_URL", "https://www.wikidata.org/w/api.php")
+
+
+WIKIDATA_BATCH_SIZE = 50  # wbgetentities accepts up to 50 ids per call
+LABEL_CACHE_SIZE = 10000
+
+# Process-wide label cache: P31, P279 and friends repeat across almost every topic
+_label_cache = OrderedDict()
+_label_lock = threading.Lock()
+
+
+def _resolve_labels(ids):
+    """Returns {id: English label} for the given Wikidata ids, batching the cache misses."""
+    with _label_lock:
+        missing = [i for i in dict.fromkeys(ids) if i not in _label_cache]
+
+    for start in range(0, len(missing), WIKIDATA_BATCH_SIZE):
+        batch = missing[start:start + WIKIDATA_BATCH_SIZE]
+        params = {
+            "action": "wbgetentities",
+            "ids": "|".join(batch),
+            "props": "labels",
+            "languages": "en",
+            "format": "json"
+        }
+        response = http_client.get(wikidata_api_url(), params=params)
+        if response.status_code != 200:
+            # Facts without their labels would be cached incomplete
+            raise UpstreamError(f"Wikidata labels: HTTP {response.status_code}")
+        entities = response.json().get("entities", {})
+        with _label_lock:
+            for eid in batch:
+                label = entities.get(eid, {}).get("labels", {}).get("en", {}).get("value")
+                if label:
+                    _label_cache[eid] = label
+            while len(_label_cache) > LABEL_CACHE_SIZE:
+                _label_cache.popitem(last=False)
+
+    labels = {}
+    with _label_lock:
+        for i in ids:
+            if i in _label_cache:
+                _label_cache.move_to_end(i)
+                labels[i] = _label_cache[i]
+    return labels
+
+
+def _search_qid(topic):
     params = {
         "action": "wbsearchentities",
         "search": topic,
         "language": "en",
         "format": "json"
     }
-    search_res = requests.get(search_url, params=params)
-    facts = []
-    if search_res.status_code == 200 and search_res.json()["search"]:
-        qid = search_res.json()["search"][0]["id"]
-        entity_url = f"https://www.wikidata.org/wiki/Special:EntityData/{qid}.json"
-        entity_res = requests.get(entity_url)
-        if entity_res.status_code == 200:
-            entity_data = entity_res.json()
-            claims = entity_data["entities"][qid]["claims"]
-            for prop in list(claims.keys())[:5]:  # Limit to 5 facts
-                try:
-                    prop_label_url = f"https://www.wikidata.org/wiki/Special:EntityData/{prop}.json"
-                    prop_label_res = requests.get(prop_label_url)
-                    prop_label = prop_label_res.json()["entities"][prop]["labels"]["en"]["value"]
-
-                    val_id = claims[prop][0]["mainsnak"]["datavalue"]["value"].get("id")
-                    if val_id:
-                        val_url = f"https://www.wikidata.org/wiki/Special:EntityData/{val_id}.json"
-                        val_res = requests.get(val_url)
-                        val_label = val_res.json()["entities"][val_id]["labels"]["en"]["value"]
-                        facts.append(f"{prop_label}: {val_label}")
-                except Exception:
-                    continue
-    return facts
+    search_res = http_client.get(wikidata_api_url(), params=params)
+    if search_res.status_code != 200:
+        raise UpstreamError(f"Wikidata search: HTTP {search_res.status_code}")
+    results = search_res.json().get("search")
+    return results[0]["id"] if results else None
 
-# 🎓 Wikiversity educational resources
-@st.cache_data(show_spinner=False)
-def fetch_wikiversity_resources(topic):
-    api_url = "https://en.wikiversity.org/w/api.php"
+
+def _fetch_claims(qids):
+    """{qid: claims} for up to WIKIDATA_BATCH_SIZE entities in one request."""
     params = {
-        "action": "query",
-        "list": "search",
-        "srsearch": topic,
+        "action": "wbgetentities",
+        "ids": "|".join(qids),
+        "props": "claims",
         "format": "json"
     }
-    response = requests.get(api_url, params=params)
-    links = []
-    if response.status_code == 200:
-        for item in response.json().get("query", {}).get("search", []):
-            title = item["title"]
-            url = f"https://en.wikiversity.org/wiki/{title.replace(' ', '_')}"
-            links.append((title, url))
-    return links
+    entity_res = http_client.get(wikidata_api_url(), params=params)
+    if entity_res.status_code != 200:
+        raise UpstreamError(f"Wikidata entities: HTTP {entity_res.status_code}")
+    entities = entity_res.json().get("entities", {})
+    return {qid: entities.get(qid, {}).get("claims", {}) for qid in qids}
+
+
+def _claim_pairs(claims):
+    pairs = []
+    for prop in list(claims.keys())[:5]:  # Limit to 5 facts
+        try:
+            val_id = claims[prop][0]["mainsnak"]["datavalue"]["value"].get("id")
+        except (KeyError, IndexError, TypeError, AttributeError):
+            continue
+        if val_id:
+            pairs.append((prop, val_id))
+    return pairs
+
+
+def _format_facts(pairs, labels):
+    return [f"{labels[prop]}: {labels[val_id]}" for prop, val_id in pairs if prop in labels and val_id in labels]
+
+
+@cache.cached("wikidata")
+def fetch_wikidata_facts(topic):
+    if _use_local():
+        facts = offline_store.lookup_facts(topic)
+        if facts is not None:
+            return facts
+    if backend() == "local":
+        return []
+    try:
+        qid = _search_qid(topic)
+        return _entity_facts(qid) if qid else []
+    except UpstreamError as e:
+        print("⚠️ Wikidata request failed:", e)
+        return None  # not cached, so the next request tries again
+
+@cache.cached("wikidata_entity")
+def fetch_entity_facts(qid):
+    """Facts for a known Wikidata id (e.g. from topic resolution), without the label search."""
+    if _use_local():
+        facts = offline_store.lookup_entity_facts(qid)
+        if facts is not None:
+            return facts
+    if backend() == "local":
+        return []
+    try:
+        return _entity_facts(qid)
+    except UpstreamError as e:
+        print("⚠️ Wikidata request failed:", e)
+        return None
+
+def _entity_facts(qid):
+    claims = _fetch_claims([qid]).get(qid)
+    if claims is None:
+        return []
+    pairs = _claim_pairs(claims)
+    return _format_facts(pairs, _resolve_labels([i for pair in pairs for i in pair]))
+
+
+def fetch_wikidata_facts_many(topics, executor=None, qids=None):
+    """
+    fetch_wikidata_facts for many topics at once: entity claims are requested up to
+    50 per call and all their property/value labels are resolved together, so a
+    batch costs one search per uncached topic plus a handful of shared requests.
+    Topics with a known Wikidata id in qids skip the search (fetch_entity_facts).
+    Searches run on executor when one is given.
+    """
+    known = {topic: qid for topic, qid in (qids or {}).items() if qid}
+    facts = {}
+    pending = []
+    for topic in dict.fromkeys(topics):
+        source, key = ("wikidata_entity", known[topic]) if topic in known else ("wikidata", topic)
+        cached_facts = cache.get(source, key)
+        if cached_facts is None and _use_local():
+            cached_facts = (offline_store.lookup_entity_facts(key) if topic in known
+                            else offline_store.lookup_facts(topic))
+        if cached_facts is not None:
+            facts[topic] = cached_facts
+        elif backend() == "local":
+            facts[topic] = []
+        else:
+            pending.append(topic)
+
+    # Topics whose requests fail get [] for now but are not cached, so they are retried later
+    search = executor.map if executor else map
+    unknown = [topic for topic in pending if topic not in known]
+    qids = {topic: known[topic] for topic in pending if topic in known}
+    for topic, qid in zip(unknown, search(_search_qid_or_error, unknown)):
+        if isinstance(qid, UpstreamError):
+            facts[topic] = []
+        elif qid is None:
+            facts[topic] = []
+            cache.set("wikidata", topic, [])
+        else:
+            qids[topic] = qid
+
+    unique_qids = list(dict.fromkeys(qids.values()))
+    claims = {}
+    for start in range(0, len(unique_qids), WIKIDATA_BATCH_SIZE):
+        try:
+            claims.update(_fetch_claims(unique_qids[start:start + WIKIDATA_BATCH_SIZE]))
+        except UpstreamError as e:
+            print("⚠️ Wikidata request failed:", e)
+
+    pairs = {topic: _claim_pairs(claims[qid]) for topic, qid in qids.items() if qid in claims}
+    try:
+        labels = _resolve_labels([i for topic_pairs in pairs.values() for pair in topic_pairs for i in pair])
+    except UpstreamError as e:
+        print("⚠️ Wikidata request failed:", e)
+        pairs, labels = {}, {}
+    for topic, qid in qids.items():
+        facts[topic] = _format_facts(pairs.get(topic, []), labels)
+        if topic not in pairs:
+            continue
+        if topic in known:
+            cache.set("wikidata_entity", qid, facts[topic])
+        else:
+            cache.set("wikidata", topic, facts[topic])
+    return facts
+
+
+def _search_qid_or_error(topic):
+    try:
+        return _search_qid(topic)
+    except UpstreamError as e:
+        print("⚠️ Wikidata search failed:", e)
+        return e
+
+# 🎓 Wikiversity educational resources
+@cache.cached("wikiversity")
+def fetch_wikiversity_resources(topic):
+    return _search_resources("wikiversity", topic)
+
+# 📚 Wikibooks + Wikiversity in one ranked query (what the pipeline and bulk jobs use)
+@cache.cached("learning_resources")
+def fetch_learning_resources(topic, k=RESOURCE_LIMIT):
+    """
+    One ranked query over Wikibooks and Wikiversity together, keeping up to k hits
+    from each so the wiki with higher scores can't leave the other empty.
+    Returns dicts (source, title, url, snippet, score), grouped by source, best first.
+    """
+    hits = []
+    if backend() != "live" and search_index.available():
+        hits = search_index.search(topic, k, per_source=True)
+    resources = []
+    for source in search_index.SOURCES:
+        source_hits = [hit for hit in hits if hit["source"] == source]
+        if backend() == "local" or search_index.trusted(source_hits, k):
+            resources += source_hits
+            continue
+        # Only a wiki the index can't answer well is searched live
+        links = _live_search(source, topic, k)
+        if links is None:
+            return None
+        resources += [{"source": source, "title": title, "url": url, "snippet": "", "score": None}
+                      for title, url in links]
+    return resources
+
+
+def resource_links(hits, source):
+    """The (title, url) pairs of fetch_learning_resources hits from one source, best first."""
+    return [(hit["title"], hit["url"]) for hit in hits or [] if hit["source"] == source]
@@ -0,0 +1,289 @@
+"""
+Runs the Gradio app as several worker processes behind a local load balancer.
+
+    python serve.py --workers 4 --port 7860
+
+Each worker is a normal `gradio_app.py` on its own port (7861, 7862, ...). The
+balancer forwards raw TCP connections, so HTTP, server-sent events and websockets
+all pass through untouched. A client always maps to the same worker, because a
+Gradio event spans several requests that must reach the process that queued it.
+By default the balancer tells clients apart with its own affinity cookie, set on
+the first response; --affinity client uses the client address instead (the
+X-Forwarded-For one when the connection comes from a --trusted-proxies address).
+Connections from trusted proxies carry one request each (the balancer asks the
+worker to close after answering), since a proxy reuses its upstream connections
+for different clients. A proxy in front of the balancer must be listed there.
+Connections only go to workers whose /ready endpoint (on their admin port,
+9101, 9102, ...) says they are warm. If a client's worker is down or still
+starting, the connection goes to the next ready one; the session (chat and
+flashcards) is in the shared session store, so a reload restores it. Workers
+that exit are restarted.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+from modules import config
+
+RESTART_DELAY = 2.0  # seconds before a crashed worker is restarted
+CONNECT_TIMEOUT = 2.0
+READY_POLL_INTERVAL = 1.0
+HEAD_TIMEOUT = 10.0  # how long to wait for an HTTP request/response head before forwarding blind
+AFFINITY_COOKIE = "wikimentor_worker"
+
+
+class Supervisor:
+    def __init__(self, count, base_port, admin_port, env):
+        self.ports = [base_port + i for i in range(count)]
+        self.admin_ports = {port: admin_port + i for i, port in enumerate(self.ports)}
+        self.env = env
+        self.processes = {}
+        self.ready = set()
+        self.stopping = False
+
+    def _spawn(self, index, port):
+        # Each worker serves /metrics, /healthz and /ready on its own admin port
+        env = dict(self.env, GRADIO_SERVER_PORT=str(port), WIKIMENTOR_WORKER=str(index),
+                   METRICS_PORT=str(self.admin_ports[port]))
+        self.ready.discard(port)
+        self.processes[port] = subprocess.Popen([sys.executable, "gradio_app.py"], env=env)
+        print(f"🚀 Worker {index} (pid {self.processes[port].pid}) on port {port}")
+
+    def start(self):
+        for index, port in enumerate(self.ports):
+            self._spawn(index, port)
+
+    async def watch(self):
+        while not self.stopping:
+            for index, port in enumerate(self.ports):
+                code = self.processes[port].poll()
+                if code is not None and not self.stopping:
+                    print(f"⚠️ Worker {index} on port {port} exited with {code}; restarting")
+                    await asyncio.sleep(RESTART_DELAY)
+                    self._spawn(index, port)
+            await asyncio.sleep(1)
+
+    async def poll_readiness(self):
+        while not self.stopping:
+            for port in self.ports:
+                ready = await _probe(self.admin_ports[port])
+                if ready and port not in self.ready:
+                    print(f"✅ Worker on port {port} is ready")
+                if ready:
+                    self.ready.add(port)
+                else:
+                    self.ready.discard(port)
+            await asyncio.sleep(READY_POLL_INTERVAL)
+
+    def stop(self):
+        self.stopping = True
+        for process in self.processes.values():
+            process.terminate()
+        deadline = time.monotonic() + 10
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def _probe(admin_port):
+    """True if the worker's /ready endpoint answers 200."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", admin_port), CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(b"GET /ready HTTP/1.0\r\nHost: localhost\r\n\r\n")
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), CONNECT_TIMEOUT)
+        return b" 200 " in status_line
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+def pick_order(key, ports, ready):
+    """
+    Ports to try for a client key (affinity cookie or address): its own worker first,
+    then the others in a stable order, skipping workers that aren't ready (unless none are).
+    """
+    start = int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % len(ports)
+    order = ports[start:] + ports[:start]
+    return [port for port in order if port in ready] or order
+
+
+async def _read_head(reader):
+    """The HTTP head (start line and headers) at the front of a stream; b"" if there isn't one in time."""
+    try:
+        return await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEAD_TIMEOUT)
+    except asyncio.IncompleteReadError as e:
+        return e.partial  # the peer closed early; forward what it sent
+    except (asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+        return b""  # nothing consumed; the bytes are forwarded as they are
+
+
+def _headers(head):
+    headers = {}
+    for line in head.decode("latin-1").split("\r\n")[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            name, value = name.strip().lower(), value.strip()
+            joiner = "; " if name == "cookie" else ", "
+            headers[name] = headers[name] + joiner + value if name in headers else value
+    return headers
+
+
+def _cookie(headers, name):
+    for pair in headers.get("cookie", "").split(";"):
+        key, _, value = pair.strip().partition("=")
+        if key == name and value:
+            return value
+    return None
+
+
+def client_address(peer_ip, headers, trusted_proxies):
+    """
+    The client's address: the peer's, or for connections from a trusted proxy the
+    rightmost X-Forwarded-For entry that isn't one of the proxies (entries further
+    left come from the client and can be forged).
+    """
+    if peer_ip not in trusted_proxies:
+        return peer_ip
+    hops = [hop.strip() for hop in headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+    return peer_ip
+
+
+async def _pipe(reader, writer, head=b""):
+    try:
+        if head:
+            writer.write(head)
+            await writer.drain()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+def _single_request(head, headers):
+    """
+    The request head rewritten with "Connection: close", so the worker closes the
+    connection after answering it. Upgrade requests (websockets) are left alone:
+    the upgraded connection belongs to one client anyway.
+    """
+    if not head.endswith(b"\r\n\r\n") or "upgrade" in headers:
+        return head
+    lines = [line for line in head[:-4].split(b"\r\n")
+             if not line.lower().startswith((b"connection:", b"keep-alive:"))]
+    return b"\r\n".join(lines + [b"Connection: close"]) + b"\r\n\r\n"
+
+
+async def _respond(upstream_reader, client_writer, cookie):
+    """Pipes the worker's responses to the client, adding the affinity cookie to the first one."""
+    head = await _read_head(upstream_reader)
+    if head.endswith(b"\r\n\r\n"):
+        head = head[:-2] + f"Set-Cookie: {AFFINITY_COOKIE}={cookie}; Path=/; HttpOnly; SameSite=Lax\r\n\r\n".encode("latin-1")
+    await _pipe(upstream_reader, client_writer, head)
+
+
+def make_handler(supervisor, affinity="cookie", trusted_proxies=()):
+    async def handle(client_reader, client_writer):
+        peer_ip = (client_writer.get_extra_info("peername") or ("unknown",))[0]
+        # Only the connection's first request is looked at. A browser's later requests on the
+        # same connection are its own, but a proxy reuses connections across clients, so
+        # connections from trusted proxies are closed after one request.
+        head = await _read_head(client_reader)
+        headers = _headers(head)
+        if peer_ip in trusted_proxies:
+            head = _single_request(head, headers)
+        key = new_cookie = None
+        if affinity == "cookie":
+            key = _cookie(headers, AFFINITY_COOKIE)
+            if key is None and head:
+                key = new_cookie = secrets.token_hex(8)
+        key = key or client_address(peer_ip, headers, trusted_proxies)
+        for port in pick_order(key, supervisor.ports, supervisor.ready):
+            try:
+                upstream_reader, upstream_writer = await asyncio.wait_for(
+                    asyncio.open_connection("127.0.0.1", port), CONNECT_TIMEOUT)
+                break
+            except (OSError, asyncio.TimeoutError):
+                continue  # worker down or restarting; fail over to the next one
+        else:
+            client_writer.close()
+            return
+        respond = _respond(upstream_reader, client_writer, new_cookie) if new_cookie else _pipe(upstream_reader, client_writer)
+        await asyncio.gather(_pipe(client_reader, upstream_writer, head), respond)
+    return handle
+
+
+async def run(args):
+    config.load()  # workers get .env through env, so the rate split below sees its value
+    env = dict(os.environ)
+    env["GRADIO_CONCURRENCY"] = str(args.concurrency)
+    # The LLM rate limit is enforced per process, so split the account's budget between workers
+    rate = float(env.get("LLM_RATE_PER_MINUTE", "30"))
+    if rate > 0:
+        env["LLM_RATE_PER_MINUTE"] = str(rate / args.workers)
+    # Workers keep their in-memory cache copies briefly so refreshed entries propagate
+    env.setdefault("WIKIMENTOR_CACHE_MEMORY_TTL", "300")
+
+    supervisor = Supervisor(args.workers, args.worker_port, args.admin_port, env)
+    supervisor.start()
+    trusted_proxies = {proxy.strip() for proxy in args.trusted_proxies.split(",") if proxy.strip()}
+    server = await asyncio.start_server(make_handler(supervisor, args.affinity, trusted_proxies), args.host, args.port)
+    print(f"⚖️ Load balancer on http://{args.host}:{args.port} -> {len(supervisor.ports)} workers ({args.affinity} affinity)")
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    tasks = [asyncio.create_task(supervisor.watch()), asyncio.create_task(supervisor.poll_readiness())]
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        supervisor.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve WikiMentor from several worker processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7860, help="public port of the load balancer")
+    parser.add_argument("--worker-port", type=int, default=7861, help="first worker port; workers use consecutive ports")
+    parser.add_argument("--admin-port", type=int, default=int(config.get("METRICS_PORT", "0")) or 9101,
+                        help="first worker admin port (/metrics, /healthz, /ready)")
+    parser.add_argument("--concurrency", type=int, default=int(config.get("GRADIO_CONCURRENCY", "8")),
+                        help="Gradio events each worker runs at once")
+    parser.add_argument("--affinity", choices=("cookie", "client"), default=config.get("SERVE_AFFINITY", "cookie"),
+                        help="keep a client on one worker by affinity cookie, or by client address")
+    parser.add_argument("--trusted-proxies", default=config.get("SERVE_TRUSTED_PROXIES", ""),
+                        help="comma-separated proxy addresses whose X-Forwarded-For header is believed")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
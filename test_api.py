@@ -1,14 +1,33 @@
-import requests
-import os
-from dotenv import load_dotenv
+"""
+Checks each configured LLM provider directly, without routing, hedging or caching:
+sends one short prompt and prints the status, latency and reply.
 
-load_dotenv()
-HF_TOKEN = os.getenv("HF_TOKEN")
+    python test_api.py               # every provider enabled in LLM_PROVIDERS
+    python test_api.py huggingface   # only the named ones
+"""
+import sys
+import time
+
+from modules import llm_providers
 
-endpoint = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.1"
-headers = {"Authorization": f"Bearer {HF_TOKEN}"}
 prompt = "Explain photosynthesis in 1 paragraph."
 
-response = requests.post(endpoint, headers=headers, json={"inputs": prompt})
-print("Status:", response.status_code)
-print("Body:", response.text)
+
+def main(names):
+    providers = [p for p in llm_providers.get_router().providers if not names or p.name in names]
+    if not providers:
+        print("No matching provider is configured. Set its *_API_KEY (or LOCAL_LLM_URL) and LLM_PROVIDERS.")
+        return 1
+    failed = 0
+    for provider in providers:
+        start = time.perf_counter()
+        text, error = provider.complete({"messages": [{"role": "user", "content": prompt}]}, retries=0)
+        print(f"\n{provider.name} ({provider.model}) at {provider.url}: {time.perf_counter() - start:.2f}s")
+        print("Status:", "ok" if error is None else "failed")
+        print("Body:", text if error is None else error[0])
+        failed += error is not None
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,31 @@
+import pytest
+
+from modules import search_index, sqlite_db, wiki_fetcher
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setenv("WIKIMENTOR_SEARCH_DB", str(tmp_path / "search.sqlite3"))
+    monkeypatch.setenv("WIKIMENTOR_CACHE", "off")
+    monkeypatch.setattr(search_index, "_connection", sqlite_db.LocalConnection(
+        search_index.db_path, search_index._SCHEMA, timeout=30, isolation_level=""))
+    # Wikibooks titles match the topic exactly and outscore every Wikiversity page
+    search_index.add_documents([("wikibooks", f"Photosynthesis {n}", "photosynthesis") for n in range(12)]
+                               + [("wikiversity", "Plant biology", "photosynthesis in plants"),
+                                  ("wikiversity", "Light and life", "how photosynthesis works")])
+
+
+def test_search_per_source_keeps_each_sources_top_k(index):
+    hits = search_index.search("photosynthesis", 3, per_source=True)
+    assert [hit["source"] for hit in hits].count("wikibooks") == 3
+    assert [hit["source"] for hit in hits].count("wikiversity") == 2
+
+
+def test_lower_scoring_wiki_still_gets_resources(index, monkeypatch):
+    monkeypatch.setenv("WIKI_BACKEND", "local")
+    hits = wiki_fetcher.fetch_learning_resources("photosynthesis", 3)
+    assert len(wiki_fetcher.resource_links(hits, "wikibooks")) == 3
+    assert wiki_fetcher.resource_links(hits, "wikiversity") == [
+        ("Plant biology", search_index.page_url("wikiversity", "Plant biology")),
+        ("Light and life", search_index.page_url("wikiversity", "Light and life")),
+    ]
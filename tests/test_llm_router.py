@@ -0,0 +1,57 @@
+import json
+import time
+
+import pytest
+
+from modules import http_client, llm_providers
+
+ANSWER = "Light becomes sugar."
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = "" if status_code == 200 else "overloaded"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def json(self):
+        return {"choices": [{"message": {"content": ANSWER}}]}
+
+    def iter_lines(self, decode_unicode=False):
+        yield "data: " + json.dumps({"choices": [{"delta": {"content": ANSWER}}]})
+        yield "data: [DONE]"
+
+
+class _Provider(llm_providers.Provider):
+    """Answers (or fails with a 503) after `delay` seconds, with a 0.5 s timeout."""
+
+    def __init__(self, name, delay, status_code=200):
+        super().__init__(name, f"http://{name}.invalid", "test-model")
+        self.read_timeout = 0.4
+        self.delay = delay
+        self.status_code = status_code
+
+    def post(self, payload, stream=False, retries=None):
+        time.sleep(self.delay)
+        return _Response(self.status_code)
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(http_client, "timeouts", lambda: (0.1, 15.0))
+    # The primary fails after most of its timeout; the fallback needs most of its own
+    return llm_providers.Router([_Provider("primary", 0.3, status_code=503), _Provider("fallback", 0.35)],
+                                hedge_after=5.0)
+
+
+def test_failover_gets_its_own_deadline_on_complete(router):
+    assert router.complete({"messages": []}) == ANSWER
+
+
+def test_failover_gets_its_own_deadline_on_stream(router):
+    assert "".join(router.stream({"messages": []})) == ANSWER
@@ -0,0 +1,63 @@
+import pytest
+
+from modules import ai_engine, cache, llm_providers, semantic_cache
+from modules.conversation import Conversation
+
+PARTIAL = "Photosynthesis is the process by"
+
+
+class _Router:
+    def __init__(self, fail):
+        self.fail = fail
+
+    def stream(self, payload):
+        yield PARTIAL
+        if self.fail:
+            raise llm_providers.LLMUnavailable("connection reset")
+        yield " which plants turn light into sugar."
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "_backend", cache.SQLiteBackend(str(tmp_path / "cache.sqlite3")))
+    cache.clear_memory()
+    monkeypatch.setattr(ai_engine, "_question_passages", lambda query: ())
+    monkeypatch.setattr(ai_engine, "_semantic_lookup", lambda query: None)
+    monkeypatch.setattr(ai_engine, "_semantic_add", lambda query, reply: None)
+
+    def use(fail):
+        monkeypatch.setattr(llm_providers, "get_router", lambda: _Router(fail))
+    yield use
+    cache.clear_memory()
+
+
+def test_failed_stream_is_shown_but_not_cached(llm):
+    llm(fail=True)
+    reply = "".join(ai_engine.mentor_chat_stream("explain photosynthesis"))
+    assert reply.startswith(PARTIAL) and "⚠️" in reply
+    assert cache.get("mentor", "explain photosynthesis") is None
+
+
+def test_failed_stream_is_not_added_to_the_conversation(llm):
+    llm(fail=True)
+    conversation = Conversation("Photosynthesis", "summary")
+    "".join(ai_engine.mentor_chat_stream("how do plants make sugar?", conversation))
+    assert conversation.turns == []
+
+
+def test_complete_stream_is_cached_and_added(llm):
+    llm(fail=False)
+    conversation = Conversation()
+    reply = "".join(ai_engine.mentor_chat_stream("explain photosynthesis", conversation))
+    assert cache.get("mentor", "explain photosynthesis") == reply
+    assert conversation.turns == [["explain photosynthesis", reply]]
+
+
+@pytest.mark.parametrize("fail", [True, False])
+def test_only_complete_streams_reach_the_semantic_cache(llm, tmp_path, monkeypatch, fail):
+    isolated = semantic_cache.SemanticCache(path=str(tmp_path / "semantic.npz"), capacity=16)
+    monkeypatch.setattr(semantic_cache, "_cache", isolated)
+    monkeypatch.setattr(ai_engine, "_semantic_add", semantic_cache.add)
+    llm(fail=fail)
+    reply = "".join(ai_engine.mentor_chat_stream("what is photosynthesis"))
+    assert semantic_cache.lookup("explain photosynthesis") == (None if fail else reply)
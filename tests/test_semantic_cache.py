@@ -0,0 +1,57 @@
+import pytest
+
+from modules.semantic_cache import SemanticCache, embed
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(path=str(tmp_path / "semantic_cache.npz"), capacity=16)
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("explain the main causes of world war 1 in europe", "explain the main causes of world war 2 in europe"),
+    ("history of the 1918 flu pandemic in europe", "history of the 1957 flu pandemic in europe"),
+])
+def test_one_changed_number_is_a_miss(cache, cached, asked):
+    # Close enough to pass the similarity threshold on their own...
+    assert float(embed(cached) @ embed(asked)) >= cache.threshold
+    cache.add(cached, "first answer")
+    # ...but they ask different questions
+    assert cache.lookup(asked)[0] is None
+
+
+@pytest.mark.parametrize("asked", ["What is photosynthesis?", "explain photosynthesis", "photosynthesis",
+                                   "how does photosynthesis work"])
+def test_rephrasings_hit(cache, asked):
+    cache.add("what is photosynthesis", "answer")
+    assert cache.lookup(asked)[0] == "answer"
+
+
+def test_paraphrase_with_one_more_content_word_hits(cache):
+    cache.add("what is photosynthesis", "answer")
+    assert cache.lookup("what is photosynthesis in plants")[0] == "answer"
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("photosynthesis in plants", "photosynthesis in animals"),
+    ("what is dna", "what is dna replication"),
+])
+def test_different_questions_miss(cache, cached, asked):
+    cache.add(cached, "answer")
+    assert cache.lookup(asked)[0] is None
+
+
+def test_closest_matching_entry_wins(cache):
+    cache.add("causes of world war 1", "ww1")
+    cache.add("causes of world war 2", "ww2")
+    assert cache.lookup("explain the causes of world war 2")[0] == "ww2"
+
+
+def test_terms_survive_a_reload(tmp_path):
+    path = str(tmp_path / "semantic_cache.npz")
+    first = SemanticCache(path=path, capacity=16)
+    first.add("causes of world war 1", "ww1")
+    first.save()
+    reloaded = SemanticCache(path=path, capacity=16)
+    assert reloaded.lookup("causes of world war 1")[0] == "ww1"
+    assert reloaded.lookup("causes of world war 2")[0] is None
@@ -0,0 +1,169 @@
+"""
+Pre-computes the Learn-a-Topic results for popular subjects so learners get
+cache hits instead of multi-second cold loads.
+
+Examples:
+    python warm_cache.py --topics curriculum.txt
+    python warm_cache.py --from-trace-log traces.jsonl --top 200 --concurrency 8
+    python warm_cache.py --topics curriculum.txt --refresh --older-than 3
+
+Topics files have one topic per line; blank lines and lines starting with "#"
+are ignored. Finished topics are appended to a state file, so an interrupted
+run picks up where it stopped. --refresh re-runs topics whose cached entries
+are older than --older-than days and overwrites them.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules import cache, http_client
+from modules.bulk import dedupe, read_topics
+from modules.pipeline import learn_topic
+
+DAY = 24 * 60 * 60
+STATE_PATH = os.path.join(".cache", "warm_cache_state.jsonl")
+DEFAULT_HOST_RATE = 5.0  # requests per second per upstream host
+
+
+def top_topics(trace_path, n):
+    """Most requested topics in a WIKIMENTOR_TRACE_LOG file."""
+    counts = Counter()
+    with open(trace_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            for span in record.get("spans", []):
+                if span.get("name") == "event" and span.get("topic"):
+                    counts[span["topic"].strip()] += 1
+    # Variants such as "python" and "Python" count towards one topic
+    merged = Counter()
+    spelling = {}
+    for topic, count in counts.most_common():
+        key = cache.normalize_key(topic)
+        spelling.setdefault(key, topic)
+        merged[key] += count
+    return [spelling[key] for key, _ in merged.most_common(n)]
+
+
+def load_state(path):
+    """normalized topic -> time of its last successful warm-up"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if entry.get("status") == "ok":
+                done[cache.normalize_key(entry["topic"])] = entry["at"]
+    return done
+
+
+def warm(topic, max_age):
+    start = time.perf_counter()
+    try:
+        if max_age is None:
+            result = learn_topic(topic)
+        else:
+            with cache.max_age(max_age):
+                result = learn_topic(topic)
+    except Exception as e:
+        return "failed", str(e), time.perf_counter() - start
+    if not result["summary"]:
+        return "failed", "no summary", time.perf_counter() - start
+    detail = f"{len(result['flashcards'])} cards, {len(result['books']) + len(result['resources'])} resources"
+    return "ok", detail, time.perf_counter() - start
+
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the WikiMentor response cache for a list of topics.")
+    parser.add_argument("--topics", action="append", default=[], help="file with one topic per line (repeatable)")
+    parser.add_argument("--from-trace-log", help="pick the most requested topics from a trace log")
+    parser.add_argument("--top", type=int, default=100, help="how many topics to take from --from-trace-log")
+    parser.add_argument("--concurrency", type=int, default=4, help="topics processed at once")
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_HOST_RATE,
+                        help="requests per second per upstream host (0 for no limit)")
+    parser.add_argument("--host-rate", default="",
+                        help="per-host overrides, e.g. www.wikidata.org=2,en.wikipedia.org=10")
+    parser.add_argument("--refresh", action="store_true", help="re-run topics whose cached entries are stale")
+    parser.add_argument("--older-than", type=float, default=3.0, help="days after which --refresh treats entries as stale")
+    parser.add_argument("--state", default=STATE_PATH, help="progress file used to resume interrupted runs")
+    parser.add_argument("--restart", action="store_true", help="ignore the progress file and start over")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own log output")
+    args = parser.parse_args()
+
+    topics = []
+    for path in args.topics:
+        topics += read_topics(path)
+    if args.from_trace_log:
+        topics += top_topics(args.from_trace_log, args.top)
+    topics = dedupe(topics)
+    if not topics:
+        parser.error("no topics given; use --topics and/or --from-trace-log")
+
+    http_client.set_rate_limit("*", args.rate_limit)
+    for host, rate in http_client.parse_rate_limits(args.host_rate).items():
+        http_client.set_rate_limit(host, rate)
+
+    max_age = args.older_than * DAY if args.refresh else None
+    done = {} if args.restart else load_state(args.state)
+    # Without --refresh any finished topic is skipped; with it, only recently refreshed ones are
+    cutoff = time.time() - max_age if max_age is not None else float("-inf")
+    pending = [t for t in topics if cache.normalize_key(t) not in done or done[cache.normalize_key(t)] < cutoff]
+    skipped = len(topics) - len(pending)
+    print(f"🔥 Warming {len(pending)} topics ({skipped} already done) with concurrency {args.concurrency}",
+          file=sys.stderr)
+
+    directory = os.path.dirname(args.state)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    counts = Counter()
+    with contextlib.ExitStack() as quiet, open(args.state, "a", encoding="utf-8") as state, \
+            ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="warm") as pool:
+        # Progress goes to stderr; the pipeline's per-request prints are hidden unless --verbose
+        if not args.verbose:
+            quiet.enter_context(contextlib.redirect_stdout(quiet.enter_context(open(os.devnull, "w"))))
+        futures = {pool.submit(warm, topic, max_age): topic for topic in pending}
+        try:
+            for n, future in enumerate(as_completed(futures), 1):
+                topic = futures[future]
+                status, detail, seconds = future.result()
+                counts[status] += 1
+                state.write(json.dumps({"topic": topic, "status": status, "detail": detail, "at": time.time()},
+                                       ensure_ascii=False) + "\n")
+                state.flush()
+                elapsed = time.perf_counter() - start
+                eta = elapsed / n * (len(pending) - n)
+                icon = "✅" if status == "ok" else "⚠️"
+                print(f"[{n}/{len(pending)}] {icon} {topic}: {detail} in {seconds:.1f}s · ETA {_format_eta(eta)}",
+                      file=sys.stderr)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            print("⏸️ Interrupted; run the same command again to resume.", file=sys.stderr)
+            raise SystemExit(130)
+
+    elapsed = time.perf_counter() - start
+    print(f"🏁 {counts['ok']} warmed, {counts['failed']} failed, {skipped} skipped in {_format_eta(elapsed)}",
+          file=sys.stderr)
+    cache.evict()
+
+
+if __name__ == "__main__":
+    main()